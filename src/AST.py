@@ -4,8 +4,14 @@ from Error import DetailedError
 
 # Base Node
 class ASTNode:
-    """Base class for all AST nodes."""
-    pass
+    """
+    Base class for all AST nodes.
+
+    Every node class declares its attributes in `__slots__`: the nodes have no `__dict__`, which makes them much smaller
+    (a dialogue-heavy script creates hundreds of thousands of StringNode and DialogueNode) and their attributes faster to read.
+    A subclass must list the attributes set by its `__init__` in its own `__slots__`.
+    """
+    __slots__ = ()
 
 class LabelNode(ASTNode):
     """
@@ -15,6 +21,8 @@ class LabelNode(ASTNode):
         label_name: The identifier of the label (e.g., 'start').
         body: List of AST nodes representing the statements inside the label.
     """
+    __slots__ = ('label_name', 'body')
+
     def __init__(self, label, body=None):
         self.label_name = label              
         self.body = body or []               
@@ -60,6 +68,8 @@ class DefineNode(ASTNode):
         id: The identifier being defined.
         value: The value assigned to the identifier.
     """
+    __slots__ = ('id', 'value')
+
     def __init__(self, id, value):
         self.id = id 
         self.value = value
@@ -84,6 +94,8 @@ class ImageNode(ASTNode):
         path: Optional explicit path to the image file.
         user_var: Optional variable referencing the image path.
     """
+    __slots__ = ('image_expression', 'path', 'user_var')
+
     def __init__(self, image_expression, string_path = None, user_var = None):
         self.image_expression = image_expression  # [img_name, tag1, tag2, ...]
         self.path = string_path or None
@@ -121,6 +133,8 @@ class SceneNode(ASTNode):
         transform: Optional transform applied to the image (e.g., 'left', 'right').
         transition: Optional transition effect applied to the image (e.g., 'fade').
     """
+    __slots__ = ('image_expression', 'transform', 'layer', 'transition')
+
     def __init__(self, image_expression=None, transform=None, layer=None, transition=None):
         self.image_expression = image_expression or []  # [img_name, tag1, tag2, ...]
         self.transform = transform
@@ -187,6 +201,8 @@ class ShowNode(ASTNode):
         transform: Optional transform applied to the image (e.g., 'left', 'right').
         transition: Optional transition effect applied to the image (e.g., 'fade').
     """
+    __slots__ = ('image_expression', 'transform', 'layer', 'transition')
+
     def __init__(self, image_expression=None, transform=None, layer=None, transition=None):
         self.image_expression = image_expression or []  # [img_name, tag1, tag2, ...]
         self.transform = transform
@@ -252,6 +268,8 @@ class HideNode(ASTNode):
         layer: Optional additional layer.
         transition: Optional transition effect (e.g., 'fade', 'dissolve').
     """
+    __slots__ = ('image_expression', 'layer', 'transition')
+
     def __init__(self, image_expression=None, layer=None, transition=None):
         self.image_expression = image_expression or []  
         self.layer = layer
@@ -291,6 +309,7 @@ class KeywordNode(ASTNode):
     Attribute:
         value: The keyword string (e.g., 'start').
     """
+    __slots__ = ('value',)
 
     def __init__(self, value):
         self.value = value
@@ -311,6 +330,8 @@ class TransformNode(ASTNode):
     Attribute:
         transform_name: The name of the transform (e.g., 'left', 'center').
     """
+    __slots__ = ('transform_name',)
+
     def __init__(self, transform_name):
         self.transform_name = transform_name
 
@@ -332,6 +353,8 @@ class FunctionCallNode(ASTNode):
         args: Positional arguments for the function call (list of ASTNodes).
         kwargs: Keyword arguments for the function call (list of ASTNode).
     """
+    __slots__ = ('name', 'args', 'kwargs')
+
     def __init__(self, name, args=None, kwargs=None):
         self.name = name
         self.args = args if args else []
@@ -415,12 +438,11 @@ class AssignNode(ASTNode):
         LHS: The left-hand side of the assignment.
         RHS: The right-hand side of the assignment.
     """
+    __slots__ = ('LHS', 'RHS')
+
     def __init__(self, LHS, RHS):
         self.LHS = LHS
         self.RHS = RHS
-
-    def __getattribute__(self, name):
-        return super().__getattribute__(name)
     
     def __repr__(self, indent=2):
         """Return a readable string representation of the AssignNode."""
@@ -438,13 +460,12 @@ class DialogueNode(ASTNode):
         speaker: The character or speaker of the dialogue (can be None for narration).
         text: The string content of the dialogue.
     """
+    __slots__ = ('speaker', 'text')
+
     def __init__(self, speaker, text):
         self.speaker = speaker  # Can be a UserNode, or a function call node (Character)
         self.text = text        # StringNode
         
-    def __getattribute__(self, name):
-        return super().__getattribute__(name)
-
     def __repr__(self, indent=2):
         """Return a readable string representation of the DialogueNode."""
         indent_str = ' ' * indent
@@ -463,6 +484,8 @@ class PlayNode(ASTNode):
         fadein: Optional fade-in duration in seconds.
         loop: Whether the audio should loop continuously.
     """
+    __slots__ = ('audio_type', 'audio_file', 'fadein', 'loop')
+
     def __init__(self, audio_type, audio_file, fadein=None, loop=False):
         self.audio_type = audio_type      # 'music', 'sound', 'voice'
         self.audio_file = audio_file      
@@ -496,6 +519,8 @@ class StopNode(ASTNode):
         audio_type: Type of audio to stop ('music', 'sound', or 'voice').
         fadeout: Optional fade-out duration in seconds.
     """
+    __slots__ = ('audio_type', 'fadeout')
+
     def __init__(self, audio_type=None, fadeout=None):
         self.audio_type = audio_type  # 'music', 'sound', 'voice' or neither of these
         self.fadeout = fadeout        # float or None
@@ -518,6 +543,8 @@ class ReturnNode(ASTNode):
     Attributes:
         value: Optional value or expression being returned.
     """
+    __slots__ = ('value',)
+
     def __init__(self, value=None):
         self.value = value  # None or UserNode
 
@@ -541,6 +568,8 @@ class JumpNode(ASTNode):
     Attributes:
         label_name: The target label to jump to
     """
+    __slots__ = ('label_name',)
+
     def __init__(self, label_name):
         self.label_name = label_name  # USER token or IdentifierNode
 
@@ -564,6 +593,8 @@ class TransitionNode(ASTNode):
     Attributes:
         transition_name: The name of the transition (e.g., 'fade').
     """
+    __slots__ = ('transition',)
+
     def __init__(self, transition_name):
         self.transition = transition_name 
 
@@ -583,6 +614,8 @@ class LayerNode(ASTNode):
     Attributes:
         layer_name: The name of the layer where content is shown.
     """
+    __slots__ = ('layer_name',)
+
     def __init__(self, layer_name):
         self.layer_name = layer_name  
 
@@ -600,10 +633,14 @@ class StringNode(ASTNode):
     Custom AST node used to store information regarding a StringNode in Renpy.
 
     Attributes:
-        value: The string value.
+        value: The string value (the string of the intern pool of the compilation, see Intern.py).
+        value_id: Id of the string value inside the intern pool (None if the node was not built from a token).
     """
-    def __init__(self, value):
+    __slots__ = ('value', 'value_id')
+
+    def __init__(self, value, value_id=None):
         self.value = value
+        self.value_id = value_id
 
     def __repr__(self, indent=0):
         """Return a readable string representation of the StringNode."""
@@ -615,19 +652,25 @@ class UserNode(ASTNode):
     Custom AST node used to store information regarding a user variable in Renpy.
 
     Attributes:
-        name: The name of the identifier.
+        name: The name of the identifier (the string of the intern pool of the compilation, see Intern.py).
+        name_id: Id of the name inside the intern pool (None if the node was not built from a token).
     """
-    def __init__(self, name):
+    __slots__ = ('name', 'name_id')
+
+    def __init__(self, name, name_id=None):
         self.name = name
+        self.name_id = name_id
 
     def __iter__(self):
         """Allow iteration over the node's children."""
         return iter(self.name)
     
     def __eq__(self, other):
-        """Check equality with another UserNode based on the 'name' attribute."""
+        """Check equality with another UserNode based on the id of the 'name' attribute (an integer comparison), or on the name if a node has no id."""
         if isinstance(other, UserNode):
-            return self.name == other.name
+            if self.name_id is None or other.name_id is None:
+                return self.name == other.name
+            return self.name_id == other.name_id
         return False
     
     def __hash__(self):
@@ -649,6 +692,8 @@ class MasterNode(ASTNode):
     Attributes:
         children: A list of all the nodes found in the renpy script.
     """
+    __slots__ = ('children',)
+
     def __init__(self, children=None):
         self.children = children or []
 
@@ -671,10 +716,28 @@ class MasterNode(ASTNode):
         )
         return f"MasterNode(\n{inner}\n)"
 
-
-
-
-
-
-
-
+def intern_tree(node, pool):
+    """
+    Gives the names of the UserNode and the values of the StringNode of a tree the string and the id of the intern pool
+    `pool`, in place (e.g., the nodes parsed by a worker process with its own pool, see Project.py).
+
+    Args:
+        node (ASTNode): The root of the tree (e.g., a MasterNode).
+        pool (InternPool): The intern pool of the compilation (see Intern.py).
+
+    Returns:
+        None
+    """
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, UserNode):
+            value.name_id = pool.intern(value.name)
+            value.name = pool.strings[value.name_id]
+        elif isinstance(value, StringNode):
+            value.value_id = pool.intern(value.value)
+            value.value = pool.strings[value.value_id]
+        elif isinstance(value, ASTNode):
+            stack.extend(getattr(value, name, None) for name in type(value).__slots__)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
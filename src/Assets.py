@@ -0,0 +1,175 @@
+# Module that contains the caches of the assets (images and sounds) loaded by the visual novel (see StateMachine in visualnovel.py)
+from collections import OrderedDict
+import pygame
+from defs import IMAGE_CACHE_BUDGET, SOUND_CACHE_BUDGET
+
+def surface_bytes(surface):
+    """
+    Returns the memory used by the pixels of a surface.
+
+    Args:
+        surface (pygame.Surface): The surface.
+
+    Returns:
+        int: The number of bytes of the pixels buffer.
+    """
+    return surface.get_pitch() * surface.get_height()
+
+def sound_bytes(sound):
+    """
+    Returns the memory used by the samples of a decoded sound.
+
+    Args:
+        sound (pygame.mixer.Sound): The sound (the mixer must be initialised).
+
+    Returns:
+        int: The number of bytes of the samples (in the format of the mixer).
+    """
+    frequency, size, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * frequency) * channels * (abs(size) // 8)
+
+class ImageCache():
+    """
+    LRU cache of the images of a visual novel, with a budget in bytes.
+
+    Keys are (resolved path, target size, transform) tuples: the decoded image is stored under (path, None, None)
+    and each scaled variant under its own key, so an image shown many times is decoded and scaled only once.
+    When the budget is exceeded, the least recently used images are evicted (they stay alive as long as a state uses them).
+
+    Attributes:
+        budget: Maximum number of bytes of pixels kept by the cache.
+        size: Number of bytes of pixels currently kept by the cache.
+        hits: Number of lookups that found their image.
+        misses: Number of lookups that did not find their image.
+        evictions: Number of images evicted to respect the budget.
+    """
+    def __init__(self, budget=IMAGE_CACHE_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict() # key -> (surface, nb bytes), least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        """Return True if an image is cached under `key` (does not count as a lookup)."""
+        return key in self.entries
+
+    def __len__(self):
+        """Return the number of cached images."""
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Description
+        -----------
+        Finds a cached image and marks it as the most recently used.
+
+        Arguments
+        ---------
+        key : (resolved path, target size, transform) tuple.
+
+        Returns
+        -------
+        pygame.Surface or None: The image, or None if it is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, surface):
+        """
+        Description
+        -----------
+        Caches an image, then evicts the least recently used images until the budget is respected.
+        An image bigger than the whole budget is not cached.
+
+        Arguments
+        ---------
+        key : (resolved path, target size, transform) tuple.
+        surface : The image.
+
+        Returns
+        -------
+        pygame.Surface: The image (to chain with the loading code).
+        """
+        nb_bytes = self.item_bytes(surface)
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        if nb_bytes > self.capacity():
+            return surface
+        self.entries[key] = (surface, nb_bytes)
+        self.size += nb_bytes
+        self.evict()
+        return surface
+
+    def capacity(self):
+        """Return the number of bytes the cached items can use."""
+        return self.budget
+
+    def evict(self):
+        """Evict the least recently used items until the cached items fit in the capacity of the cache."""
+        capacity = self.capacity()
+        while self.size > capacity and self.entries:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.size -= evicted_bytes
+            self.evictions += 1
+
+    def item_bytes(self, surface):
+        """Return the number of bytes counted in the budget for a cached image."""
+        return surface_bytes(surface)
+
+    def clear(self):
+        """Remove every cached image (the counters are kept)."""
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """Return the counters of the cache (dict with 'entries' (number of cached items), 'bytes', 'budget', 'hits', 'misses' and 'evictions')."""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+class SoundCache(ImageCache):
+    """
+    LRU cache of the decoded sounds and voices of a visual novel, with a budget in bytes (see ImageCache).
+
+    Keys are resolved paths: a sound played several times (or played again after a rollback) is decoded only once.
+    The decoded musics playing are not cached, but their bytes are counted in the budget (see `reserve`), so the
+    sounds and the musics together stay within SOUND_CACHE_BUDGET.
+
+    Attributes:
+        reserved: Number of bytes of the budget used by the musics (see Audio.MusicScheduler.held_bytes).
+    """
+    def __init__(self, budget=SOUND_CACHE_BUDGET):
+        super().__init__(budget)
+        self.reserved = 0
+
+    def capacity(self):
+        """Return the number of bytes the cached sounds can use (the budget minus the bytes of the musics)."""
+        return max(self.budget - self.reserved, 0)
+
+    def reserve(self, nb_bytes):
+        """Count `nb_bytes` of musics in the budget, evicting the least recently used sounds if needed."""
+        if nb_bytes != self.reserved:
+            self.reserved = nb_bytes
+            self.evict()
+
+    def stats(self):
+        """Return the counters of the cache (see ImageCache.stats), with the bytes of the musics ('reserved')."""
+        stats = super().stats()
+        stats['reserved'] = self.reserved
+        return stats
+
+    def item_bytes(self, sound):
+        """Return the number of bytes counted in the budget for a cached sound."""
+        return sound_bytes(sound)
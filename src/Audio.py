@@ -0,0 +1,205 @@
+# Module that plays the audio of the visual novel (music, sounds and voices) on dedicated mixer channels
+# (see StateMachine.handle_state_audio in visualnovel.py)
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from Assets import SoundCache, sound_bytes
+from Prefetch import decode_sound
+
+CHANNELS = ('voice', 'sound') # Mixer channels reserved for each type of audio, in this order (followed by the channels of the music)
+MUSIC_CHANNELS = 2 # The current track and the next one (crossfade)
+MUSIC_VOLUME = 0.1 # 10% of the maximum volume
+MUSIC_CROSSFADE = 0.5 # Seconds during which the current track fades out when a new track starts without fadein
+
+class MusicScheduler():
+    """
+    Plays the music on two reserved mixer channels, so that a new track crossfades with the current one: the current track
+    fades out (like 'stop music fadeout X') while the new track fades in (the 'fadein' of the 'play music' statement).
+
+    The tracks are decoded by worker threads (see Prefetch.py: the next 'play music' of the upcoming states is decoded in
+    advance, or `decode` when the prefetching is disabled). A track that is not decoded yet when its state is displayed
+    is started by `update`, called at each frame, as soon as it is ready: the main loop never waits for a music.
+
+    A decoded track is a whole PCM buffer (about 10 MB per minute): the bytes of the tracks on the channels are counted
+    in the budget of the SoundCache (see `update`).
+
+    Attributes:
+        cache: The SoundCache whose budget counts the tracks playing.
+        channels: The two channels of the music (empty until AudioManager.open is called).
+        current: Index in `channels` of the channel playing the current track.
+        pending: (path, future of the decoded track, loop, fadein in ms) of the track waiting for its decoding, or None.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.channels = []
+        self.current = 0
+        self.pending = None
+        self.decoder = None # Thread decoding the tracks that are not prefetched (created by the first call of decode)
+
+    def decode(self, path):
+        """Return the future of a track decoded by the thread of the scheduler (used when the prefetching is disabled)."""
+        if self.decoder is None:
+            self.decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='music')
+        return self.decoder.submit(decode_sound, path)
+
+    def play(self, path, track, loop=False, fadein=None):
+        """
+        Description
+        -----------
+        Schedules a new track: it is started at once if it is already decoded, otherwise by `update`.
+
+        Arguments
+        ---------
+        path : The resolved path of the track (returned by `update` if it cannot be decoded).
+        track : concurrent.futures.Future of the decoded track (pygame.mixer.Sound).
+        loop (optional) : If True, the track is played in loops.
+        fadein (optional) : Duration of the fadein in seconds (None: no fadein).
+
+        Returns
+        -------
+        str or None: The path of the track if it could not be decoded, None otherwise.
+        """
+        self.pending = (path, track, loop, int(float(fadein) * 1000) if fadein else 0)
+        return self.update()
+
+    def update(self):
+        """
+        Description
+        -----------
+        Starts the pending track if it is decoded (never waits): the new track fades in on the free channel while the
+        current track fades out during the fadein (or MUSIC_CROSSFADE seconds if there is no fadein). Then counts the
+        tracks on the channels in the budget of the SoundCache.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        str or None: The path of the pending track if it could not be decoded, None otherwise.
+        """
+        failed_path = self.start_pending()
+        self.cache.reserve(self.held_bytes())
+        return failed_path
+
+    def start_pending(self):
+        """Start the pending track if it is decoded (see `update`), and return its path if it could not be decoded."""
+        if self.pending is None or not self.pending[1].done():
+            return None
+        path, track, loop, fadein_ms = self.pending
+        self.pending = None
+        try:
+            sound = track.result()
+        except Exception:
+            # HANDLING: The error is reported by the caller (see StateMachine.update_music)
+            return path
+        previous_channel = self.channels[self.current]
+        if previous_channel.get_busy():
+            previous_channel.fadeout(fadein_ms or int(MUSIC_CROSSFADE * 1000))
+        self.current = (self.current + 1) % len(self.channels)
+        sound.set_volume(MUSIC_VOLUME) # The decoded track is only used by the music channels
+        self.channels[self.current].play(sound, loops=-1 if loop else 0, fade_ms=fadein_ms)
+        return None
+
+    def held_bytes(self):
+        """Return the number of bytes of the decoded tracks on the channels of the music."""
+        sounds = [channel.get_sound() for channel in self.channels]
+        return sum(sound_bytes(sound) for sound in sounds if sound is not None)
+
+    def close(self):
+        """Stop the thread decoding the tracks (the tracks waiting for it are cancelled)."""
+        if self.decoder is not None:
+            self.decoder.shutdown(wait=False, cancel_futures=True)
+            self.decoder = None
+
+    def stop(self, fadeout_ms=0):
+        """Stop the music (with a fadeout in milliseconds, 0: at once), and forget the pending track."""
+        self.pending = None
+        for channel in self.channels:
+            if fadeout_ms > 0:
+                channel.fadeout(fadeout_ms)
+            else:
+                channel.stop()
+
+class AudioManager():
+    """
+    Plays and stops the audio of the visual novel.
+
+    The decoded sounds and voices are kept in a SoundCache, so a sound is decoded once, however many times it is played.
+    Each type of audio has its own mixer channel, reserved when the mixer is opened (see `open`): a voice never takes the
+    channel of a sound, and stopping the voice does not stop the sounds. The music has two channels (see MusicScheduler).
+
+    Attributes:
+        cache: The decoded sounds and voices (Assets.SoundCache).
+        channels: Dictionary type of audio ('voice' or 'sound') -> pygame.mixer.Channel (empty until `open` is called).
+        music: The MusicScheduler.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else SoundCache()
+        self.channels = {}
+        self.music = MusicScheduler(self.cache)
+
+    def open(self):
+        """Reserve the channels of each type of audio (the mixer must be initialised)."""
+        nb_channels = len(CHANNELS) + MUSIC_CHANNELS
+        if pygame.mixer.get_num_channels() < nb_channels:
+            pygame.mixer.set_num_channels(nb_channels)
+        pygame.mixer.set_reserved(nb_channels) # pygame never picks these channels for Sound.play
+        self.channels = {audio_type: pygame.mixer.Channel(i) for i, audio_type in enumerate(CHANNELS)}
+        self.music.channels = [pygame.mixer.Channel(len(CHANNELS) + i) for i in range(MUSIC_CHANNELS)]
+
+    def get_sound(self, path, decode):
+        """
+        Description
+        -----------
+        Returns a decoded sound, from the cache if it was already decoded.
+
+        Arguments
+        ---------
+        path : The resolved path of the audio file.
+        decode : Function path -> pygame.mixer.Sound, called if the sound is not cached.
+
+        Returns
+        -------
+        pygame.mixer.Sound: The decoded sound.
+        """
+        sound = self.cache.get(path)
+        if sound is None:
+            sound = self.cache.put(path, decode(path))
+        return sound
+
+    def play(self, audio_type, sound):
+        """Play a sound on the channel of its type ('voice' or 'sound'), replacing the audio playing on it."""
+        self.channels[audio_type].play(sound)
+
+    def stop(self, audio_type=None, fadeout_ms=0):
+        """
+        Description
+        -----------
+        Stops the audio of one type, or every audio.
+
+        Arguments
+        ---------
+        audio_type (optional) : 'music', 'voice' or 'sound' (None: every type).
+        fadeout_ms (optional) : Duration of the fadeout in milliseconds (0: stopped at once).
+
+        Returns
+        -------
+        None
+        """
+        if audio_type is None or audio_type == 'music':
+            self.music.stop(fadeout_ms)
+        for channel_type, channel in self.channels.items():
+            if audio_type is None or audio_type == channel_type:
+                if fadeout_ms > 0:
+                    channel.fadeout(fadeout_ms)
+                else:
+                    channel.stop()
+
+    def close(self):
+        """Release the threads of the audio (see MusicScheduler.close)."""
+        self.music.close()
+
+    def stop_dialogue_audio(self):
+        """Stop the sound and the voice (not the music), e.g., when the next dialogue is displayed."""
+        for channel in self.channels.values():
+            channel.stop()
@@ -0,0 +1,543 @@
+import json
+import math
+import os
+import pickle
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from AST import ASTNode, MasterNode, StringNode, UserNode, DialogueNode, LabelNode
+from FlatAST import FlatAST, FlatList, NODE_FIELDS, get_kind
+from Intern import InternPool
+from Labels import LabelIndex
+from Tokens import RPTokenizer
+from Parser import MasterParser
+from Symbols import SymbolTable
+from defs import COMPILER_VERSION
+##############################################################################
+####### TO MODIFY BY THE USER OF THIS PROJECT (for benchmarking purpose): ####
+
+# Global variables:
+BENCH_TOKENIZER = True # Change to True to compare the character-by-character tokenizer with the compiled scanner
+
+BENCH_STAGES = True # Change to True to time each stage of the compiler and of the runtime on scripts of growing size
+
+BENCH_AST = True # Change to True to measure the memory of the AST nodes and the cost of reading their attributes
+
+BENCH_FLAT_AST = True # Change to True to compare the traversal and the serialisation of the tree AST and of the FlatAST
+
+TOKENIZER_NB_LINES = 50000 # Approximate number of lines of the synthetic renpy script used by BENCH_TOKENIZER
+STAGES_SCALES = [1, 2, 4, 8] # Size of the synthetic scripts used by BENCH_STAGES (see stages_script_parameters)
+STAGES_REPEAT = 3 # Each stage is timed STAGES_REPEAT times (the best time is kept)
+STAGES_RENDER_STATES = 20 # Number of states rendered by the headless render loop
+STAGES_OUTPUT_FILE = '../output_files_benchmark/benchmark_results.json' # File where BENCH_STAGES writes its results (JSON)
+STAGES_SCRIPT_FILE = 'Tests-RenPy-Scripts/Execution-scripts/benchmark_script.rpy' # Synthetic script (next to the images and musics it uses)
+AST_NB_NODES = 100000 # Number of nodes of each class created by BENCH_AST
+FLAT_AST_NB_NODES = 1000000 # Approximate number of nodes of the AST used by BENCH_FLAT_AST
+
+##############################################################################
+
+def generate_renpy_script(nb_labels=10, nb_defines=10, nb_dialogues=20, nb_tags=2):
+    """
+    Description
+    -----------
+    Generates a synthetic (but valid) renpy script: characters and images declared at top level,
+    then a chain of labels linked with 'jump' statements, each one containing a scene, a show and a run of dialogues.
+
+    Arguments
+    ---------
+    nb_labels: Number of labels in the script.
+    nb_defines: Number of characters declared with 'define'.
+    nb_dialogues: Number of dialogue lines inside each label.
+    nb_tags: Number of tags used by each image expression (e.g., 2 for 'eileen happy').
+
+    Returns
+    -------
+    str: The content of the renpy script.
+    """
+    lines = []
+    for i in range(nb_defines):
+        lines.append(f'define char{i} = Character("Character {i}", color="#19572a")')
+    lines.append('define bgm = "musics-test/E.S-Posthumus-Unstoppable.ogg"')
+    lines.append('')
+
+    tags = ' '.join(f'tag{j}' for j in range(1, nb_tags))
+    lines.append(f'image bg {tags} = "images-test/bg_library.jpg"')
+    lines.append(f'image char {tags} = "images-test/eileen_happy.png"')
+    lines.append('')
+
+    for i in range(nb_labels):
+        lines.append('label start:' if i == 0 else f'label label{i}:')
+        lines.append('    play music bgm fadein 1.0')
+        lines.append(f'    scene bg {tags} with fade')
+        lines.append(f'    show char {tags} at left with dissolve')
+        for j in range(nb_dialogues):
+            lines.append(f'    char{j % max(nb_defines, 1)} "Dialogue line {j} of label {i}, with some words to wrap."')
+        lines.append(f'    jump label{i + 1}' if i < nb_labels - 1 else '    return')
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+def tokenize(renpy_file, compiled=True, pool=None):
+    """
+    Description
+    -----------
+    Tokenizes a whole renpy script.
+
+    Arguments
+    ---------
+    renpy_file: The content of the renpy script.
+    compiled: Whether the compiled scanner is used or not (see RPTokenizer).
+    pool: Intern pool filled by the tokenizer (by default, a new pool).
+
+    Returns
+    -------
+    list: All the tokens found.
+    """
+    return list(RPTokenizer(renpy_file, compiled=compiled, pool=pool).iter_tokens())
+
+def benchmark_tokenizer(nb_lines=TOKENIZER_NB_LINES):
+    """
+    Description
+    -----------
+    Times the character-by-character tokenizer and the compiled scanner on the same synthetic
+    script and checks that both emit the same token stream.
+
+    Arguments
+    ---------
+    nb_lines: Approximate number of lines of the synthetic script.
+
+    Returns
+    -------
+    dict: Number of lines and tokens, time (in seconds) of each tokenizer and the speedup.
+    """
+    nb_labels = max(nb_lines // 25, 1) # Each label written by generate_renpy_script is about 25 lines long
+    renpy_file = generate_renpy_script(nb_labels=nb_labels, nb_defines=10, nb_dialogues=20)
+
+    start = time.perf_counter()
+    classic_tokens = tokenize(renpy_file, compiled=False)
+    classic_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled_tokens = tokenize(renpy_file, compiled=True)
+    compiled_time = time.perf_counter() - start
+
+    if [(t.type, t.value, t.line, t.column) for t in classic_tokens] != [(t.type, t.value, t.line, t.column) for t in compiled_tokens]:
+        raise AssertionError('The compiled scanner does not emit the same tokens as the character-by-character tokenizer')
+
+    return {
+        'lines': renpy_file.count('\n'),
+        'tokens': len(compiled_tokens),
+        'classic_s': classic_time,
+        'compiled_s': compiled_time,
+        'speedup': classic_time / compiled_time
+    }
+
+def stages_script_parameters(scale):
+    """
+    Description
+    -----------
+    Returns the parameters of generate_renpy_script for one size of BENCH_STAGES: many labels, many defines,
+    deep image tags and long dialogue runs, all growing with `scale`.
+
+    Arguments
+    ---------
+    scale: Size of the script (1 is about 4000 lines).
+
+    Returns
+    -------
+    dict: Keyword arguments of generate_renpy_script.
+    """
+    return {'nb_labels': 100 * scale, 'nb_defines': 20 * scale, 'nb_dialogues': 30 + 5 * scale, 'nb_tags': 4 + scale}
+
+def measure(function, repeat=STAGES_REPEAT):
+    """
+    Description
+    -----------
+    Times a function and measures the peak of the memory it allocates. The function is run `repeat` times without
+    tracing the memory (the best time is kept), then once more with tracemalloc.
+
+    Arguments
+    ---------
+    function: Function without argument.
+    repeat: Number of timed runs.
+
+    Returns
+    -------
+    tuple: (result of the last call, best time in seconds, peak of the memory allocated by Python in bytes).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+def scaling_exponent(sizes, times):
+    """
+    Description
+    -----------
+    Estimates k in time = c * size^k (least squares on the log-log points): 1 is linear, 2 is quadratic.
+
+    Arguments
+    ---------
+    sizes: The sizes of the inputs (e.g., number of lines).
+    times: The time measured for each size.
+
+    Returns
+    -------
+    float or None: The exponent, or None if there are less than two sizes.
+    """
+    points = [(math.log(size), math.log(t)) for size, t in zip(sizes, times) if size > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def benchmark_stages_once(renpy_path, repeat=STAGES_REPEAT, render_states=STAGES_RENDER_STATES):
+    """
+    Description
+    -----------
+    Times each stage of the compiler and of the runtime on one renpy script: tokenizer, parser, initialisation
+    phase (semantic pass), creation of the state machine and headless render loop. Each stage uses the result
+    of the previous stages, but only the stage itself is timed.
+
+    Arguments
+    ---------
+    renpy_path: Path of the renpy script.
+    repeat: Number of timed runs of each stage.
+    render_states: Number of states rendered by the headless render loop.
+
+    Returns
+    -------
+    dict: Stage name -> {'ops', 'unit', 'seconds', 'ops_per_s', 'peak_bytes'}.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import pygame # Only imported if the runtime is benchmarked
+    from visualnovel import VisualNovelGenerator, StateMachine
+
+    with open(renpy_path, 'r', encoding='utf-8') as file:
+        renpy_file = file.read()
+    results = {}
+
+    def add(stage, ops, unit, seconds, peak):
+        results[stage] = {'ops': ops, 'unit': unit, 'seconds': seconds, 'ops_per_s': ops / seconds if seconds > 0 else None, 'peak_bytes': peak}
+
+    pool = InternPool() # Shared by the tokenizer and the symbols table, like in a compilation
+    tokens, seconds, peak = measure(lambda: tokenize(renpy_file, pool=pool), repeat)
+    add('tokenizer', len(tokens), 'tokens', seconds, peak)
+
+    ast_tree, seconds, peak = measure(lambda: MasterParser(tokens).parse_renpy_file(), repeat)
+    add('parser', len(tokens), 'tokens', seconds, peak)
+
+    vn = VisualNovelGenerator(renpy_path, use_cache=False, run=False)
+    vn.ast_tree = ast_tree
+    def semantic_pass():
+        vn.symbols_table = SymbolTable(pool)
+        vn.labels_table = {}
+        vn.step4_initialize_master_node()
+    _, seconds, peak = measure(semantic_pass, repeat)
+    add('semantic', len(ast_tree), 'top-level statements', seconds, peak)
+
+    pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1)) # convert_alpha needs a display mode
+    def create_state_machine():
+        state_machine = StateMachine(vn.symbols_table, vn.labels_table, vn.ast_tree, renpy_path, vn.label_index)
+        state_machine.create_state_machine((1200, 800))
+        if state_machine.prefetcher is not None:
+            state_machine.prefetcher.shutdown()
+        return len(state_machine.state_machine)
+    nb_states, seconds, peak = measure(create_state_machine, repeat)
+    add('state_machine', nb_states, 'states', seconds, peak)
+
+    def render():
+        state_machine = StateMachine(vn.symbols_table, vn.labels_table, vn.ast_tree, renpy_path, vn.label_index, lazy=True)
+        run = state_machine.run_headless(checksums=False, max_states=render_states)
+        if run['error'] is not None:
+            raise AssertionError(run['error'])
+        return run
+    run, _, peak = measure(render, 1) # Rendering is slow: the time of the headless runner is used (the creation of the states is not counted)
+    add('render', run['frames'], 'frames', run['run_s'], peak)
+    return results
+
+def benchmark_stages(scales=STAGES_SCALES, repeat=STAGES_REPEAT, output_file=STAGES_OUTPUT_FILE, script_file=STAGES_SCRIPT_FILE):
+    """
+    Description
+    -----------
+    Runs benchmark_stages_once on synthetic scripts of growing size and computes the scaling exponent of each stage
+    (see scaling_exponent). The results are written in a JSON file, to compare them from release to release.
+
+    Arguments
+    ---------
+    scales: Sizes of the synthetic scripts (see stages_script_parameters).
+    repeat: Number of timed runs of each stage.
+    output_file: JSON file where the results are written (None: not written).
+    script_file: Where the synthetic scripts are written (next to the images and musics they use). Removed at the end.
+
+    Returns
+    -------
+    dict: 'compiler_version', 'python', 'platform', 'runs' (one entry per script: its parameters, its number of lines
+    and the results of each stage) and 'scaling' (stage name -> exponent).
+    """
+    runs = []
+    try:
+        for scale in scales:
+            parameters = stages_script_parameters(scale)
+            renpy_file = generate_renpy_script(**parameters)
+            with open(script_file, 'w', encoding='utf-8') as file:
+                file.write(renpy_file)
+            runs.append({'parameters': parameters, 'lines': renpy_file.count('\n'), 'stages': benchmark_stages_once(script_file, repeat)})
+    finally:
+        if os.path.isfile(script_file):
+            os.remove(script_file)
+
+    lines = [run['lines'] for run in runs]
+    report = {
+        'compiler_version': COMPILER_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': runs,
+        'scaling': {stage: scaling_exponent(lines, [run['stages'][stage]['seconds'] for run in runs]) for stage in runs[0]['stages']} if runs else {}
+    }
+    if output_file is not None:
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+def with_dict(node_class):
+    """
+    Description
+    -----------
+    Returns a class equivalent to an AST node class, but whose instances have a `__dict__` (like the nodes before
+    they declared their `__slots__`), to compare both layouts.
+
+    Arguments
+    ---------
+    node_class: The AST node class.
+
+    Returns
+    -------
+    type: The class with a `__dict__`.
+    """
+    return type(node_class.__name__, (), {'__init__': node_class.__init__})
+
+def node_bytes(factory, nb_nodes=AST_NB_NODES):
+    """
+    Description
+    -----------
+    Measures the memory allocated for each node created by a factory (the list holding the nodes is not counted).
+
+    Arguments
+    ---------
+    factory: Function without argument creating one node.
+    nb_nodes: Number of nodes created.
+
+    Returns
+    -------
+    float: Number of bytes per node.
+    """
+    tracemalloc.start()
+    try:
+        nodes = [factory() for _ in range(nb_nodes)]
+        size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(nodes)
+    finally:
+        tracemalloc.stop()
+    return size / nb_nodes
+
+def access_ns(node, attribute, number=1000000):
+    """
+    Description
+    -----------
+    Times the reading of an attribute of a node.
+
+    Arguments
+    ---------
+    node: The node.
+    attribute: The name of the attribute.
+    number: Number of reads.
+
+    Returns
+    -------
+    float: Time of one read in nanoseconds (best of 3 runs).
+    """
+    timer = timeit.Timer(f'node.{attribute}', globals={'node': node})
+    return min(timer.repeat(3, number)) / number * 1e9
+
+def benchmark_ast_nodes(nb_nodes=AST_NB_NODES):
+    """
+    Description
+    -----------
+    Measures the bytes per node and the cost of reading an attribute for the AST nodes created the most by a
+    dialogue-heavy script, with their `__slots__` and with an equivalent `__dict__` (see with_dict).
+    The children of the nodes (strings, speaker) are shared, so only the nodes themselves are measured.
+
+    Arguments
+    ---------
+    nb_nodes: Number of nodes of each class created.
+
+    Returns
+    -------
+    dict: Class name -> 'bytes', 'dict_bytes' (bytes per node), 'access_ns' and 'dict_access_ns' (time to read an attribute).
+    """
+    text = '"Dialogue line of a label, with some words to wrap."'
+    speaker = UserNode('eileen')
+    cases = [ # (node class, arguments of the constructor, attribute read)
+        (StringNode, (text,), 'value'),
+        (UserNode, ('eileen',), 'name'),
+        (DialogueNode, (speaker, StringNode(text)), 'text'),
+        (LabelNode, ('start', []), 'body')
+    ]
+    results = {}
+    for node_class, args, attribute in cases:
+        dict_class = with_dict(node_class)
+        results[node_class.__name__] = {
+            'bytes': node_bytes(lambda: node_class(*args), nb_nodes),
+            'dict_bytes': node_bytes(lambda: dict_class(*args), nb_nodes),
+            'access_ns': access_ns(node_class(*args), attribute),
+            'dict_access_ns': access_ns(dict_class(*args), attribute)
+        }
+    return results
+
+def generate_dialogue_tree(nb_nodes=FLAT_AST_NB_NODES, nb_dialogues=100):
+    """
+    Description
+    -----------
+    Builds the AST of a dialogue-heavy script directly (parsing a script of a million nodes would take most of the
+    benchmark): labels of `nb_dialogues` dialogues, each dialogue being a DialogueNode, a UserNode and a StringNode.
+
+    Arguments
+    ---------
+    nb_nodes: Approximate number of nodes of the AST.
+    nb_dialogues: Number of dialogues of each label.
+
+    Returns
+    -------
+    MasterNode: The AST.
+    """
+    nb_labels = max(nb_nodes // (3 * nb_dialogues + 2), 1)
+    return MasterNode([
+        LabelNode(UserNode(f'label{i}'), [DialogueNode(UserNode(f'char{j % 10}'), StringNode(f'"Dialogue line {j} of label {i}."'))
+                                          for j in range(nb_dialogues)])
+        for i in range(nb_labels)
+    ])
+
+def walk_tree(master_node, node_class=DialogueNode):
+    """
+    Description
+    -----------
+    Visits every node of an AST (like a pass of the compiler) and counts the nodes of a class. Every field of every node
+    is read through the attributes of the nodes, so the traversal is the same for a tree and for the views of a FlatAST.
+
+    Arguments
+    ---------
+    master_node: The MasterNode of the AST (tree, or FlatAST.root).
+    node_class: The class of the nodes counted.
+
+    Returns
+    -------
+    int: The number of nodes of the class.
+    """
+    count = 0
+    stack = [master_node]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, ASTNode):
+            count += isinstance(value, node_class)
+            stack.extend(getattr(value, name) for name in NODE_FIELDS[get_kind(value)])
+        elif isinstance(value, (list, FlatList)):
+            stack.extend(value)
+    return count
+
+def benchmark_flat_ast(nb_nodes=FLAT_AST_NB_NODES, repeat=STAGES_REPEAT):
+    """
+    Description
+    -----------
+    Compares the tree AST and the FlatAST of the same dialogue-heavy script (see generate_dialogue_tree): time of the
+    same walk of every field of every node (see walk_tree), time to build the label index, and time to pickle then
+    unpickle the AST (like the '.rpyc' cache).
+
+    Arguments
+    ---------
+    nb_nodes: Approximate number of nodes of the AST.
+    repeat: Number of timed runs of each measure (the best time is kept).
+
+    Returns
+    -------
+    dict: 'nodes', 'flatten_s' (time to build the FlatAST from the tree), 'walk_tree_s', 'walk_flat_s', 'labels_tree_s',
+    'labels_flat_s', 'pickle_tree_s', 'pickle_flat_s' (dump and load), 'pickle_tree_bytes', 'pickle_flat_bytes' and the
+    speedups of the FlatAST (below 1: slower) 'walk_speedup', 'labels_speedup', 'pickle_speedup'.
+    """
+    tree = generate_dialogue_tree(nb_nodes)
+    _, flatten_s, _ = measure(lambda: FlatAST.from_tree(tree), 1)
+    flat = FlatAST.from_tree(tree)
+    nb_dialogues, walk_tree_s, _ = measure(lambda: walk_tree(tree), repeat)
+    flat_dialogues, walk_flat_s, _ = measure(lambda: walk_tree(flat.root), repeat)
+    if nb_dialogues != flat_dialogues:
+        raise AssertionError('The FlatAST does not contain the same nodes as the tree')
+    _, labels_tree_s, _ = measure(lambda: LabelIndex(tree), repeat)
+    _, labels_flat_s, _ = measure(lambda: LabelIndex(flat.root), repeat)
+
+    tree_bytes = pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+    flat_bytes = pickle.dumps(flat, protocol=pickle.HIGHEST_PROTOCOL)
+    _, pickle_tree_s, _ = measure(lambda: pickle.loads(pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)), repeat)
+    _, pickle_flat_s, _ = measure(lambda: pickle.loads(pickle.dumps(flat, protocol=pickle.HIGHEST_PROTOCOL)), repeat)
+    return {
+        'nodes': len(flat),
+        'flatten_s': flatten_s,
+        'walk_tree_s': walk_tree_s,
+        'walk_flat_s': walk_flat_s,
+        'labels_tree_s': labels_tree_s,
+        'labels_flat_s': labels_flat_s,
+        'pickle_tree_s': pickle_tree_s,
+        'pickle_flat_s': pickle_flat_s,
+        'pickle_tree_bytes': len(tree_bytes),
+        'pickle_flat_bytes': len(flat_bytes),
+        'walk_speedup': walk_tree_s / walk_flat_s,
+        'labels_speedup': labels_tree_s / labels_flat_s,
+        'pickle_speedup': pickle_tree_s / pickle_flat_s
+    }
+
+if __name__ == "__main__":
+    if BENCH_TOKENIZER:
+        res = benchmark_tokenizer()
+        print(f"Tokenizer on {res['lines']} lines ({res['tokens']} tokens):")
+        print(f"  character-by-character: {res['classic_s']:.3f} s")
+        print(f"  compiled scanner:       {res['compiled_s']:.3f} s (x{res['speedup']:.1f})")
+
+    if BENCH_STAGES:
+        report = benchmark_stages()
+        for run in report['runs']:
+            print(f"Script of {run['lines']} lines:")
+            for stage, res in run['stages'].items():
+                print(f"  {stage:<14} {res['seconds']:8.3f} s  {res['ops_per_s'] or 0:12.0f} {res['unit']}/s  peak {res['peak_bytes'] / 2**20:8.1f} MB")
+        print('Scaling exponents (time ~ lines^k):')
+        for stage, exponent in report['scaling'].items():
+            print(f"  {stage:<14} {'-' if exponent is None else f'{exponent:.2f}'}")
+        print(f'Results written in {STAGES_OUTPUT_FILE}')
+
+    if BENCH_AST:
+        print(f'AST nodes ({AST_NB_NODES} of each class), __slots__ vs __dict__:')
+        for name, res in benchmark_ast_nodes().items():
+            print(f"  {name:<14} {res['bytes']:6.0f} B/node vs {res['dict_bytes']:6.0f} B/node   "
+                  f"read {res['access_ns']:5.1f} ns vs {res['dict_access_ns']:5.1f} ns")
+
+    if BENCH_FLAT_AST:
+        res = benchmark_flat_ast()
+        print(f"AST of {res['nodes']} nodes, tree vs FlatAST (built in {res['flatten_s']:.3f} s):")
+        print(f"  walk every field:  {res['walk_tree_s']:.3f} s vs {res['walk_flat_s']:.3f} s (x{res['walk_speedup']:.2f})")
+        print(f"  label index:       {res['labels_tree_s']:.3f} s vs {res['labels_flat_s']:.3f} s (x{res['labels_speedup']:.2f})")
+        print(f"  pickle + unpickle: {res['pickle_tree_s']:.3f} s vs {res['pickle_flat_s']:.4f} s (x{res['pickle_speedup']:.0f}), "
+              f"{res['pickle_tree_bytes'] / 2**20:.1f} MB vs {res['pickle_flat_bytes'] / 2**20:.1f} MB")
@@ -0,0 +1,135 @@
+# Module that stores the result of the front-end (tokenizer, parser and initialisation phase) of a renpy script on disk,
+# so the next launch of the same script can skip it.
+import gc
+import hashlib
+import os
+import pickle
+from defs import COMPILER_VERSION, SCRIPT_CHUNK_SIZE
+
+class ASTCache():
+    """
+    On-disk cache of a compiled renpy script (a '.rpyc' file written next to the script).
+
+    The cache file contains two pickled objects:
+    - A header: the compiler version, the SHA-256 hash of the script and the form of the AST (read first, to check if the cache is valid).
+    - The payload: the MasterNode AST, the symbols table and the labels table (pickled together, so the
+      nodes shared by the AST and the tables are still shared once loaded). With `flat=True`, the AST is a view of
+      a FlatAST (see FlatAST.py): only its arrays are pickled, which is much faster for big scripts.
+
+    The cache is invalidated automatically when the script is modified or when COMPILER_VERSION changes.
+    """
+    def __init__(self, renpy_file, flat=False):
+        self.renpy_file = renpy_file
+        self.flat = flat # Form of the AST stored in the cache (a cache written with the other form is not used)
+        self.cache_file = self.get_cache_path(renpy_file)
+        self.source_hash = None # Computed on the first call of get_source_hash
+
+    @staticmethod
+    def get_cache_path(renpy_file):
+        """
+        Description
+        -----------
+        Returns the path of the cache file of a renpy script (e.g., 'script.rpy' -> 'script.rpyc').
+
+        Arguments
+        ---------
+        renpy_file: Path of the renpy script.
+
+        Returns
+        -------
+        str: Path of the cache file.
+        """
+        if renpy_file.endswith('.rpy'):
+            return renpy_file + 'c'
+        return renpy_file + '.rpyc'
+
+    def get_source_hash(self):
+        """
+        Description
+        -----------
+        Computes the SHA-256 hash of the renpy script. The file is read by chunks, so it is never loaded at once.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        str: The hexadecimal hash of the script.
+        """
+        if self.source_hash is None:
+            sha = hashlib.sha256()
+            with open(self.renpy_file, 'rb') as file:
+                for chunk in iter(lambda: file.read(SCRIPT_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+            self.source_hash = sha.hexdigest()
+        return self.source_hash
+
+    def get_header(self):
+        """Return the header identifying the version of the compiler, the content of the script and the form of the AST."""
+        return {'version': COMPILER_VERSION, 'hash': self.get_source_hash(), 'flat': self.flat}
+
+    def load(self):
+        """
+        Description
+        -----------
+        Loads the compiled script from the cache file if it is valid.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        tuple or None: (ast_tree, symbols_table, labels_table), or None if the cache file is missing,
+        outdated (script modified or new compiler version) or unreadable.
+        """
+        if not os.path.isfile(self.cache_file):
+            return None
+        gc_enabled = gc.isenabled()
+        gc.disable() # The payload creates a lot of objects at once: the garbage collector would run many times for nothing
+        try:
+            with open(self.cache_file, 'rb') as file:
+                if pickle.load(file) != self.get_header():
+                    return None # Outdated cache: the payload is not even unpickled
+                payload = pickle.load(file)
+            return payload['ast_tree'], payload['symbols_table'], payload['labels_table']
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, KeyError, TypeError):
+            # HANDLING: A corrupted cache file (or written by an incompatible version of the AST module) is a cache miss
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def save(self, ast_tree, symbols_table, labels_table):
+        """
+        Description
+        -----------
+        Writes the compiled script inside the cache file. The file is written under a temporary name
+        then renamed, so an interrupted launch never leaves a partial cache file.
+
+        Arguments
+        ---------
+        ast_tree: The MasterNode AST of the script.
+        symbols_table: The symbols table created during the initialisation phase.
+        labels_table: The labels table created during the initialisation phase.
+
+        Returns
+        -------
+        bool: True if the cache file was written, False otherwise.
+        """
+        payload = {'ast_tree': ast_tree, 'symbols_table': symbols_table, 'labels_table': labels_table}
+        tmp_file = self.cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as file:
+                pickle.dump(self.get_header(), file, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            return True
+        except (OSError, pickle.PicklingError, RecursionError):
+            # HANDLING: The cache is only an optimisation (e.g., the folder of the script can be read-only)
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            return False
@@ -0,0 +1,388 @@
+# Module that contains the flat (array-backed) representation of the AST, for very large scripts
+# (see VisualNovelGenerator(flat=True) in visualnovel.py)
+from array import array
+from collections.abc import Sequence
+from AST import *
+
+NODE_CLASSES = (MasterNode, LabelNode, DefineNode, ImageNode, SceneNode, ShowNode, HideNode, KeywordNode, TransformNode,
+                FunctionCallNode, AssignNode, DialogueNode, PlayNode, StopNode, ReturnNode, JumpNode, TransitionNode,
+                LayerNode, StringNode, UserNode) # Index in this tuple = kind of the node in FlatAST.kinds
+POOL_ID_FIELDS = {'name_id': 'name', 'value_id': 'value'} # Field -> field whose id in the intern pool it holds (stored once per string, see FlatAST.pool_ids)
+NODE_FIELDS = tuple(tuple(name for name in node_class.__slots__ if name not in POOL_ID_FIELDS)
+                    for node_class in NODE_CLASSES) # Fields of each kind, in the order of FlatAST.fields
+NODE_ID_FIELDS = tuple(tuple((name, fields.index(POOL_ID_FIELDS[name])) for name in node_class.__slots__ if name in POOL_ID_FIELDS)
+                       for node_class, fields in zip(NODE_CLASSES, NODE_FIELDS)) # (id field, position of its string field) of each kind
+KIND_CODES = {node_class: kind for kind, node_class in enumerate(NODE_CLASSES)}
+EMPTY_FIELDS = tuple(array('q', [0]) * len(fields) for fields in NODE_FIELDS)
+
+# Each field is stored as a 64-bit integer: payload << TAG_BITS | tag
+TAG_BITS = 3
+TAG_MASK = (1 << TAG_BITS) - 1
+TAG_NONE = 0
+TAG_NODE = 1 # payload: index of the node
+TAG_STR = 2 # payload: id of the string in FlatAST.strings
+TAG_INT = 3 # payload: the integer
+TAG_BOOL = 4 # payload: 0 or 1
+TAG_FLOAT = 5 # payload: index in FlatAST.floats
+TAG_LIST = 6 # payload: index of the list (its items are list_items[list_offsets[i]:list_offsets[i + 1]])
+TAG_OBJECT = 7 # payload: index in FlatAST.objects (any other value, kept as it is)
+
+def get_kind(node):
+    """
+    Returns the kind of a node (its index in NODE_CLASSES). The views of a FlatAST have the kind of the class they extend.
+
+    Args:
+        node (ASTNode): The node.
+
+    Returns:
+        int: The kind of the node.
+    """
+    node_class = type(node)
+    kind = KIND_CODES.get(node_class)
+    if kind is None:
+        for base in node_class.__mro__:
+            if base in KIND_CODES:
+                kind = KIND_CODES[node_class] = KIND_CODES[base]
+                break
+        else:
+            raise TypeError(f'{node_class.__name__} is not a node of the AST')
+    return kind
+
+class FlatList(Sequence):
+    """
+    Read-only view of a list of a FlatAST (e.g., the body of a label): the items are decoded when they are read.
+    """
+    __slots__ = ('flat', 'start', 'stop')
+
+    def __init__(self, flat, start, stop):
+        self.flat = flat
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.flat.decode(self.flat.list_items[i]) for i in range(self.start, self.stop)[index]]
+        if index < 0:
+            index += self.stop - self.start
+        if not 0 <= index < self.stop - self.start:
+            raise IndexError('FlatList index out of range')
+        return self.flat.decode(self.flat.list_items[self.start + index])
+
+    def __iter__(self):
+        decode = self.flat.decode
+        for item in self.flat.list_items[self.start:self.stop]:
+            yield decode(item)
+
+    def __eq__(self, other):
+        if isinstance(other, (FlatList, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+def node_view_init(self, flat, index):
+    """Initialise a view on the node `index` of a FlatAST."""
+    self.flat = flat
+    self.index = index
+
+def node_view_reduce(self):
+    """Pickle a view as its FlatAST and its index (the FlatAST is only pickled once, see FlatAST.node)."""
+    return (FlatAST.node, (self.flat, self.index))
+
+def node_view_eq(self, other):
+    """Two views are equal if they show the same node of the same FlatAST (the views are not kept, see FlatAST.node)."""
+    if type(other) is type(self):
+        return other.flat is self.flat and other.index == self.index
+    return NotImplemented
+
+def node_view_hash(self):
+    """Hash of the node shown by the view (see node_view_eq)."""
+    return hash((id(self.flat), self.index))
+
+def field_property(position, name):
+    """Return the read-only property decoding a field of the views of a FlatAST."""
+    def get_field(self):
+        flat = self.flat
+        tagged = flat.fields[flat.field_offsets[self.index] + position]
+        tag = tagged & TAG_MASK
+        if tag == TAG_NODE: # Same as FlatAST.decode, without its calls for the most frequent tags
+            index = tagged >> TAG_BITS
+            return VIEW_CLASSES[flat.kinds[index]](flat, index)
+        if tag == TAG_STR:
+            return flat.strings[tagged >> TAG_BITS]
+        return flat.decode(tagged)
+    return property(get_field, doc=f'Field {name!r} of the node (read from the arrays of the FlatAST).')
+
+def pool_id_property(position, name):
+    """Return the read-only property giving the id in the intern pool of a string field of the views of a FlatAST."""
+    def get_pool_id(self):
+        flat = self.flat
+        pool_id = flat.pool_ids[flat.fields[flat.field_offsets[self.index] + position] >> TAG_BITS]
+        return None if pool_id < 0 else pool_id
+    return property(get_pool_id, doc=f'Field {name!r} of the node (id of a string of the FlatAST in the intern pool).')
+
+def make_view_class(node_class, fields, id_fields):
+    """
+    Returns the view class of an AST node class. It extends the node class, so isinstance and every method of the
+    node (iteration, repr, get_next_label, ...) work on the views, but its fields are read from the arrays of a FlatAST.
+
+    Args:
+        node_class (type): The AST node class.
+        fields (tuple): The names of the fields of the node.
+        id_fields (tuple): (name, position of the string field) of the fields holding an id of the intern pool.
+
+    Returns:
+        type: The view class (read-only: the fields cannot be assigned).
+    """
+    namespace = {
+        '__slots__': ('flat', 'index'),
+        '__init__': node_view_init,
+        '__reduce__': node_view_reduce,
+        '__doc__': f'View on a {node_class.__name__} of a FlatAST.'
+    }
+    if node_class.__eq__ is object.__eq__: # Nodes compared by identity (e.g., KeywordNode used as a key of the labels table)
+        namespace['__eq__'] = node_view_eq
+        namespace['__hash__'] = node_view_hash
+    for position, name in enumerate(fields):
+        namespace[name] = field_property(position, name)
+    for name, position in id_fields:
+        namespace[name] = pool_id_property(position, name)
+    return type(node_class.__name__, (node_class,), namespace)
+
+VIEW_CLASSES = tuple(make_view_class(node_class, fields, id_fields)
+                     for node_class, fields, id_fields in zip(NODE_CLASSES, NODE_FIELDS, NODE_ID_FIELDS))
+
+class FlatAST():
+    """
+    AST stored as a struct of arrays instead of a tree of Python objects.
+
+    The nodes are numbered in pre-order (the MasterNode is the node 0, each node comes before its children). For each node,
+    `kinds` holds its kind (index in NODE_CLASSES) and `field_offsets` the position of its fields in `fields`; the fields
+    (in the order of NODE_FIELDS) are tagged 64-bit integers: a node index, a string id (the strings are interned, each
+    one is stored once in `strings`), an integer, a float, a list (a range of `list_items`, e.g., the body of a label), ...
+    The ids of the strings in the intern pool of the compilation (UserNode.name_id, StringNode.value_id) are not stored in
+    `fields`: they are read from `pool_ids`, which holds the id of each string.
+
+    Building, pickling and scanning the arrays does not create one Python object per node: counting or finding the
+    nodes of a kind is a scan of `kinds` in C (see `count` and `indices`). The rest of the compiler reads the AST through
+    views (see `node` and `root`): instances of subclasses of the node classes (LabelNode, DialogueNode, ...) decoding
+    their fields from the arrays, so the semantic pass and the StateMachine consume both forms without any change.
+    A view is created at each access and is not kept by the FlatAST (two views of the same node are equal), so walking
+    the AST does not leave one object per node in memory.
+
+    Reading a field through a view decodes it, which is slower than reading the attribute of a tree node: the flat form
+    is meant for storing and loading very large scripts (see Benchmark.benchmark_flat_ast), not for faster passes. The
+    label index reads the labels and their jumps from the arrays directly (see `labels`).
+
+    Attributes:
+        kinds: array of the kinds of the nodes.
+        field_offsets: array of the position of the first field of each node in `fields`.
+        fields: array of the tagged fields.
+        list_offsets: array of the position of the first item of each list in `list_items` (plus the end of the last list).
+        list_items: array of the tagged items of the lists.
+        strings: The distinct strings of the AST (each one is stored once).
+        pool_ids: array of the id of each string of `strings` in the intern pool of the compilation (see Intern.py),
+            -1 for the strings that are not the name of a UserNode or the value of a StringNode.
+        floats: array of the floats.
+        objects: The other values.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.field_offsets = array('q')
+        self.fields = array('q')
+        self.list_offsets = array('q', [0])
+        self.list_items = array('q')
+        self.strings = []
+        self.pool_ids = array('q')
+        self.floats = array('d')
+        self.objects = []
+        self.string_ids = {} # string -> id (only used while the FlatAST is built)
+
+    @classmethod
+    def from_tree(cls, master_node):
+        """
+        Description
+        -----------
+        Builds the flat representation of an AST.
+
+        Arguments
+        ---------
+        master_node : The MasterNode of the AST (tree of nodes, or view of another FlatAST).
+
+        Returns
+        -------
+        FlatAST: The flat AST (its node 0 is the MasterNode).
+        """
+        flat = cls()
+        flat.add_node(master_node)
+        flat.string_ids = {}
+        return flat
+
+    def add_node(self, node):
+        """Append a node and its children (pre-order), and return its index."""
+        index = len(self.kinds)
+        kind = get_kind(node)
+        fields = NODE_FIELDS[kind]
+        start = len(self.fields)
+        self.kinds.append(kind)
+        self.field_offsets.append(start)
+        self.fields.extend(EMPTY_FIELDS[kind]) # Reserved: the children are appended while the fields are encoded
+        for position, name in enumerate(fields):
+            self.fields[start + position] = self.encode(getattr(node, name, None))
+        for name, position in NODE_ID_FIELDS[kind]:
+            pool_id = getattr(node, name, None)
+            if pool_id is not None:
+                self.pool_ids[self.fields[start + position] >> TAG_BITS] = pool_id
+        return index
+
+    def encode(self, value):
+        """Return the tagged integer of a value (the nodes and lists it contains are appended)."""
+        if value is None:
+            return TAG_NONE
+        if isinstance(value, ASTNode):
+            return self.add_node(value) << TAG_BITS | TAG_NODE
+        if isinstance(value, str):
+            string_id = self.string_ids.get(value)
+            if string_id is None:
+                string_id = self.string_ids[value] = len(self.strings)
+                self.pool_ids.append(-1) # Set by add_node for the name of a UserNode or the value of a StringNode
+                self.strings.append(value)
+            return string_id << TAG_BITS | TAG_STR
+        if isinstance(value, bool):
+            return int(value) << TAG_BITS | TAG_BOOL
+        if isinstance(value, int) and -2 ** 59 <= value < 2 ** 59:
+            return value << TAG_BITS | TAG_INT
+        if isinstance(value, float):
+            self.floats.append(value)
+            return (len(self.floats) - 1) << TAG_BITS | TAG_FLOAT
+        if isinstance(value, (list, FlatList)):
+            items = array('q', [self.encode(item) for item in value]) # Encoded first: the items of nested lists are appended before
+            self.list_items.extend(items)
+            self.list_offsets.append(len(self.list_items))
+            return (len(self.list_offsets) - 2) << TAG_BITS | TAG_LIST
+        self.objects.append(value)
+        return (len(self.objects) - 1) << TAG_BITS | TAG_OBJECT
+
+    def decode(self, tagged):
+        """Return the value of a tagged integer (nodes are returned as views, lists as FlatList)."""
+        tag = tagged & TAG_MASK
+        payload = tagged >> TAG_BITS
+        if tag == TAG_NODE:
+            return self.node(payload)
+        if tag == TAG_STR:
+            return self.strings[payload]
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_LIST:
+            return FlatList(self, self.list_offsets[payload], self.list_offsets[payload + 1])
+        if tag == TAG_INT:
+            return payload
+        if tag == TAG_BOOL:
+            return bool(payload)
+        if tag == TAG_FLOAT:
+            return self.floats[payload]
+        return self.objects[payload]
+
+    def __len__(self):
+        """Return the number of nodes."""
+        return len(self.kinds)
+
+    def node(self, index):
+        """Return a view of a node."""
+        return VIEW_CLASSES[self.kinds[index]](self, index)
+
+    @property
+    def root(self):
+        """The view of the MasterNode."""
+        return self.node(0)
+
+    def count(self, node_class):
+        """Return the number of nodes of a class (e.g., DialogueNode), without creating any view."""
+        return self.kinds.tobytes().count(KIND_CODES[node_class])
+
+    def indices(self, node_class):
+        """Return the indices of the nodes of a class, in pre-order, without creating any view."""
+        kinds = self.kinds.tobytes()
+        kind = KIND_CODES[node_class]
+        indices = []
+        index = kinds.find(kind)
+        while index != -1:
+            indices.append(index)
+            index = kinds.find(kind, index + 1)
+        return indices
+
+    def list_items_of(self, tagged):
+        """Return the tagged items of a tagged list (empty if the value is not a list)."""
+        if tagged & TAG_MASK != TAG_LIST:
+            return array('q')
+        payload = tagged >> TAG_BITS
+        return self.list_items[self.list_offsets[payload]:self.list_offsets[payload + 1]]
+
+    def labels(self):
+        """
+        Description
+        -----------
+        Lists the top-level labels and the targets of their 'jump' statements, read from the arrays: only the labels
+        and the names are decoded, not the other statements of the bodies (see Labels.LabelIndex).
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        list: (view of the LabelNode, its label_name, label_name of each JumpNode of its body) tuples, in the order of the script.
+        """
+        label_kind, jump_kind = KIND_CODES[LabelNode], KIND_CODES[JumpNode]
+        name_position = NODE_FIELDS[label_kind].index('label_name')
+        jump_position = NODE_FIELDS[jump_kind].index('label_name')
+        kinds, fields, field_offsets = self.kinds.tobytes(), self.fields, self.field_offsets
+        children = [child >> TAG_BITS for child in self.list_items_of(fields[field_offsets[0] + NODE_FIELDS[0].index('children')])
+                    if child & TAG_MASK == TAG_NODE]
+        labels = []
+        for position, index in enumerate(children):
+            if kinds[index] != label_kind:
+                continue
+            # Pre-order: the nodes of the label are the indices up to the next top-level node (a 'jump' is always a statement of a body)
+            end = children[position + 1] if position + 1 < len(children) else len(kinds)
+            jumps = []
+            jump = kinds.find(jump_kind, index, end)
+            while jump != -1:
+                jumps.append(self.decode(fields[field_offsets[jump] + jump_position]))
+                jump = kinds.find(jump_kind, jump + 1, end)
+            labels.append((self.node(index), self.decode(fields[field_offsets[index] + name_position]), jumps))
+        return labels
+
+    def to_tree(self, index=0):
+        """Return a tree of regular (mutable) nodes equal to the node `index` and its children."""
+        kind = self.kinds[index]
+        node = NODE_CLASSES[kind].__new__(NODE_CLASSES[kind])
+        start = self.field_offsets[index]
+        for position, name in enumerate(NODE_FIELDS[kind]):
+            setattr(node, name, self.tree_value(self.fields[start + position]))
+        for name, position in NODE_ID_FIELDS[kind]:
+            pool_id = self.pool_ids[self.fields[start + position] >> TAG_BITS]
+            setattr(node, name, None if pool_id < 0 else pool_id)
+        return node
+
+    def tree_value(self, tagged):
+        """Return the value of a tagged integer, with regular nodes and lists (see to_tree)."""
+        tag = tagged & TAG_MASK
+        if tag == TAG_NODE:
+            return self.to_tree(tagged >> TAG_BITS)
+        if tag == TAG_LIST:
+            payload = tagged >> TAG_BITS
+            return [self.tree_value(item) for item in self.list_items[self.list_offsets[payload]:self.list_offsets[payload + 1]]]
+        return self.decode(tagged)
+
+    def __getstate__(self):
+        """Pickle the arrays only."""
+        return (self.kinds, self.field_offsets, self.fields, self.list_offsets, self.list_items, self.strings, self.pool_ids, self.floats, self.objects)
+
+    def __setstate__(self, state):
+        (self.kinds, self.field_offsets, self.fields, self.list_offsets, self.list_items, self.strings, self.pool_ids, self.floats, self.objects) = state
+        self.string_ids = {}
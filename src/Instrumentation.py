@@ -0,0 +1,188 @@
+# Module that measures where the time goes: stages of the compiler and breakdown of each frame of the runtime
+# (see VisualNovelGenerator and StateMachine in visualnovel.py)
+import json
+import time
+
+FRAME_SECTIONS = ('image_blit', 'transition_update', 'textbox_draw', 'audio') # Parts of a frame timed separately ('other' is the rest)
+
+class Instrumentation():
+    """
+    Stage timers, counters and per-frame breakdown, sent as events to pluggable subscribers.
+
+    The measured functions are wrapped on the instance that owns them (see time_stage and time_section), only when an
+    Instrumentation is given: without it, the code runs exactly as before, so a disabled instrumentation costs nothing.
+    Frame sections are measured in exclusive time (a section called by another section is not counted twice).
+
+    A subscriber is any object with an `on_event(event)` method, and optionally `draw(surface)` (called at the end
+    of each frame, e.g., an on-screen overlay) and `close()`. Events are dictionaries:
+    - {'type': 'stage', 'name': ..., 'seconds': ...}
+    - {'type': 'frame', 'frame': ..., 'state': ..., 'seconds': ..., 'sections': {section: seconds}}
+    - {'type': 'counters', 'values': {name: value}} (sent by close)
+
+    Attributes:
+        subscribers: Objects receiving the events.
+        stages: Dictionary stage name -> total time in seconds.
+        counters: Dictionary counter name -> value.
+    """
+    def __init__(self, subscribers=None):
+        self.subscribers = list(subscribers or [])
+        self.stages = {}
+        self.counters = {}
+        self.frame = None # Sections of the current frame (None outside of a frame)
+        self.frame_start = 0.0
+        self.frame_state = None
+        self.nb_frames = 0
+        self.child_time = 0.0 # Time spent in the nested sections of the section being measured
+
+    def subscribe(self, subscriber):
+        """Add a subscriber (see the description of the class)."""
+        self.subscribers.append(subscriber)
+
+    def emit(self, event):
+        """Send an event to every subscriber."""
+        for subscriber in self.subscribers:
+            subscriber.on_event(event)
+
+    def count(self, name, value=1):
+        """Add `value` to the counter `name`."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def time_stage(self, owner, method_name, stage=None):
+        """
+        Description
+        -----------
+        Replaces a method of `owner` (on this instance only) by a version sending a 'stage' event with its duration.
+
+        Arguments
+        ---------
+        owner : The object owning the method (e.g., a VisualNovelGenerator).
+        method_name : The name of the method (e.g., 'step3_parser').
+        stage (optional) : Name of the stage in the events (by default, the name of the method).
+
+        Returns
+        -------
+        None
+        """
+        method = getattr(owner, method_name)
+        stage = stage or method_name
+        def timed_stage(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+                self.emit({'type': 'stage', 'name': stage, 'seconds': seconds})
+        setattr(owner, method_name, timed_stage)
+
+    def time_section(self, owner, method_name, section):
+        """
+        Description
+        -----------
+        Replaces a method of `owner` (on this instance only) by a version adding its exclusive time to a section of the current frame.
+
+        Arguments
+        ---------
+        owner : The object owning the method (e.g., a StateMachine or a TextBox).
+        method_name : The name of the method (e.g., 'blit_with_alpha').
+        section : One of FRAME_SECTIONS.
+
+        Returns
+        -------
+        None
+        """
+        method = getattr(owner, method_name)
+        def timed_section(*args, **kwargs):
+            outer_child_time = self.child_time
+            self.child_time = 0.0
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if self.frame is not None:
+                    self.frame[section] += seconds - self.child_time
+                self.child_time = outer_child_time + seconds
+        setattr(owner, method_name, timed_section)
+
+    def begin_frame(self, state_idx):
+        """Start measuring a frame displaying the state `state_idx`."""
+        self.frame = dict.fromkeys(FRAME_SECTIONS, 0.0)
+        self.frame_state = state_idx
+        self.child_time = 0.0
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self, surface=None):
+        """
+        Description
+        -----------
+        Stops measuring the current frame, sends its 'frame' event, then lets the subscribers draw on the frame.
+
+        Arguments
+        ---------
+        surface (optional) : The rendered frame (given to the `draw` method of the subscribers).
+
+        Returns
+        -------
+        None
+        """
+        seconds = time.perf_counter() - self.frame_start
+        sections = self.frame
+        sections['other'] = max(seconds - sum(sections.values()), 0.0)
+        self.frame = None
+        self.nb_frames += 1
+        self.emit({'type': 'frame', 'frame': self.nb_frames, 'state': self.frame_state, 'seconds': seconds, 'sections': sections})
+        if surface is not None:
+            for subscriber in self.subscribers:
+                if hasattr(subscriber, 'draw'):
+                    subscriber.draw(surface)
+
+    def draws_on_frames(self):
+        """Return True if a subscriber draws on the frames (the renderer must then draw the whole screen again)."""
+        return any(hasattr(subscriber, 'draw') for subscriber in self.subscribers)
+
+    def close(self):
+        """Send the counters (and the number of frames), then close the subscribers."""
+        self.counters['frames'] = self.nb_frames
+        self.emit({'type': 'counters', 'values': dict(self.counters)})
+        for subscriber in self.subscribers:
+            if hasattr(subscriber, 'close'):
+                subscriber.close()
+
+class JSONLinesExporter():
+    """
+    Subscriber writing every event as one line of JSON in a file.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def on_event(self, event):
+        """Write the event."""
+        self.file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+class FrameOverlay():
+    """
+    Subscriber drawing the duration of the last frame and of its sections at the top-left corner of the screen.
+    """
+    def __init__(self, color=(255, 255, 0)):
+        self.color = color
+        self.lines = []
+        self.font = None # Created on the first draw (pygame.font must be initialised)
+
+    def on_event(self, event):
+        """Keep the breakdown of the last frame."""
+        if event['type'] == 'frame':
+            self.lines = [f"frame {event['seconds'] * 1000:.2f} ms"]
+            self.lines.extend(f"{section} {seconds * 1000:.2f} ms" for section, seconds in event['sections'].items())
+
+    def draw(self, surface):
+        """Draw the breakdown of the last frame."""
+        import pygame # Only needed by the overlay
+        if self.font is None:
+            self.font = pygame.font.SysFont(None, 20)
+        for i, line in enumerate(self.lines):
+            surface.blit(self.font.render(line, True, self.color), (5, 5 + i * 16))
@@ -0,0 +1,75 @@
+# Module that contains the intern pool of a compilation: each identifier and literal of a renpy script is stored once
+# and numbered (see Token in Tokens.py, UserNode and StringNode in AST.py, SymbolTable in Symbols.py)
+
+class InternPool():
+    """
+    Pool mapping each distinct string (identifier, image tag, keyword, dialogue text, ...) to a small integer id.
+
+    The tokenizer replaces the text of each token by the string of the pool, so a word written thousands of times in a
+    script (e.g., 'eileen', 'happy', 'e') is stored once, however many tokens and nodes use it. The AST nodes and the
+    symbol tables keep the id of their strings: comparing two identifiers is then a comparison of two integers.
+
+    Each compilation owns its pool (see VisualNovelGenerator.pool): the tokenizer fills it, the nodes keep the ids of
+    their strings and the symbols table looks the names up in it, so the ids of two compilations are never compared.
+    Looking a string up (see `find`) never adds it to the pool: only the tokenizer and the declarations intern strings.
+    The pool is pickled with the symbols table (see Cache.py), so the ids stored in the cached nodes stay valid.
+
+    Attributes:
+        ids: Dictionary string -> id.
+        strings: The strings of the pool (the id of a string is its index in this list).
+    """
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        """
+        Description
+        -----------
+        Returns the id of a string, adding it to the pool if it is not in it yet.
+
+        Arguments
+        ---------
+        string : The string (e.g., the text of a token).
+
+        Returns
+        -------
+        int: The id of the string (the string of the pool is `strings[id]`).
+        """
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def find(self, string):
+        """
+        Description
+        -----------
+        Returns the id of a string if it is in the pool. The string is never added to the pool.
+
+        Arguments
+        ---------
+        string : The string (e.g., a name looked up in the symbols table).
+
+        Returns
+        -------
+        int or None: The id of the string, or None if it is not in the pool (so no node of the compilation uses it).
+        """
+        return self.ids.get(string)
+
+    def __contains__(self, string):
+        """Return True if the string is in the pool."""
+        return string in self.ids
+
+    def __len__(self):
+        """Return the number of strings of the pool."""
+        return len(self.strings)
+
+    def __getstate__(self):
+        """Pickle the strings only (their ids are their positions)."""
+        return self.strings
+
+    def __setstate__(self, state):
+        self.strings = state
+        self.ids = {string: string_id for string_id, string in enumerate(state)}
@@ -0,0 +1,210 @@
+# Module that contains the label index and the jump graph of a renpy script (built once after parsing)
+from AST import LabelNode, JumpNode, KeywordNode, UserNode
+from FlatAST import FlatAST
+
+START_LABEL = 'start' # Entry-point of every renpy script
+
+def label_key(label_name):
+    """
+    Returns the name used to index a label.
+
+    Args:
+        label_name (KeywordNode, UserNode or str): The name of a label (LabelNode.label_name or JumpNode.label_name).
+
+    Returns:
+        str: The name of the label (e.g., 'start' for KeywordNode(value='start')). The names read from the nodes are the
+            strings of the intern pool (see Intern.py), so comparing them with each other is an identity check.
+    """
+    if isinstance(label_name, KeywordNode):
+        return label_name.value
+    if isinstance(label_name, UserNode):
+        return label_name.name
+    return str(label_name)
+
+class LabelIndex():
+    """
+    Index of the labels of a renpy script and directed graph of the 'jump' statements between them.
+
+    Used by the initialisation phase (to verify 'jump' statements) and by the StateMachine (to find the order
+    of execution of the labels), but it can be queried by any tool.
+
+    Attributes:
+        labels: Dictionary label name -> LabelNode (first declaration of each name).
+        names: Label names, in the order they are written in the script.
+        jumps: Dictionary label name -> names of the labels used by its 'jump' statements (in the order they are written).
+    """
+    def __init__(self, ast_tree):
+        self.labels = {}
+        self.names = []
+        self.jumps = {}
+        if isinstance(getattr(ast_tree, 'flat', None), FlatAST): # View of a FlatAST: the labels and jumps are read from its arrays
+            labels = ast_tree.flat.labels()
+        else:
+            labels = ((node, node.label_name, [body_node.label_name for body_node in node if isinstance(body_node, JumpNode)])
+                      for node in ast_tree if isinstance(node, LabelNode))
+        for node, label_name, jump_names in labels:
+            name = label_key(label_name)
+            if name in self.labels: # Label declared twice: reported by the initialisation phase
+                continue
+            self.labels[name] = node
+            self.names.append(name)
+            self.jumps[name] = [label_key(jump_name) for jump_name in jump_names]
+
+    def __contains__(self, label_name):
+        """Return True if a label with this name exists."""
+        return label_key(label_name) in self.labels
+
+    def __len__(self):
+        """Return the number of labels."""
+        return len(self.labels)
+
+    def get(self, label_name):
+        """
+        Description
+        -----------
+        Finds a label and the label executed after it, in constant time.
+
+        Arguments
+        ---------
+        label_name : The name of the label (str, KeywordNode or UserNode).
+
+        Returns
+        -------
+        tuple: (LabelNode, next_label_name) if found, otherwise (None, None).
+        """
+        name = label_key(label_name)
+        if name not in self.labels:
+            return None, None
+        return self.labels[name], self.next_label(name)
+
+    def next_label(self, label_name):
+        """
+        Description
+        -----------
+        Returns the label executed after `label_name`: the target of its first 'jump' statement (like LabelNode.get_next_label).
+
+        Arguments
+        ---------
+        label_name : The name of the label.
+
+        Returns
+        -------
+        str or None: The name of the next label, or None if the label does not jump anywhere.
+        """
+        jumps = self.jumps.get(label_key(label_name))
+        return jumps[0] if jumps else None
+
+    def execution_order(self, start=START_LABEL):
+        """
+        Description
+        -----------
+        Returns the labels executed by the runtime, following the first 'jump' of each label from `start`.
+        If the jumps form a cycle, the order stops before the first label that would be executed twice.
+
+        Arguments
+        ---------
+        start : Name of the first label.
+
+        Returns
+        -------
+        list: The LabelNode of each executed label, in order.
+        """
+        order = []
+        visited = set()
+        name = label_key(start)
+        while name is not None and name in self.labels and name not in visited:
+            visited.add(name)
+            order.append(self.labels[name])
+            name = self.next_label(name)
+        return order
+
+    def reachable(self, start=START_LABEL):
+        """
+        Description
+        -----------
+        Returns the labels that can be reached from `start` using any 'jump' statement.
+
+        Arguments
+        ---------
+        start : Name of the first label.
+
+        Returns
+        -------
+        set: Names of the reachable labels (including `start` if it exists).
+        """
+        start = label_key(start)
+        if start not in self.labels:
+            return set()
+        reached = {start}
+        stack = [start]
+        while stack:
+            for target in self.jumps[stack.pop()]:
+                if target in self.labels and target not in reached:
+                    reached.add(target)
+                    stack.append(target)
+        return reached
+
+    def dead_labels(self, start=START_LABEL):
+        """Return the names of the labels that can never be reached from `start` (in the order they are written)."""
+        reached = self.reachable(start)
+        return [name for name in self.names if name not in reached]
+
+    def undefined_jumps(self):
+        """Return the (label name, target) pairs of the 'jump' statements using a label that does not exist."""
+        return [(name, target) for name in self.names for target in self.jumps[name] if target not in self.labels]
+
+    def cycles(self):
+        """
+        Description
+        -----------
+        Finds the cycles of the jump graph (strongly connected components with more than one label,
+        or a label jumping to itself), using an iterative version of Tarjan's algorithm.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        list: Each cycle is the list of the names of its labels.
+        """
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        counter = 0
+        for root in self.names:
+            if root in index:
+                continue
+            work = [(root, 0)] # (label name, index of the next jump to visit)
+            while work:
+                name, i = work.pop()
+                if i == 0:
+                    index[name] = lowlink[name] = counter
+                    counter += 1
+                    stack.append(name)
+                    on_stack.add(name)
+                targets = [target for target in self.jumps[name] if target in self.labels]
+                if i < len(targets):
+                    work.append((name, i + 1))
+                    target = targets[i]
+                    if target not in index:
+                        work.append((target, 0))
+                    elif target in on_stack:
+                        lowlink[name] = min(lowlink[name], index[target])
+                    continue
+                if lowlink[name] == index[name]: # name is the root of a strongly connected component
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == name:
+                            break
+                    if len(component) > 1 or name in self.jumps[name]:
+                        cycles.append(component[::-1])
+                if work: # Propagate the lowlink to the caller
+                    caller = work[-1][0]
+                    lowlink[caller] = min(lowlink[caller], lowlink[name])
+        return cycles
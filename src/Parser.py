@@ -1,8 +1,12 @@
 from Tokens import *
 from Error import DetailedError
+from Intern import InternPool
 from defs import *
 import re
 from AST import *
+from collections import deque
+import difflib
+import hashlib
 
 """
 This module defines all classes and logic related to parsing Ren'Py-like script files.
@@ -28,6 +32,72 @@ Parsing class hierarchy for Ren'Py files.
 - DISPATCH_PARSER: methods in DispatchParser subclasses (parsing via dispatch table)
 """
 
+class TokenStream():
+    """
+    Token source used by the parser.
+
+    If a list of tokens is given, every token stays available.
+    Otherwise, tokens are read on demand from any iterable (e.g., RPTokenizer.iter_tokens()) and only a small 
+    window is kept in memory (ring buffer): the tokens read ahead by token_peek and the last `history` consumed 
+    tokens, which is what vomit needs to "unconsume" tokens.
+    """
+    def __init__(self, tokens, history=16):
+        self.streamed = not isinstance(tokens, list) # If False, the whole list of tokens is kept
+        self.history = history # Maximum number of consumed tokens kept for vomit (streamed tokens only)
+        self.first_idx = 0 # Index (in the whole token stream) of self.buffer[0]
+        if self.streamed:
+            self.source = iter(tokens)
+            self.buffer = deque()
+        else:
+            if tokens and not isinstance(tokens[0], Token): # Tokens written in the legacy string format 'Token(type="...", value="...")'
+                tokens = [as_token(token) for token in tokens]
+            self.source = None # Every token is already inside self.buffer
+            self.buffer = tokens
+
+    def get(self, idx):
+        """
+        Description
+        -----------
+        Return the token at position `idx` of the token stream, reading new tokens from the source if needed.
+
+        Arguments
+        ---------
+        idx : int
+            Position of the token in the whole token stream.
+
+        Returns
+        -------
+        Token or int
+            The token, or FILE_EOF if the stream ends before `idx`.
+
+        Raises
+        ------
+        DetailedError
+            If the token was already released from the window.
+        """
+        offset = idx - self.first_idx
+        if offset < 0:
+            raise DetailedError(f'Token #{idx} is not available anymore. Only the last {self.history} consumed tokens are kept.')
+        buffer = self.buffer
+        while offset >= len(buffer):
+            if self.source is None:
+                return FILE_EOF
+            token = next(self.source, FILE_EOF)
+            if token == FILE_EOF:
+                self.source = None
+                return FILE_EOF
+            buffer.append(as_token(token))
+        return buffer[offset]
+
+    def release(self, idx):
+        """Forget the tokens located more than `history` tokens before `idx` (streamed tokens only)."""
+        if not self.streamed:
+            return
+        buffer = self.buffer
+        while buffer and self.first_idx < idx - self.history:
+            buffer.popleft()
+            self.first_idx += 1
+
 class RPParser():
     """
     Base class providing TOOL methods for all parser classes.
@@ -38,7 +108,7 @@ class RPParser():
      
     def __init__(self, list_tokens):
         self.idx = 0 # To browse through all the tokens
-        self.list_tokens = list_tokens # Contains the list of tokens (obtained from Tokens module)
+        self.tokens = TokenStream(list_tokens) # Contains the tokens (obtained from Tokens module): a list or any iterable such as RPTokenizer.iter_tokens()
         self.EOF = FILE_EOF # Used to indicate when the renpy file is ending.
 
     def eat_skip_until(self, expected_type, return_type_found = False): # TOOL
@@ -60,10 +130,12 @@ class RPParser():
             If return_type_found is False: True if `expected_type` found, False otherwise.
             If return_type_found is True: token type found, whether it matches `expected_type` or not.
         """
-        if self.idx < len(self.list_tokens):
-            type_found = __GET__TYPE__TOKEN__(self.list_tokens[self.idx])
+        token = self.tokens.get(self.idx)
+        if token != self.EOF:
+            type_found = token.type
             if type_found != expected_type: # We didn't find the expected token
                 self.idx += 1
+                self.tokens.release(self.idx)
                 if return_type_found:
                     return type_found
                 return False
@@ -89,7 +161,7 @@ class RPParser():
 
         Returns
         -------
-        str
+        Token
             The consumed token.
 
         Raises
@@ -98,9 +170,9 @@ class RPParser():
             If the token type or value does not match expectations.
         """
 
-        if self.idx < len(self.list_tokens):
-            token = self.list_tokens[self.idx]
-            token_type, token_value = __BREAK__TOKEN__(token)
+        token = self.tokens.get(self.idx)
+        if token != self.EOF:
+            token_type, token_value = token.type, token.value
             # if expected_type == "": # We use this special case to skip until we find expected_type in parse_image. 
             #    self.idx += 1
             #    return __GET__TYPE__TOKEN__(token)
@@ -109,6 +181,7 @@ class RPParser():
             if expected_value != "" and token_value != expected_value: # expected_token_value!= "" is for user defined variable: We don't want to raise an error.
                 raise DetailedError(f"Wrong value used for the token: {token_type}. Expected value was {expected_value} instead of {token_value}")
             self.idx += 1
+            self.tokens.release(self.idx)
             return token
         else:
             return self.EOF # End of token list
@@ -127,13 +200,14 @@ class RPParser():
 
         Returns
         -------
-        str
-            Token type if return_type is True, else the full token string.
+        str or Token
+            Token type if return_type is True, else the full token.
         """
-        if self.idx < len(self.list_tokens):
+        token = self.tokens.get(self.idx)
+        if token != self.EOF:
             if return_type:
-                return __GET__TYPE__TOKEN__(self.list_tokens[self.idx]) 
-            return self.list_tokens[self.idx]
+                return token.type
+            return token
         else:
             return self.EOF # End of token list
     
@@ -161,7 +235,7 @@ class RPParser():
         """
 
         if self.idx >= 0:
-            typ = __GET__TYPE__TOKEN__(self.list_tokens[self.idx])
+            typ = __GET__TYPE__TOKEN__(self.tokens.get(self.idx))
             if isinstance(expected_type, str):
                 if typ != expected_type:
                     self.idx -= 1
@@ -176,7 +250,7 @@ class RPParser():
             else:
                 raise DetailedError(f'Expected list or string as argument')
         else:
-            raise DetailedError(f'Index out of range. Coud not decrement index to find {expected_type}. Last item found: {self.list_tokens[self.idx+1]}')
+            raise DetailedError(f'Index out of range. Coud not decrement index to find {expected_type}. Last item found: {self.tokens.get(self.idx+1)}')
 
     def eat_optional(self, expected_type): # TOOL
         """
@@ -192,7 +266,7 @@ class RPParser():
 
         Returns
         -------
-        str or bool
+        Token or bool
             The consumed token if present, False if token was skipped.
         """
         token_type = self.token_peek() 
@@ -253,7 +327,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         """
         token = self.eat('STRING')
         token_value = __GET__VALUE__TOKEN__(token)
-        return StringNode(token_value) 
+        return StringNode(token_value, token.value_id) # The text was interned by the tokenizer (see Token.intern)
 
     def parse_user(self):
         """
@@ -277,7 +351,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         regex_user = r'^[A-Za-z_][A-Za-z0-9_]*$'
         if not re.match(regex_user, token_value):
             raise DetailedError(f"Wrong syntax used for variable: '{token_value}' is not a valid identifier")
-        return UserNode(token_value)
+        return UserNode(token_value, token.value_id) # The name was interned by the tokenizer (see Token.intern)
     
     def parse_comment(self):
         """
@@ -326,7 +400,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         elif token_type == self.EOF:
             return
         else:
-            print('token = ', self.list_tokens[self.idx])
+            print('token = ', self.tokens.get(self.idx))
             raise DetailedError(f"Unexpected token: {token_type}")
         
     def parse_jump(self): # BASIC_PARSER
@@ -381,7 +455,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
 
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT':
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT':
             return ReturnNode(value=None)
         
         # HANDLING USER token
@@ -416,7 +490,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line()
             return StopNode()
         
@@ -436,7 +510,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line()
             return StopNode(audio_type=audio_val)
         
@@ -449,7 +523,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
 
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line()
             return StopNode(audio_type=audio_val, fadeout=2) # 2 sec is default value of fadeout when user does not precise
 
@@ -490,7 +564,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         # HANDLING all the arguments inside the function (between the parenthesis)
         accepted_types = ['USER', 'STRING', 'COMMA', 'SPACE', 'ASSIGN', 'KEYWORD']
         accepted_values_KEYWORD = ['color', 'image']
-        while (self.idx < len(self.list_tokens) and self.token_peek() != 'RPAREN'):
+        while (self.token_peek() != self.EOF and self.token_peek() != 'RPAREN'):
             arg = self.token_peek(return_type=False)
             arg_token_type, arg_token_value = __BREAK__TOKEN__(arg)
             if arg_token_type not in accepted_types:
@@ -507,8 +581,8 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
                 else: # We are not storing this information:
                     self.eat(arg_token_type)
         
-        if self.idx >= len(self.list_tokens):
-            raise DetailedError(f"Wrong argument in function call. Expected RPAREN but got {self.list_tokens[len(self.list_tokens)-1]} instead.")
+        if self.token_peek() == self.EOF:
+            raise DetailedError(f"Wrong argument in function call. Expected RPAREN but got {self.tokens.get(self.idx-1)} instead.")
         
         # HANDLING end of function syntax
         self.eat('RPAREN')
@@ -543,7 +617,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
 
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT':
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT':
             return args
         
         # HANDLING fadein or loop
@@ -564,7 +638,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT':
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT':
             return args
         
         # HANDLING loop
@@ -621,7 +695,7 @@ class SimpleParser(RPParser): # All method in this class cannot exist inside syn
         
         # HANDLING the situation where the syntax is done 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT':
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT':
             return PlayNode(audio_type=_audio_type, audio_file=_audiofile)
         
         # HANDLING loop or fadein
@@ -860,7 +934,7 @@ class DispatchParser(SimpleParser): # Must inherit SimpleParser later on
         parse_method = ""
         dispatch_idx = [key for key in _syntax_handler]
         token_peek = self.token_peek(return_type=False)
-        key_type, key_value = __BREAK__TOKEN__(token_peek)
+        key_type, key_value = __BREAK__TOKEN__(token_peek) # token_peek can be self.EOF
         if key_type in dispatch_idx:
             parse_method = _syntax_handler[key_type]
         elif key_value in dispatch_idx:
@@ -1120,7 +1194,7 @@ class DispatchParser(SimpleParser): # Must inherit SimpleParser later on
 
         # HANDLING next token:
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line()
             return args
         
@@ -1184,7 +1258,7 @@ class DispatchParser(SimpleParser): # Must inherit SimpleParser later on
 
         # HANDLING whether the statement is done or not:
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line() 
             return args
         
@@ -1248,7 +1322,7 @@ class DispatchParser(SimpleParser): # Must inherit SimpleParser later on
         args['image_expression'] = img_expression
 
         # HANDLING next token, if it's EOF or NEWLINE we return the current args for parent function (parse_scene):
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             self.eof_line()
             return args
         
@@ -1309,7 +1383,7 @@ class SceneParser(DispatchParser):
 
         # HANDLING the situation where 'scene' is not followed by any other argument accepted by the renpy syntax 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             return SceneNode() # syntax corresponds to 'scene' only
         
         # We will build the arguments of SceneNode with all the dispatch handler. We start from here:
@@ -1378,7 +1452,7 @@ class ShowParser(DispatchParser):
 
         # HANDLING the situation where 'scene' is not followed by any other argument accepted by the renpy syntax 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             return ShowNode() # syntax corresponds to 'show' only
         
         # We will build the arguments of SceneNode with all the dispatch handler. We start from here:
@@ -1447,7 +1521,7 @@ class HideParser(DispatchParser):
 
         # HANDLING the situation where 'scene' is not followed by any other argument accepted by the renpy syntax 
         token = self.token_peek(return_type=False)
-        if token == self.EOF or __GET__TYPE__TOKEN__(token) == 'NEWLINE' or __GET__TYPE__TOKEN__(token) == 'COMMENT': 
+        if token == self.EOF or token.type == 'NEWLINE' or token.type == 'COMMENT': 
             return HideNode() # syntax corresponds to 'show' only
         
         # We will build the arguments of SceneNode with all the dispatch handler. We start from here:
@@ -1694,25 +1768,22 @@ class MasterParser(LabelParser):
 
         return ast_object
 
-    def parse_renpy_file(self):
+    def parse_toplevel_statements(self):
         """
-        Structure of AST:
-        List according to order you read renpy file.
-        Linkage resolution not done here.
+        Description
+        -----------
+        Parses every top-level statement until the end of the token stream.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        list
+            The AST nodes found, in the order they are written.
         """
         ast_master = []
-
-        # Program starts with 'label start' or we have an error (I impose this condition) -> Normally the error is raised during runtime, actually it's the same for all the error raised in this document but i don't care cause these methods will be run during runtime in fact.
-        found_label_start = False
-        for token in self.list_tokens:
-            token_value = __GET__VALUE__TOKEN__(token)
-            if token_value == 'start':
-                found_label_start = True
-        
-        if not found_label_start:
-            raise DetailedError('Syntax error. Renpy script must contain an entry-point: label start')
-        
-        # HANDLING the entire renpy file:
         token = self.token_peek(return_type=False)
         token_type, token_value = __BREAK__TOKEN__(token)
         while(token!= self.EOF):
@@ -1724,10 +1795,277 @@ class MasterParser(LabelParser):
                     ast_master.append(ast_tree)
             token = self.token_peek(return_type=False)
             token_type, token_value = __BREAK__TOKEN__(token)
+        return ast_master
+
+    @staticmethod
+    def check_label_start(ast_master):
+        """
+        Description
+        -----------
+        Verifies that the script contains the entry-point 'label start'.
+
+        Arguments
+        ---------
+        ast_master : list
+            The top-level AST nodes of the script.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        DetailedError
+            If no 'label start' is found.
+        """
+        for node in ast_master:
+            if isinstance(node, LabelNode) and isinstance(node.label_name, KeywordNode) and node.label_name.value == 'start':
+                return
+        raise DetailedError('Syntax error. Renpy script must contain an entry-point: label start')
+
+    def parse_renpy_file(self):
+        """
+        Structure of AST:
+        List according to order you read renpy file.
+        Linkage resolution not done here.
+        """
+        # Program starts with 'label start' or we have an error (I impose this condition) -> Normally the error is raised during runtime, actually it's the same for all the error raised in this document but i don't care cause these methods will be run during runtime in fact.
+        # Verified on the parsed statements (the same check for a list of tokens and for streamed tokens)
+        ast_master = self.parse_toplevel_statements()
+        self.check_label_start(ast_master)
 
         return MasterNode(children=ast_master)
 
 
+TOPLEVEL_BLOCK_REGEX = re.compile(r'^[^\s#]', re.MULTILINE) # First character of a line that is not indented, blank or a comment
+
+class TopLevelBlock():
+    """
+    Part of a renpy script that begins with a top-level statement (e.g., 'define', 'image', 'label') and ends 
+    right before the next one. The indented lines, blank lines and comments that follow the statement belong to the block.
+
+    Attributes:
+        key: Hash of the text of the block, used to find the blocks that did not change between two versions of a script.
+        first_line: Line of the script where the block begins (starts at 1).
+        nodes: The AST nodes found inside the block (usually a single node).
+    """
+    def __init__(self, key, first_line, nodes):
+        self.key = key
+        self.first_line = first_line
+        self.nodes = nodes
+
+    def has_label_only(self):
+        """Return True if every node of the block is a LabelNode (a change in this block cannot modify the symbols table)."""
+        return all(isinstance(node, LabelNode) for node in self.nodes)
+
+class IncrementalParser():
+    """
+    Parser keeping the result of the previous compilation of a renpy script, so that only the top-level blocks 
+    (see TopLevelBlock) edited since then are tokenized and parsed again.
+
+    The blocks of the new version of the script are matched with the blocks of the previous version
+    using their hash (difflib). The AST nodes of unchanged blocks are reused as they are, and the new
+    nodes are spliced with them inside the same MasterNode.
+
+    Every compilation of the script uses the same intern pool (`pool`, see Intern.py), so the ids of the reused nodes and
+    of the new nodes can be compared. The strings of the edited blocks stay in the pool after the edit: once it holds
+    POOL_COMPACT_RATIO times the strings of the AST, it is replaced by a pool of the strings of the AST only (see compact_pool).
+
+    Attributes set by parse_renpy_file (used by the initialisation phase, see VisualNovelGenerator.recompile):
+        unchanged_nodes: ids of the top-level nodes that were not modified and are written before the first
+            modified top-level statement that is not a label (their verification is still valid).
+        label_names_changed: True if a label was added, removed or renamed (every 'jump' must be verified again).
+        reparsed_blocks: Number of blocks tokenized and parsed by the last call of parse_renpy_file.
+        pool: The intern pool of the compilations (replaced by compact_pool).
+    """
+    def __init__(self, pool=None):
+        self.blocks = []
+        self.ast_tree = None
+        self.unchanged_nodes = set()
+        self.label_names_changed = True
+        self.reparsed_blocks = 0
+        self.pool = InternPool() if pool is None else pool
+        self.live_strings = 0 # Number of strings of the pool used by the AST (counted by the first compilation, then by compact_pool)
+
+    @staticmethod
+    def split_blocks(renpy_file):
+        """
+        Description
+        -----------
+        Splits a renpy script into its top-level blocks.
+
+        Arguments
+        ---------
+        renpy_file : str
+            The content of the renpy script.
+
+        Returns
+        -------
+        list
+            (first_line, text) of each block. The first block can contain only blank lines and comments.
+        """
+        starts = [match.start() for match in TOPLEVEL_BLOCK_REGEX.finditer(renpy_file)]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        starts.append(len(renpy_file))
+
+        blocks = []
+        line = 1
+        for begin, end in zip(starts, starts[1:]):
+            text = renpy_file[begin:end]
+            blocks.append((line, text))
+            line += text.count('\n')
+        return blocks
+
+    def parse_block(self, text, first_line):
+        """
+        Description
+        -----------
+        Tokenizes and parses a single top-level block.
+
+        Arguments
+        ---------
+        text : str
+            The text of the block.
+        first_line : int
+            Line of the script where the block begins (used for the position of the tokens).
+
+        Returns
+        -------
+        list
+            The AST nodes found inside the block.
+        """
+        tokenizer = RPTokenizer(text, pool=self.pool)
+        tokenizer.line = first_line
+        return MasterParser(tokenizer.iter_tokens()).parse_toplevel_statements()
+
+    @staticmethod
+    def get_label_names(blocks):
+        """Return the names of all the labels found in `blocks`."""
+        return {str(node.label_name) for block in blocks for node in block.nodes if isinstance(node, LabelNode)}
+
+    def parse_renpy_file(self, renpy_file):
+        """
+        Description
+        -----------
+        Parses a new version of the renpy script. Only the blocks that are not found in the previous version 
+        are tokenized and parsed.
+
+        Arguments
+        ---------
+        renpy_file : str
+            The content of the renpy script.
+
+        Returns
+        -------
+        MasterNode
+            The AST of the script. The MasterNode of the previous compilation is updated in place.
+
+        Raises
+        ------
+        DetailedError
+            If the script contains a syntax error or if 'label start' is missing.
+        """
+        try:
+            blocks, unchanged_blocks, first_change = self.match_blocks(renpy_file)
+        except (DetailedError, ValueError):
+            # HANDLING: A block cannot always be parsed alone (e.g., a string written on several lines where a line
+            # begins like a top-level statement). The whole script is parsed at once (this raises the error if the script is wrong).
+            nodes = MasterParser(RPTokenizer(renpy_file, pool=self.pool).iter_tokens()).parse_renpy_file().children
+            blocks = [TopLevelBlock(hashlib.sha1(renpy_file.encode('utf-8')).digest(), 1, nodes)]
+            unchanged_blocks, first_change = set(), 0
+            self.reparsed_blocks = 1
+
+        ast_master = [node for block in blocks for node in block.nodes]
+        MasterParser.check_label_start(ast_master)
+
+        self.unchanged_nodes = set()
+        idx = 0
+        for block in blocks:
+            for node in block.nodes:
+                if id(block) in unchanged_blocks and idx < first_change:
+                    self.unchanged_nodes.add(id(node))
+                idx += 1
+        self.label_names_changed = (not self.blocks) or self.get_label_names(self.blocks) != self.get_label_names(blocks)
+        self.blocks = blocks
+
+        if self.ast_tree is None:
+            self.ast_tree = MasterNode(children=ast_master)
+        else:
+            self.ast_tree.children = ast_master # Splice the new nodes inside the existing MasterNode
+        if not self.live_strings:
+            self.live_strings = len(self.pool) # First compilation: the pool only holds the strings of the script
+        elif len(self.pool) > POOL_COMPACT_RATIO * self.live_strings:
+            self.compact_pool()
+        return self.ast_tree
+
+    def compact_pool(self):
+        """
+        Description
+        -----------
+        Replaces the intern pool by a new pool holding only the strings of the current AST: the strings of the blocks
+        removed or edited since the last compaction are dropped. The ids of the nodes are given again (see AST.intern_tree).
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        None
+        """
+        self.pool = InternPool()
+        intern_tree(self.ast_tree, self.pool)
+        self.live_strings = len(self.pool)
+
+    def match_blocks(self, renpy_file):
+        """
+        Description
+        -----------
+        Matches the top-level blocks of the new version of the script with the blocks of the previous version, 
+        and parses the blocks that were added or modified.
+
+        Arguments
+        ---------
+        renpy_file : str
+            The content of the renpy script.
+
+        Returns
+        -------
+        tuple
+            (blocks, unchanged_blocks, first_change): the blocks of the new version, the ids of the blocks reused from 
+            the previous version, and the index (counted in AST nodes) of the first node written after a modified 
+            top-level statement that is not a label (number of nodes if there is none).
+        """
+        new_blocks = self.split_blocks(renpy_file)
+        keys = [hashlib.sha1(text.encode('utf-8')).digest() for _, text in new_blocks]
+
+        matcher = difflib.SequenceMatcher(None, [block.key for block in self.blocks], keys, autojunk=False)
+        blocks = []
+        unchanged_blocks = set()
+        first_change = None
+        self.reparsed_blocks = 0
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                for old_block, (first_line, _) in zip(self.blocks[i1:i2], new_blocks[j1:j2]):
+                    blocks.append(TopLevelBlock(old_block.key, first_line, old_block.nodes))
+                    unchanged_blocks.add(id(blocks[-1]))
+                continue
+
+            changed_blocks = []
+            for j in range(j1, j2):
+                first_line, text = new_blocks[j]
+                changed_blocks.append(TopLevelBlock(keys[j], first_line, self.parse_block(text, first_line)))
+            self.reparsed_blocks += len(changed_blocks)
+            if first_change is None and not all(block.has_label_only() for block in self.blocks[i1:i2] + changed_blocks):
+                first_change = sum(len(block.nodes) for block in blocks)
+            blocks.extend(changed_blocks)
+
+        if first_change is None:
+            first_change = sum(len(block.nodes) for block in blocks)
+        return blocks, unchanged_blocks, first_change
+
+
 # Top-level lines are statements written outside of any label, they are defined
 # inside TOPLEVEL_TOKENS_VALUES global variable.
 # They must appear before any label that uses them. Lines between labels
@@ -0,0 +1,139 @@
+# Module that loads the assets (images and audio) of the next states of the visual novel in background threads
+# (see StateMachine in visualnovel.py)
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from defs import PREFETCH_DEPTH, MUSIC_PREFETCH_DEPTH, PREFETCH_WORKERS
+
+def decode_image(path):
+    """
+    Decodes an image in a worker thread.
+
+    Args:
+        path (str): The resolved path of the image.
+
+    Returns:
+        pygame.Surface: The decoded image. It is not converted to the format of the screen yet (convert_alpha
+        must be called by the main thread, see StateMachine.load_image).
+    """
+    return pygame.image.load(path)
+
+def decode_sound(path):
+    """
+    Decodes a sound, a voice or a music in a worker thread.
+
+    Args:
+        path (str): The resolved path of the audio file.
+
+    Returns:
+        pygame.mixer.Sound: The decoded sound (the mixer must be initialised).
+    """
+    return pygame.mixer.Sound(path)
+
+ASSET_LOADERS = {
+    'image': decode_image,
+    'sound': decode_sound,
+    'music': decode_sound # Decoded so that two tracks can be mixed during a crossfade (see Audio.MusicScheduler)
+}
+
+class AssetPrefetcher():
+    """
+    Loads the assets used by the next states of the visual novel on a pool of worker threads.
+
+    The plan lists every asset reference in the order of execution of the labels (see StateMachine.get_assets_plan).
+    Each kind of asset ('image', 'sound' or 'music') has its own cursor: `advance(kind, state_idx)` schedules the
+    next `depth` assets of this kind used from the state `state_idx` (`music_depth` for the musics, which are much bigger once
+    decoded), and releases the assets of the states already passed. The main thread gets the loaded assets with `take`,
+    which waits if the asset is still being loaded, or with `request`, which never waits.
+
+    Attributes:
+        plans: Dictionary kind -> list of (state index, resolved path), in order of execution.
+        pending: Dictionary (kind, path) -> [future, index of the last state using it].
+        depths: Dictionary kind -> number of assets of this kind loaded in advance.
+    """
+    def __init__(self, plan, depth=PREFETCH_DEPTH, workers=PREFETCH_WORKERS, music_depth=MUSIC_PREFETCH_DEPTH):
+        self.depths = {kind: depth for kind in ASSET_LOADERS}
+        self.depths['music'] = music_depth
+        self.plans = {kind: [] for kind in ASSET_LOADERS}
+        for state_idx, kind, path in plan:
+            self.plans[kind].append((state_idx, path))
+        self.states = {kind: [state_idx for state_idx, _ in entries] for kind, entries in self.plans.items()} # For bisect
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+
+    def advance(self, kind, state_idx, is_loaded=None):
+        """
+        Description
+        -----------
+        Schedules the next assets of a kind (see `depths`), starting from the first one used by the state `state_idx`,
+        and drops the assets of this kind only used by previous states.
+
+        Arguments
+        ---------
+        kind : 'image', 'sound' or 'music'.
+        state_idx : Index of the state being computed (images) or displayed (audio).
+        is_loaded (optional) : Function path -> bool, True if the asset is already available (e.g., in the image cache).
+
+        Returns
+        -------
+        None
+        """
+        for key in [key for key, entry in self.pending.items() if key[0] == kind and entry[1] < state_idx]:
+            self.pending.pop(key)[0].cancel() # Only cancelled if it is still waiting for a worker
+        start = bisect_left(self.states[kind], state_idx)
+        for next_state_idx, path in self.plans[kind][start:start + self.depths[kind]]:
+            key = (kind, path)
+            if key in self.pending:
+                self.pending[key][1] = max(self.pending[key][1], next_state_idx)
+            elif is_loaded is None or not is_loaded(path):
+                self.pending[key] = [self.executor.submit(ASSET_LOADERS[kind], path), next_state_idx]
+
+    def take(self, kind, path):
+        """
+        Description
+        -----------
+        Returns a prefetched asset and forgets it (waits if it is still being loaded).
+
+        Arguments
+        ---------
+        kind : 'image', 'sound' or 'music'.
+        path : The resolved path of the asset.
+
+        Returns
+        -------
+        pygame.Surface, pygame.mixer.Sound or None: The asset (see decode_image and decode_sound),
+        or None if it was not prefetched or could not be loaded.
+        """
+        entry = self.pending.pop((kind, path), None)
+        if entry is None or entry[0].cancelled():
+            return None
+        try:
+            return entry[0].result()
+        except Exception:
+            # HANDLING: The asset is loaded again by the main thread, which reports the error (see StateMachine.load_image)
+            return None
+
+    def request(self, kind, path):
+        """
+        Description
+        -----------
+        Returns the future of an asset and forgets it, without waiting: the asset is scheduled now if it was not prefetched.
+
+        Arguments
+        ---------
+        kind : 'image', 'sound' or 'music'.
+        path : The resolved path of the asset.
+
+        Returns
+        -------
+        concurrent.futures.Future: The future of the asset (its result is raised again if it could not be loaded).
+        """
+        entry = self.pending.pop((kind, path), None)
+        if entry is None or entry[0].cancelled():
+            return self.executor.submit(ASSET_LOADERS[kind], path)
+        return entry[0]
+
+    def shutdown(self):
+        """Cancel the scheduled assets and stop the worker threads."""
+        self.pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
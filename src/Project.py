@@ -0,0 +1,191 @@
+# Module that compiles a renpy project split into several '.rpy' files (see VisualNovelGenerator.compile_project)
+import os
+from concurrent.futures import ProcessPoolExecutor
+from AST import MasterNode, DefineNode, ImageNode, LabelNode, PlayNode, StringNode, intern_tree
+from Error import DetailedError
+from Intern import InternPool
+from Labels import label_key
+from Parser import MasterParser
+from Tokens import RPTokenizer, read_script_chunks
+
+def find_project_scripts(project):
+    """
+    Returns the renpy scripts of a project.
+
+    Args:
+        project (str or list): A directory (searched recursively) or a list of '.rpy' files.
+
+    Returns:
+        list: Paths of the scripts. The files of a directory are sorted by path, so the order does not depend on the file system.
+    """
+    if isinstance(project, (list, tuple)):
+        return [str(path) for path in project]
+    scripts = []
+    for folder, _, files in os.walk(project):
+        scripts.extend(os.path.join(folder, file) for file in files if file.endswith('.rpy'))
+    return sorted(scripts)
+
+def parse_script(path, pool=None):
+    """
+    Tokenizes and parses one renpy script (run by the worker processes of ProjectCompiler).
+    Only the whole project must contain 'label start', so it is not checked here (see ProjectCompiler.merge).
+
+    Args:
+        path (str): Path of the script.
+        pool (InternPool): Intern pool filled by the tokenizer (by default, a new pool: a worker process cannot fill the
+            pool of the main process, see ProjectCompiler.parse_scripts).
+
+    Returns:
+        tuple: (path, MasterNode, None), or (path, None, error message) if the script cannot be parsed.
+    """
+    try:
+        return path, MasterNode(MasterParser(RPTokenizer(read_script_chunks(path), pool=pool).iter_tokens()).parse_toplevel_statements()), None
+    except (DetailedError, OSError, UnicodeDecodeError) as error:
+        # HANDLING: DetailedError reads the frame of its caller when it is created, so it is raised again by the main process
+        return path, None, str(error)
+
+class ProjectCompiler():
+    """
+    Front-end of a renpy project split into several scripts (e.g., one file per chapter).
+
+    Each script is tokenized and parsed by its own worker process (RPTokenizer and MasterParser), so the compilation time
+    depends on the number of cores rather than on the total number of lines. The MasterNodes are then merged into one:
+    like in Ren'Py, the top-level 'define' and 'image' statements of every file are placed first, so a chapter can use
+    a character declared in another file. The initialisation phase then checks the declarations of the merged MasterNode.
+
+    Like for a single script, the path of an image or an audio file is relative to the folder of the script where it is
+    written (see asset_dirs), so a chapter in a subdirectory finds the same assets alone or as part of the project.
+
+    Attributes:
+        scripts: Paths of the scripts of the project, in the order they are merged.
+        root: Directory of the project (common parent of the scripts).
+        sources: Dictionary id(top-level node) -> path of the script where it is written.
+        asset_dirs: Dictionary id(StringNode) -> folder of the script where it is written, for the strings that can be
+            the path of an asset (path of an 'image', value of a 'define', file of a 'play').
+        pool: Intern pool of the compilation of the project (see Intern.py), shared by every merged MasterNode.
+    """
+    def __init__(self, project, workers=None, pool=None):
+        self.scripts = find_project_scripts(project)
+        if not self.scripts:
+            raise DetailedError(f'Compilation error. No renpy script found in {project}')
+        self.root = project if not isinstance(project, (list, tuple)) else os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in self.scripts])
+        self.workers = workers # Number of worker processes (None: number of processors)
+        self.sources = {}
+        self.asset_dirs = {}
+        self.pool = InternPool() if pool is None else pool
+
+    def parse_scripts(self):
+        """
+        Description
+        -----------
+        Tokenizes and parses every script of the project in a process pool (in the main process if there is only
+        one script or one worker: sending the MasterNodes back to the main process is not free).
+        Each worker fills its own intern pool: the strings of the MasterNodes it sends back are interned again in `pool`.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        list: (path, MasterNode) tuples, in the order of self.scripts.
+        """
+        workers = min(self.workers or os.cpu_count() or 1, len(self.scripts))
+        if workers == 1:
+            results = [parse_script(path, self.pool) for path in self.scripts]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(parse_script, self.scripts))
+        for path, master_node, error in results:
+            if error is not None:
+                raise DetailedError(f'Compilation error in {path}: {error}')
+            if workers != 1:
+                intern_tree(master_node, self.pool)
+        return [(path, master_node) for path, master_node, _ in results]
+
+    def merge(self, parsed_scripts):
+        """
+        Description
+        -----------
+        Merges the MasterNodes of the scripts: the top-level 'define' and 'image' statements of every file first,
+        then the other statements (labels, ...), both in the order of the files.
+
+        Arguments
+        ---------
+        parsed_scripts : (path, MasterNode) tuples.
+
+        Returns
+        -------
+        MasterNode: The MasterNode of the whole project.
+
+        Raises
+        ------
+        DetailedError
+            If two scripts declare the same label, or if no script contains 'label start'.
+        """
+        declarations = []
+        statements = []
+        label_files = {}
+        for path, master_node in parsed_scripts:
+            folder = os.path.dirname(os.path.abspath(path))
+            for node in master_node:
+                self.sources[id(node)] = path
+                self.add_asset_dirs(node, folder)
+                if isinstance(node, (DefineNode, ImageNode)):
+                    declarations.append(node)
+                    continue
+                if isinstance(node, LabelNode):
+                    name = label_key(node.label_name)
+                    if name in label_files and label_files[name] != path: # Labels declared twice in the same file are reported by the initialisation phase
+                        raise DetailedError(f'Compilation error. The label {name} is declared in {label_files[name]} and in {path}')
+                    label_files.setdefault(name, path)
+                statements.append(node)
+        MasterParser.check_label_start(statements)
+        return MasterNode(declarations + statements)
+
+    def compile(self):
+        """
+        Description
+        -----------
+        Parses every script of the project in parallel and merges them (see parse_scripts and merge).
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        MasterNode: The MasterNode of the whole project.
+        """
+        return self.merge(self.parse_scripts())
+
+    def add_asset_dirs(self, node, folder):
+        """
+        Description
+        -----------
+        Records the folder of the script of a top-level node for each string of the node that can be the path of an asset.
+
+        Arguments
+        ---------
+        node : A top-level node (ImageNode, DefineNode, LabelNode, ...).
+        folder : The folder of the script where the node is written.
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(node, ImageNode):
+            values = [node.path]
+        elif isinstance(node, DefineNode):
+            values = [node.value]
+        elif isinstance(node, LabelNode):
+            values = [body_node.audio_file for body_node in node if isinstance(body_node, PlayNode)]
+        else:
+            return
+        for value in values:
+            if isinstance(value, StringNode):
+                self.asset_dirs[id(value)] = folder
+
+    def source_of(self, node):
+        """Return the path of the script where a top-level node is written (None if the node is not part of the project)."""
+        return self.sources.get(id(node))
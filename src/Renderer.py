@@ -0,0 +1,153 @@
+# Module that contains the retained-mode renderer of the visual novel: only the parts of the screen that changed
+# since the previous frame are drawn again (see StateMachine.render_state in visualnovel.py)
+import pygame
+
+FULL_REDRAW_RATIO = 0.5 # If the dirty rectangles cover more than this part of the screen, the whole screen is drawn again
+
+class RecordingSurface():
+    """
+    Stand-in for the screen that records the blits instead of drawing them.
+
+    The drawing code of the state machine (display_with_transition, TextBox.complex_draw) only uses `blit` and `get_size`,
+    so it can draw on a RecordingSurface without any change. Each blit is recorded as (source, position, alpha of the
+    source at the time of the blit).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.blits = []
+
+    def get_size(self):
+        """Return the size of the screen."""
+        return self.size
+
+    def get_width(self):
+        """Return the width of the screen."""
+        return self.size[0]
+
+    def get_height(self):
+        """Return the height of the screen."""
+        return self.size[1]
+
+    def blit(self, source, dest):
+        """Record a blit of `source` at the position `dest`, and return the area it covers."""
+        self.blits.append((source, (dest[0], dest[1]), source.get_alpha()))
+        return pygame.Rect(dest[0], dest[1], *source.get_size())
+
+def blit_rect(command):
+    """Return the area of the screen covered by a recorded blit."""
+    source, pos, _ = command
+    return pygame.Rect(pos[0], pos[1], *source.get_size())
+
+class DirtyRectRenderer():
+    """
+    Retained-mode renderer drawing the frames of the visual novel on a surface (the screen, or an off-screen surface).
+
+    Each frame is given as the list of the blits recorded on a RecordingSurface (images in the order of the layers, then the textbox).
+    The renderer compares it with the previous frame: only the rectangles covered by the blits that appeared, disappeared or moved
+    are cleared and drawn again (every blit touching them is replayed, so the result is the same as drawing the whole frame).
+    A frame identical to the previous one costs nothing, so a static dialogue does not draw anything.
+
+    Attributes:
+        surface: The surface where the frames are drawn.
+        clear_color: The color of the background.
+        previous: The blits of the last frame drawn (None: the whole surface must be drawn).
+    """
+    def __init__(self, surface, clear_color):
+        self.surface = surface
+        self.clear_color = clear_color
+        self.screen_rect = surface.get_rect()
+        self.previous = None
+        self.text_key = None # Content of the textbox recorded in self.text_blits
+        self.text_blits = []
+
+    def invalidate(self):
+        """Draw the whole surface at the next frame (e.g., the window was hidden then shown again)."""
+        self.previous = None
+
+    def recorder(self):
+        """Return a new RecordingSurface with the size of the surface."""
+        return RecordingSurface(self.surface.get_size())
+
+    def record_text(self, key, draw):
+        """
+        Description
+        -----------
+        Records the blits of the textbox. The textbox is only drawn again (text wrapping and font rendering) when its content changes.
+
+        Arguments
+        ---------
+        key : Hashable description of the content of the textbox (e.g., speaker, text and color of each dialogue).
+        draw : Function drawing the textbox on the RecordingSurface given as argument.
+
+        Returns
+        -------
+        list: The recorded blits.
+        """
+        if key != self.text_key:
+            recorder = self.recorder()
+            draw(recorder)
+            self.text_key = key
+            self.text_blits = recorder.blits
+        return self.text_blits
+
+    def get_dirty_rects(self, commands):
+        """
+        Description
+        -----------
+        Finds the areas of the surface that changed since the previous frame.
+
+        Arguments
+        ---------
+        commands : The blits of the new frame.
+
+        Returns
+        -------
+        list: The dirty rectangles (empty if nothing changed, the whole surface if most of it changed).
+        """
+        if self.previous is None:
+            return [self.screen_rect.copy()]
+        if len(commands) == len(self.previous) and all(
+                new[0] is old[0] and new[1] == old[1] and new[2] == old[2] for new, old in zip(commands, self.previous)):
+            return []
+        previous_keys = {(id(source), pos, alpha) for source, pos, alpha in self.previous}
+        keys = {(id(source), pos, alpha) for source, pos, alpha in commands}
+        changed = [command for command in commands if (id(command[0]), command[1], command[2]) not in previous_keys]
+        changed += [command for command in self.previous if (id(command[0]), command[1], command[2]) not in keys]
+        if not changed: # Same blits in another order (e.g., layers): the blits whose place in the order changed are drawn again
+            changed = [new for new, old in zip(commands, self.previous) if new[0] is not old[0] or new[1] != old[1]]
+        rects = [rect for rect in (blit_rect(command).clip(self.screen_rect) for command in changed) if rect.width and rect.height]
+        if sum(rect.width * rect.height for rect in rects) > FULL_REDRAW_RATIO * self.screen_rect.width * self.screen_rect.height:
+            return [self.screen_rect.copy()]
+        return rects
+
+    def render(self, commands):
+        """
+        Description
+        -----------
+        Draws a frame: the dirty rectangles are cleared, then every blit touching them is replayed (clipped to them).
+
+        Arguments
+        ---------
+        commands : The blits of the frame (see RecordingSurface).
+
+        Returns
+        -------
+        list: The dirty rectangles (to give to pygame.display.update). Empty if nothing changed.
+        """
+        dirty_rects = self.get_dirty_rects(commands)
+        for dirty_rect in dirty_rects:
+            self.surface.set_clip(dirty_rect)
+            self.surface.fill(self.clear_color, dirty_rect)
+            for source, pos, alpha in commands:
+                if not blit_rect((source, pos, alpha)).colliderect(dirty_rect):
+                    continue
+                current_alpha = source.get_alpha()
+                if alpha == current_alpha:
+                    self.surface.blit(source, pos)
+                else: # Alpha of a transition (the source can be shared by several states, see StateMachine.blit_with_alpha)
+                    source.set_alpha(alpha)
+                    self.surface.blit(source, pos)
+                    source.set_alpha(current_alpha)
+        self.surface.set_clip(None)
+        self.previous = commands
+        return dirty_rects
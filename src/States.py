@@ -0,0 +1,81 @@
+# Module that contains the containers used to store the states of the visual novel (see StateMachine in visualnovel.py)
+from collections import deque
+from defs import STATE_LOOKAHEAD, STATE_HISTORY
+
+class StateWindow():
+    """
+    Lazy state machine.
+
+    States are read on demand from a generator (e.g., StateMachine.iter_states) instead of being all computed
+    before the first frame. Only a small window is kept in memory: `lookahead` states ahead of the last state
+    requested, and `history` states behind it (rollback further than that is not possible).
+
+    It can be used like the dictionary of the eager state machine: `state_machine[idx]` and `idx in state_machine`.
+    """
+    def __init__(self, states, lookahead=STATE_LOOKAHEAD, history=STATE_HISTORY):
+        self.source = iter(states)
+        self.lookahead = lookahead
+        self.history = history
+        self.states = deque()
+        self.first_idx = 0 # Index of self.states[0]
+        self.exhausted = False # True once the generator has no more state
+
+    def fill(self, idx):
+        """
+        Description
+        -----------
+        Computes the states until the state `idx` (if the visual novel has enough states).
+
+        Arguments
+        ---------
+        idx : Index of the last state to compute.
+
+        Returns
+        -------
+        None
+        """
+        while not self.exhausted and self.first_idx + len(self.states) <= idx:
+            state = next(self.source, None)
+            if state is None:
+                self.exhausted = True
+            else:
+                self.states.append(state)
+
+    def __contains__(self, idx):
+        """Return True if the state `idx` exists and is still kept in memory (computes it if needed)."""
+        if idx < self.first_idx:
+            return False
+        self.fill(idx)
+        return idx < self.first_idx + len(self.states)
+
+    def __getitem__(self, idx):
+        """
+        Description
+        -----------
+        Returns the state `idx`. The next `lookahead` states are computed, and the states older than `history`
+        states before `idx` are released.
+
+        Arguments
+        ---------
+        idx : Index of the state.
+
+        Returns
+        -------
+        list: The state (list of scene objects).
+
+        Raises
+        ------
+        KeyError
+            If the state does not exist or was already released.
+        """
+        if idx not in self:
+            raise KeyError(idx)
+        self.fill(idx + self.lookahead)
+        while self.first_idx < idx - self.history:
+            self.states.popleft()
+            self.first_idx += 1
+        return self.states[idx - self.first_idx]
+
+    def __len__(self):
+        """Return the number of states computed so far (the number of states of the visual novel once every state was computed)."""
+        return self.first_idx + len(self.states)
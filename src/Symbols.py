@@ -0,0 +1,139 @@
+# Module that contains the symbol table filled during the initialisation phase (see VisualNovelGenerator.step4_initialize_master_node)
+from AST import UserNode
+from Intern import InternPool
+
+GLOBAL_SCOPE = 'global' # Scope of the statements written outside of any label
+
+def symbol_name(node):
+    """
+    Returns the name used to index a symbol.
+
+    Args:
+        node (UserNode or str): The identifier of the symbol.
+
+    Returns:
+        str: The name of the identifier (e.g., 'eileen' for UserNode(name='eileen')).
+    """
+    if isinstance(node, UserNode):
+        return node.name
+    return str(node)
+
+def image_name(image_expression):
+    """
+    Returns the name used to index an image.
+
+    Args:
+        image_expression (list): The tags of the image (e.g., [UserNode(name='bg'), UserNode(name='library')]).
+
+    Returns:
+        str: The tags separated by a space (e.g., 'bg library').
+    """
+    return ' '.join(symbol_name(tag) for tag in image_expression)
+
+class Symbol():
+    """
+    Declaration of a symbol found in the renpy script.
+
+    Attributes:
+        name: The name of the symbol (e.g., 'eileen', or 'bg library' for an image).
+        kind: The statement that declared the symbol ('define' or 'image').
+        scope: GLOBAL_SCOPE, or the name of the label where the symbol is declared.
+        position: Index of the declaring statement inside the MasterNode (declaration order).
+        node: The AST node of the declaration.
+    """
+    __slots__ = ('name', 'kind', 'scope', 'position', 'node')
+
+    def __init__(self, name, kind, scope, position, node):
+        self.name = name
+        self.kind = kind
+        self.scope = scope
+        self.position = position
+        self.node = node
+
+    def __repr__(self):
+        """Return a readable string representation of the Symbol."""
+        return f"Symbol(name={self.name!r}, kind={self.kind!r}, scope={self.scope!r}, position={self.position})"
+
+class SymbolTable(dict):
+    """
+    Symbols table of a renpy script.
+
+    It is still the dictionary used by the runtime (sections 'define', 'image', 'scene', 'show', 'hide', 'play', 'stop'),
+    but every declaration is also stored inside a hash index (id of the name -> Symbol, see symbol_id) for each kind
+    of symbol, so checking if a variable was declared is done in constant time, with integer keys.
+
+    The ids are the ids of the intern pool of the compilation (see Intern.py), given to the constructor: the pool is
+    pickled with the table, so a table loaded from the cache still matches the ids of the cached nodes.
+    """
+    def __init__(self, pool=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = InternPool() if pool is None else pool # Intern pool of the compilation (filled by the tokenizer)
+        self.index = {} # kind -> {id of the name in the intern pool -> Symbol}
+
+    def symbol_id(self, node, add=False):
+        """
+        Description
+        -----------
+        Returns the key used to index a symbol: the id of its name in the intern pool of the table.
+
+        Arguments
+        ---------
+        node : The identifier of the symbol (UserNode or str).
+        add : If True, a name that is not in the pool yet is added to it (declarations only: a lookup never changes the pool).
+
+        Returns
+        -------
+        int or None: The id of the name (e.g., UserNode.name_id, without reading the name), None if the name is not in the pool.
+        """
+        if isinstance(node, UserNode) and node.name_id is not None:
+            return node.name_id
+        name = symbol_name(node)
+        return self.pool.intern(name) if add else self.pool.find(name)
+
+    def declare(self, kind, name, node, position, scope=GLOBAL_SCOPE):
+        """
+        Description
+        -----------
+        Adds a declaration to the index. A symbol declared again keeps its last declaration (like the 'define' section).
+
+        Arguments
+        ---------
+        kind : The statement that declared the symbol ('define' or 'image').
+        name : The identifier of the symbol (UserNode or str).
+        node : The AST node of the declaration.
+        position : Index of the declaring statement inside the MasterNode.
+        scope : GLOBAL_SCOPE, or the name of the label where the symbol is declared.
+
+        Returns
+        -------
+        Symbol: The new symbol.
+        """
+        symbol = Symbol(symbol_name(name), kind, scope, position, node)
+        self.index.setdefault(kind, {})[self.symbol_id(name, add=True)] = symbol
+        return symbol
+
+    def lookup(self, name, kind='define'):
+        """
+        Description
+        -----------
+        Finds the declaration of a symbol.
+
+        Arguments
+        ---------
+        name : The identifier of the symbol (UserNode or str).
+        kind : The statement that declared the symbol ('define' or 'image').
+
+        Returns
+        -------
+        Symbol or None: The symbol, or None if it was not declared (yet).
+        """
+        return self.index.get(kind, {}).get(self.symbol_id(name))
+
+    def is_declared(self, name, kind='define'):
+        """Return True if the symbol `name` was declared (in constant time)."""
+        return self.symbol_id(name) in self.index.get(kind, {})
+
+    def clear(self):
+        """Remove every section and every symbol of the table."""
+        super().clear()
+        self.index.clear()
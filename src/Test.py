@@ -1,6 +1,5 @@
 from Parser import *
 from visualnovel import VisualNovelGenerator
-from Tokens import __BREAK__TOKEN__
 ##############################################################################
 ####### TO MODIFY BY THE USER OF THIS PROJECT (for testing purpose): #########
 
@@ -58,8 +57,9 @@ class DEBUG:
         """
         Description
         -----------
-        Loads the entire file into `self.file`.
-        Reads the file specified by `self.filename` and stores its content as a string in `self.file`.
+        Loads the file into `self.file`.
+        Stores in `self.file` a generator reading the file specified by `self.filename` by chunks
+        (see `Tokens.read_script_chunks`), so the whole file is never stored as a single string.
 
         Arguments
         ---------
@@ -69,8 +69,7 @@ class DEBUG:
         -------
         None
         """
-        with open(self.filename, 'r') as file:
-            self.file = file.read()
+        self.file = read_script_chunks(self.filename)
      
     def test_parse(self, MAX_TEST_NB, debug=False): 
         """
@@ -146,7 +145,7 @@ class DEBUG:
         ligne_idx = 1
         printed_line_num = False
         for e in list_token:
-            if 'NEWLINE' in e:
+            if e.type == 'NEWLINE':
                 if not printed_line_num:
                     print(f"#{ligne_idx} || NEWLINE")
                 else:
@@ -155,7 +154,7 @@ class DEBUG:
                 printed_line_num = False
                 continue
 
-            e_type, e_val = __BREAK__TOKEN__(e)
+            e_type, e_val = e.type, e.value
 
             if not printed_line_num:
                 print(f"#{ligne_idx} || ", end="")
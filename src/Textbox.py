@@ -1,5 +1,52 @@
 import pygame 
 import re
+from collections import OrderedDict
+from defs import TEXT_LAYOUT_CACHE_SIZE, SURFACE_CACHE_SIZE
+
+FONTS = {} # Font size -> default font (see get_font)
+GRADIENTS = OrderedDict() # (width, height, color1, color2, flip) -> gradient surface (see Gradient.create_vertical_gradient)
+TEXTBOXES = OrderedDict() # Parameters of TextBox.resize -> textbox surface (see TextBox.resize)
+
+def cache_surface(cache, key, surface):
+    """
+    Description
+    -----------
+    Stores a surface in one of the surface caches of this module (GRADIENTS, TEXTBOXES), and evicts the least recently
+    used one if the cache holds more than SURFACE_CACHE_SIZE surfaces.
+
+    Arguments
+    ---------
+    cache: The cache (OrderedDict).
+    key: The parameters used to create the surface.
+    surface: The surface.
+
+    Returns
+    -------
+    pygame.Surface: The surface.
+    """
+    cache[key] = surface
+    if len(cache) > SURFACE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return surface
+
+def get_font(size):
+    """
+    Description
+    -----------
+    Returns the default font with the given size. Each font is created once (pygame.font.SysFont is slow) and then reused.
+
+    Arguments
+    ---------
+    size: The size of the font.
+
+    Returns
+    -------
+    pygame.font.Font: The font.
+    """
+    font = FONTS.get(size)
+    if font is None:
+        font = FONTS[size] = pygame.font.SysFont(None, size)
+    return font
 
 def is_rgba(value):# Returns if value is a tuple of 4 values.
     """
@@ -65,8 +112,9 @@ class Gradient():
         Description
         -----------
         Creates a vertical gradient surface where the color transitions from the top color to 
-        the bottom color (or vice versa if `flip` is True). The gradient is drawn line by line 
-        across the height of the surface.
+        the bottom color (or vice versa if `flip` is True). The colors are computed for a column
+        of 1 pixel, which is then stretched to the width of the surface (a single call to pygame).
+        Gradients are cached by (size, colors, flip): the returned surface is shared and must not be modified.
 
         Arguments
         ---------
@@ -79,25 +127,30 @@ class Gradient():
         -------
         pygame.Surface: A surface containing the vertical gradient.
         """
+        key = (width, height, self.gradient_color1, self.gradient_color2, flip)
+        if key in GRADIENTS:
+            GRADIENTS.move_to_end(key)
+            return GRADIENTS[key]
         top_color = self.gradient_color1
         bottom_color = self.gradient_color2
         if flip:
             top_color = self.gradient_color2
             bottom_color = self.gradient_color1
-        gradient = pygame.Surface((width, height), pygame.SRCALPHA)
+        column = pygame.Surface((1, height), pygame.SRCALPHA)
         for y in range(height):
             ratio = y / height
             r = int(top_color[0] * (1 - ratio) + bottom_color[0] * ratio)
             g = int(top_color[1] * (1 - ratio) + bottom_color[1] * ratio)
             b = int(top_color[2] * (1 - ratio) + bottom_color[2] * ratio)
             a = int(top_color[3] * (1 - ratio) + bottom_color[3] * ratio)
-            pygame.draw.line(gradient, (r, g, b, a), (0, y), (width, y))
-        return gradient
+            column.set_at((0, y), (r, g, b, a))
+        return cache_surface(GRADIENTS, key, pygame.transform.scale(column, (width, height)))
         
 class TextBox(): 
     """Class for the textbox in game"""
 
     def __init__(self, width=0, height=0, color = (255, 100, 100, 220), offset_x = 10, offset_y=0, gr: Gradient | None = None, flip_gradient: bool=False):
+        self.layouts = OrderedDict() # Text layout cache (see get_layout), least recently used first
         self.resize(width, height, color, offset_x, offset_y, gr, flip_gradient)
 
     def resize(self, width=0, height=0, color = (255, 0, 0, 220), offset_x = 10, offset_y=0, gr: Gradient | None = None, flip_gradient: bool=False): # On rescale self.image
@@ -121,14 +174,14 @@ class TextBox():
 
         Returns
         -------
-        None: This function modifies the instance variable `self.textbox` to the resized surface.
+        None: This function modifies the instance variable `self.textbox` to the resized surface
+        (taken from the cache of textbox surfaces if a textbox was already built with the same parameters).
         """
         # protection
         if width <= 0 or height <= 0:
             return
         
-        # Surface displayed on screen in the main loop:
-        self.textbox = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.layouts.clear() # The layouts depend on the size of the textbox
         
         # Store basic attributes:
         self.width = width
@@ -142,6 +195,16 @@ class TextBox():
         if not hasattr(TextBox, "_panel_img"):
             TextBox._panel_img = pygame.image.load(r"../img/panel-031.png").convert_alpha()
         self.panel = TextBox._panel_img
+
+        # The textbox surface is only built once for the same parameters (shared by the textboxes, it is never modified)
+        key = (width, height, color, offset_x, offset_y, (gr.gradient_color1, gr.gradient_color2) if gr is not None else None, flip_gradient)
+        if key in TEXTBOXES:
+            TEXTBOXES.move_to_end(key)
+            self.textbox = TEXTBOXES[key]
+            return
+
+        # Surface displayed on screen in the main loop:
+        self.textbox = pygame.Surface((width, height), pygame.SRCALPHA)
         
         panel_w, panel_h = self.panel.get_size()
         texbox_img = self.panel
@@ -177,6 +240,7 @@ class TextBox():
         self.textbox.blit(texbox_left, (self.offset_x, 0))     
         self.textbox.blit(texbox_middle, (self.width//24 + self.offset_x, 0))  
         self.textbox.blit(texbox_right, (self.width - self.width//24 - self.offset_x, 0))
+        cache_surface(TEXTBOXES, key, self.textbox)
 
     def draw(self, screen, pos=None):
         """
@@ -221,23 +285,76 @@ class TextBox():
         # Blit the textbox itself
         screen.blit(self.textbox, pos_textbox)
 
+        # Then the speaker and the lines of text (laid out and rendered once, see get_layout)
+        for surface, (offset_x, offset_y) in self.get_layout(text, speaker, font, color):
+            screen.blit(surface, (pos_textbox[0] + offset_x, pos_textbox[1] + offset_y))
+
+    def get_layout(self, text: str = None, speaker: str = None, font: pygame.font.Font | None = None, color: tuple = (0, 0, 0)):
+        """
+        Description
+        -----------
+        Returns the layout of a dialogue, from the text layout cache if it was already computed.
+        The cache is keyed by (text, speaker, color, font) and stores the rendered surfaces, so a dialogue displayed
+        during many frames is wrapped and rendered only once. The least recently used layouts are evicted
+        (TEXT_LAYOUT_CACHE_SIZE layouts are kept, for the current size of the textbox).
+
+        Arguments
+        ---------
+        text (optional): The text to be displayed inside the textbox.
+        speaker (optional): The name of the speaker.
+        font (optional): The font used for the text (see complex_draw).
+        color (optional): The color of the text and speaker name.
+
+        Returns
+        -------
+        list: (surface, (offset_x, offset_y)) tuples, offsets relative to the position of the textbox.
+        """
+        key = (text, speaker, tuple(color) if isinstance(color, list) else color, font)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            self.layouts.move_to_end(key)
+            return layout
+        layout = self.layout_text(text, speaker, font, color)
+        self.layouts[key] = layout
+        if len(self.layouts) > TEXT_LAYOUT_CACHE_SIZE:
+            self.layouts.popitem(last=False)
+        return layout
+
+    def layout_text(self, text: str = None, speaker: str = None, font: pygame.font.Font | None = None, color: tuple = (0, 0, 0)):
+        """
+        Description
+        -----------
+        Wraps the text to the width of the textbox (including new lines), centers it, and renders the speaker name
+        and each line of text.
+
+        Arguments
+        ---------
+        text (optional): The text to be displayed inside the textbox. If None, no text is laid out.
+        speaker (optional): The name of the speaker to be displayed above the text. If None, no speaker is laid out.
+        font (optional): The font to be used for the text. If None, the default font will be used.
+        color (optional): The color of the text and speaker name.
+
+        Returns
+        -------
+        list: (surface, (offset_x, offset_y)) tuples, offsets relative to the position of the textbox.
+        """
+        layout = []
+
         # Use default font if none provided
         if font is None:
-            font = pygame.font.SysFont(None, 30)
+            font = get_font(30)
 
-        # Draw speaker if provided
+        # Speaker if provided
         if speaker:
-            font = pygame.font.SysFont(None, 40)
             speaker = speaker.capitalize()
             speaker_offset_x = 90
             speaker_offset_y = 25
-            speaker_surf = font.render(speaker, True, color)
-            speaker_pos = (pos_textbox[0] + speaker_offset_x, pos_textbox[1] + speaker_offset_y)
-            screen.blit(speaker_surf, speaker_pos)
-            font = pygame.font.SysFont(None, 30)
+            speaker_surf = get_font(40).render(speaker, True, color)
+            layout.append((speaker_surf, (speaker_offset_x, speaker_offset_y)))
+            font = get_font(30)
 
         if text is None:
-            return  # No text to draw
+            return layout  # No text to draw
 
         # Maximum width for text inside textbox
         max_width = self.width - 2 * self.offset_x
@@ -288,14 +405,15 @@ class TextBox():
         line_height = font.get_linesize()
         total_height = line_height * len(lines)
 
-        # Starting y position to vertically center the text in the textbox
-        start_y = pos_textbox[1] + (self.height - total_height) // 2
+        # Starting y offset to vertically center the text in the textbox
+        start_y = (self.height - total_height) // 2
 
-        # Draw each line centered
+        # Each line centered
         for i, line in enumerate(lines):
             if line == "":
                 continue  # Skip empty lines (but they still take up space in the layout)
             text_surf = font.render(line, True, color)
-            text_x = pos_textbox[0] + (self.width - text_surf.get_width()) // 2
+            text_x = (self.width - text_surf.get_width()) // 2
             text_y = start_y + i * line_height
-            screen.blit(text_surf, (text_x, text_y))
\ No newline at end of file
+            layout.append((text_surf, (text_x, text_y)))
+        return layout
@@ -1,81 +1,196 @@
 from Error import DetailedError
 from defs import *
 from AST import *
+from Intern import InternPool
 import re
 
+class Token():
+    """
+    Compact record used to store a token found by RPTokenizer.
+
+    Attributes:
+        type: The token type (e.g., 'KEYWORD', 'USER'). The same string object is shared by every token of this type.
+        type_id: Integer id of the token type (index of the type inside TOKEN_TYPES).
+        value: The text of the token as written in the renpy script (e.g., 'define', 'eileen', '"Hello"'). Once interned by the tokenizer
+            (except for the comments), it is the string of the intern pool, so the same text is stored once, however many tokens use it.
+        value_id: Id of the text inside the intern pool of the tokenizer (None if the token is not interned, e.g., a comment).
+        line: Line of the renpy script where the token begins (starts at 1, 0 if unknown).
+        column: Column of the renpy script where the token begins (starts at 1, 0 if unknown).
+    """
+    __slots__ = ('type', 'type_id', 'value', 'value_id', 'line', 'column')
+
+    def __init__(self, token_type, value, line=0, column=0):
+        self.type_id = TOKEN_TYPE_IDS[token_type]
+        self.type = TOKEN_TYPES[self.type_id]
+        self.value = value
+        self.value_id = None
+        self.line = line
+        self.column = column
+
+    def intern(self, pool):
+        """Replace the text of the token by the string of the intern pool `pool` and store its id (a comment, almost always unique, is not interned)."""
+        if self.type_id != COMMENT_TYPE_ID:
+            self.value_id = value_id = pool.intern(self.value)
+            self.value = pool.strings[value_id]
+
+    @classmethod
+    def from_string(cls, token_str):
+        """
+        Builds a Token from the legacy string format 'Token(type="...", value="...")'.
+
+        Args:
+            token_str (str): Token in the legacy string format.
+
+        Returns:
+            Token: The decoded token.
+
+        Raises:
+            DetailedError: If the string is not a valid legacy token.
+        """
+        if not token_str.startswith('Token(type="') or ('", value="' not in token_str) or not token_str.endswith('")'):
+            raise DetailedError(f'Cannot decode token from string: {token_str}')
+        token_type, value = token_str[len('Token(type="'):-len('")')].split('", value="', 1)
+        return cls(token_type, value)
+
+    def __str__(self):
+        """Return the token in the legacy string format 'Token(type="...", value="...")'."""
+        return f"Token(type=\"{self.type}\", value=\"{self.value}\")"
+
+    def __repr__(self):
+        """Return a readable string representation of the Token, including its position in the script."""
+        return f"Token(type={self.type!r}, value={self.value!r}, line={self.line}, column={self.column})"
+
+def as_token(token):
+    """
+    Compatibility shim: returns `token` as a Token object, decoding it if it uses the legacy string format.
+
+    Args:
+        token (Token or str): A token object or a legacy token string.
+
+    Returns:
+        Token: The token object.
+    """
+    if isinstance(token, Token):
+        return token
+    return Token.from_string(token)
+
+def read_script_chunks(path, chunk_size=SCRIPT_CHUNK_SIZE):
+    """
+    Generator reading a renpy script by fixed-size chunks, so the whole file is never loaded in memory.
+    The file is only opened when the first chunk is requested.
+
+    Args:
+        path (str): Path of the renpy script.
+        chunk_size (int): Number of characters of each chunk.
+
+    Yields:
+        str: The next chunk of the script (the last one can be shorter).
+    """
+    with open(path, 'r', encoding="utf-8") as file:
+        chunk = file.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = file.read(chunk_size)
+
+# ==============================
+#  Tables used by the compiled scanner (built once from TOKENS)
+# ==============================
+
+LEXEME_TYPES = {} # Reverse map of TOKENS: lexeme -> token type (first declaration wins, like word_is_token)
+for _token_type, _lexemes in TOKENS.items():
+    for _lexeme in _lexemes:
+        LEXEME_TYPES.setdefault(_lexeme, _token_type)
+
+SINGLE_CHAR_TOKENS = frozenset(lexeme for lexeme in LEXEME_TYPES if len(lexeme) == 1) # e.g. '=', '(', ' ', '\n', '"'
+WORD_REGEX = re.compile(r'[A-Za-z0-9_]*') # Keywords, builtins, functions and USER identifiers
+STRING_END_REGEX = { # Closing quote of a string literal: the same quote character, not preceded by a backslash
+    quote: re.compile(r'(?<!\\)' + re.escape(quote)) for quote in TOKENS['STRING']
+}
+
 class RPTokenizer():
     """Handles tokenization of a renpy script."""
-    def __init__(self, renpy_file): # renpy_file is the renpy script
+    def __init__(self, renpy_file, compiled=True, pool=None): # renpy_file is the renpy script, or an iterable of chunks of it (see read_script_chunks)
         self.TOKENS = TOKENS
-        self.renpy_file = renpy_file
+        self.pool = InternPool() if pool is None else pool # Intern pool of the compilation (see Intern.py), filled with the text of the tokens
+        self.compiled = compiled # If True, use the compiled scanner (single pass using LEXEME_TYPES), otherwise the character-by-character scanner
+        self.chunks = None # Chunks of the script not read yet (only used by the compiled scanner)
+        if isinstance(renpy_file, str):
+            self.renpy_file = renpy_file
+        elif compiled:
+            self.renpy_file = '' # Buffer holding the part of the script being scanned, filled by read_chunk
+            self.chunks = iter(renpy_file)
+        else:
+            self.renpy_file = ''.join(renpy_file) # The character-by-character scanner needs the whole script
         self.idx = 0 # To navigate letter by letter in the file 
+        self.line = 1 # Line of the current character (used to store the position of each token)
+        self.line_start = 0 # Index of the first character of the current line
+        self.scanner = None # Generator used by the compiled scanner (created on the first call of tokenizer_from_file)
 
     @staticmethod
-    def __BREAK__TOKEN__(token_str):
+    def __BREAK__TOKEN__(token):
         """
-        Extracts the type and value from a token string.
+        Extracts the type and value from a token.
 
         Args:
-            token_str (str): Token in the format 'Token(type="...", value="...")'
+            token (Token or str): Token object, or token string in the legacy format 'Token(type="...", value="...")'
 
         Returns:
             tuple: (token_type, token_value), or (FILE_EOF, FILE_EOF) if the token is invalid
         """
-        if token_str == FILE_EOF or (not isinstance(token_str, str)) or (not token_str.startswith('Token(type="')) or ('value="' not in token_str):
+        if isinstance(token, Token):
+            return token.type, token.value
+        if token == FILE_EOF or (not isinstance(token, str)) or (not token.startswith('Token(type="')) or ('value="' not in token):
             return FILE_EOF, FILE_EOF  # Return EOF tuple for abnormal cases
-        token_type = token_str.split('type')[1].split(', value')[0]
-        token_type = token_type[2:len(token_type)-1]
-        value = token_str.split('value')[1]
-        value = value[2:len(value)-2]
-        return token_type, value
+        token = Token.from_string(token)
+        return token.type, token.value
     
     @staticmethod
-    def __GET__TYPE__TOKEN__(token_str):
+    def __GET__TYPE__TOKEN__(token):
         """
-        Extracts only the type from a token string.
+        Extracts only the type from a token.
 
         Args:
-            token_str (str): Token in the format 'Token(type="...", value="...")'
+            token (Token or str): Token object, or token string in the legacy format 'Token(type="...", value="...")'
 
         Returns:
             str: Token type, or FILE_EOF if the token is EOF
         """
-        if token_str == FILE_EOF:
-            return token_str
-        token_type = token_str.split('type')[1].split(', value')[0]
-        token_type = token_type[2:len(token_type)-1]
-        return token_type
+        if isinstance(token, Token):
+            return token.type
+        if token == FILE_EOF:
+            return token
+        return Token.from_string(token).type
 
     @staticmethod
-    def __GET__VALUE__TOKEN__(token_str):
+    def __GET__VALUE__TOKEN__(token):
         """
-        Extracts only the value from a token string.
+        Extracts only the value from a token.
 
         Args:
-            token_str (str): Token in the format 'Token(type="...", value="...")'
+            token (Token or str): Token object, or token string in the legacy format 'Token(type="...", value="...")'
 
         Returns:
             str: Token value, or FILE_EOF if the token is EOF
         """
-        if token_str == FILE_EOF:
-            return token_str
-        value = token_str.split('value')[1]
-        value = value[2:len(value)-2]
-        return value
+        if isinstance(token, Token):
+            return token.value
+        if token == FILE_EOF:
+            return token
+        return Token.from_string(token).value
     
     @staticmethod
     def __TOKEN__(token_type, word_or_letter):
         """
-        Constructs a token string from type and value.
+        Constructs a token from type and value.
 
         Args:
             token_type (str): Type of the token
             word_or_letter (str): Value of the token
 
         Returns:
-            str: Formatted token string in the format 'Token(type="...", value="...")'
+            Token: Token object (its position in the script is set by tokenizer_from_file)
         """
-        return f"Token(type=\"{token_type}\", value=\"{word_or_letter}\")"
+        return Token(token_type, word_or_letter)
     
     def word_is_token(self, word): 
         """
@@ -85,7 +200,7 @@ class RPTokenizer():
             word (str): Word written by the user in the script.
 
         Returns:
-            str or bool: Token string in the format 'Token(type="...", value="...")' if the word is a token; 
+            Token or bool: Token object if the word is a token; 
                         False otherwise.
         """
         for key in TOKENS:
@@ -102,7 +217,7 @@ class RPTokenizer():
         Reads characters from the current position until the end of the line to create a COMMENT token.
 
         Returns:
-            str: Token string in the format 'Token(type="COMMENT", value="...")' containing the comment text.
+            Token: COMMENT token containing the comment text.
         """
         token_value = ''
         while (self.idx < len(self.renpy_file) and self.renpy_file[self.idx] != '\n'):
@@ -115,7 +230,7 @@ class RPTokenizer():
         Reads a floating-point number around the current '.' character and returns it as a DOT token.
 
         Returns:
-            str: Token string in the format 'Token(type="DOT", value=...)' containing the float value.
+            Token: DOT token containing the float value (stored as text, e.g. '2.0').
 
         Raises:
             ValueError: If the parsed number does not match a valid float format (digits.digits).
@@ -142,7 +257,7 @@ class RPTokenizer():
     
         # UPDATE self.idx to not keep reading '.' character
         self.idx = j
-        token_value = float(token_value)
+        token_value = str(float(token_value))
         return self.__TOKEN__('DOT', token_value)
 
     def get_string_token(self, word):
@@ -162,7 +277,49 @@ class RPTokenizer():
         # If loop ends without finding closing quote
         raise DetailedError("Unterminated string literal")
     
+    def iter_tokens(self):
+        """
+        Generator yielding the tokens of the renpy script one by one, until the end of the file.
+        Tokens are created on demand, so the tokenizer can be pipelined with the parser (see Parser.TokenStream)
+        without storing the whole list of tokens.
+        """
+        if self.compiled:
+            if self.scanner is None:
+                self.scanner = self._compiled_scanner()
+            yield from self.scanner
+            return
+
+        token = self.tokenizer_from_file()
+        while token != FILE_EOF:
+            yield token
+            token = self.tokenizer_from_file()
+
     def tokenizer_from_file(self):
+        """
+        Returns the next token of the renpy script, or FILE_EOF once the end of the file is reached.
+        The position (line, column) of the token inside the script is stored on the returned Token.
+        """
+        if self.compiled:
+            if self.scanner is None:
+                self.scanner = self._compiled_scanner()
+            return next(self.scanner, FILE_EOF)
+
+        start_idx = self.idx
+        token = self._scan_token()
+        if token == FILE_EOF:
+            return token
+        token.line = self.line
+        token.column = start_idx - self.line_start + 1
+        token.intern(self.pool)
+
+        # Keep track of the current line (NEWLINE tokens, but also strings written on several lines)
+        newlines = self.renpy_file.count('\n', start_idx, self.idx)
+        if newlines:
+            self.line += newlines
+            self.line_start = self.renpy_file.rfind('\n', start_idx, self.idx) + 1
+        return token
+
+    def _scan_token(self):
         """
         Tokenizer for a subset of the Ren'Py scripting language.
         - Recognizes keywords, symbols, identifiers, and string literals.
@@ -177,7 +334,7 @@ class RPTokenizer():
             
             if token_word != False:
                 # Case 1: Keyword detected
-                # Example: word="define" → token_word is 'Token(type="KEYWORD", value="define")'
+                # Example: word="define" → token_word is Token(type='KEYWORD', value='define')
                 # At this point, we need to check the next character to ensure the syntax is valid 
                 if token_char != False:
                     # If the next character is itself a token (like '(' for a function call), return keyword token immediately
@@ -230,6 +387,141 @@ class RPTokenizer():
             # Case 5: End of file is reached
             return FILE_EOF
 
+    def read_chunk(self, keep_from):
+        """
+        Appends the next chunk of the script to the buffer of the compiled scanner.
+        The part of the buffer before `keep_from` is dropped, so the buffer only holds the token being
+        scanned (which can be split across several chunks) and the previous one.
+
+        Args:
+            keep_from (int): Index of the first character of the buffer that must be kept.
+
+        Returns:
+            bool: True if a chunk was appended, False if the whole script was already read.
+        """
+        if self.chunks is None:
+            return False
+        for chunk in self.chunks:
+            if chunk != '':
+                self.renpy_file = self.renpy_file[keep_from:] + chunk
+                self.idx -= keep_from
+                self.line_start -= keep_from # Can become negative: the current line began inside a dropped chunk
+                return True
+        self.chunks = None # Every chunk was read
+        return False
+
+    def _compiled_scanner(self):
+        """
+        Compiled scanner for a subset of the Ren'Py scripting language (generator).
+        Yields exactly the same tokens as _scan_token, in a single pass over the script: each word is read
+        with WORD_REGEX and its type is found with a single lookup inside LEXEME_TYPES, instead of
+        scanning TOKENS for every character.
+        When the script is read by chunks, a token reaching the end of the buffer may continue in the next
+        chunk (word, string, comment, float): the next chunk is read with read_chunk and the token is scanned again.
+        """
+        word_match = WORD_REGEX.match
+        lexeme_types = LEXEME_TYPES
+        single_char_tokens = SINGLE_CHAR_TOKENS
+        pool = self.pool
+        text = self.renpy_file
+        length = len(text)
+        line, line_start = self.line, self.line_start
+        idx = prev_idx = self.idx # prev_idx: beginning of the previous token (get_token_float may read the digits before the '.')
+
+        while True:
+            if idx >= length:
+                # End of the buffer: read the next chunk, or stop at the end of the script
+                self.idx, self.line_start = idx, line_start
+                if not self.read_chunk(prev_idx):
+                    break
+                text = self.renpy_file
+                length = len(text)
+                idx, line_start, prev_idx = self.idx, self.line_start, 0
+
+            # Accumulate the longest word made of letters, digits and underscores (can be empty)
+            end = word_match(text, idx).end()
+            word = text[idx:end]
+            char = text[end] if end < length else ''
+            column = idx - line_start + 1
+            incomplete = False # True if the token may continue inside the next chunk
+
+            if char == '':
+                # EOF reached right after the word → flush as token
+                incomplete = True
+                token = Token(lexeme_types.get(word, 'USER'), word, line, column)
+                next_idx = end
+            elif char not in single_char_tokens:
+                # Neither a word character nor a known single-character token
+                self.idx = end
+                if word in lexeme_types:
+                    raise DetailedError(f'Syntax error while creating token. The character """{char}""" is not accepted for this project.')
+                raise DetailedError(f'Syntax error while creating token. The following character is not accepted by Renpy language: {char}')
+            elif word in lexeme_types:
+                # Keyword (or builtin/function) followed by a single-character token
+                token = Token(lexeme_types[word], word, line, column)
+                next_idx = end
+            elif word != '' and char != '"' and char != "'" and char != '.':
+                # USER-defined identifier (the current character is read at the next iteration)
+                token = Token('USER', word, line, column)
+                next_idx = end
+            elif char == '"' or char == "'":
+                # String literal (any word written right before the quote is kept inside the token, like _scan_token does)
+                closing = STRING_END_REGEX[char].search(text, end + 1)
+                if closing is None:
+                    if self.chunks is None:
+                        self.idx = end
+                        raise DetailedError("Unterminated string literal")
+                    incomplete = True
+                else:
+                    next_idx = closing.end()
+                    token = Token('STRING', text[idx:next_idx], line, column)
+                    if '\n' in token.value: # String written on several lines
+                        line += token.value.count('\n')
+                        line_start = text.rfind('\n', idx, next_idx) + 1
+            elif char == '.':
+                # Float, e.g. "fadeout 2.0"
+                j = end + 1
+                while j < length and text[j].isdigit():
+                    j += 1
+                if j == length and self.chunks is not None:
+                    incomplete = True
+                else:
+                    self.idx = end
+                    token = self.get_token_float()
+                    token.line, token.column = line, column
+                    next_idx = self.idx
+            elif char == '#':
+                # Comment until the end of the line
+                next_idx = text.find('\n', end)
+                if next_idx == -1:
+                    incomplete = True
+                    next_idx = length
+                token = Token('COMMENT', text[end:next_idx], line, column)
+            else:
+                # Regular single-character token
+                token = Token(lexeme_types[char], char, line, column)
+                next_idx = end + 1
+                if char == '\n':
+                    line += 1
+                    line_start = next_idx
+
+            if incomplete and self.chunks is not None:
+                # The token reaches the end of the buffer: read the next chunk and scan the token again
+                self.idx, self.line_start = idx, line_start
+                if self.read_chunk(prev_idx):
+                    text = self.renpy_file
+                    length = len(text)
+                    idx, line_start, prev_idx = self.idx, self.line_start, 0
+                    continue
+                if char != '' and char != '#':
+                    continue # Last chunk read: scan the string or the float again to report the error
+
+            prev_idx = idx
+            self.idx = idx = next_idx
+            self.line, self.line_start = line, line_start
+            token.intern(pool)
+            yield token
+
 # ==============================
 #  Expose static utility methods (to be used easily by other module)
 # ==============================
@@ -239,6 +531,9 @@ __GET__TYPE__TOKEN__ = RPTokenizer.__GET__TYPE__TOKEN__
 __GET__VALUE__TOKEN__ = RPTokenizer.__GET__VALUE__TOKEN__
 
 __all__ = [
+    "Token",
+    "as_token",
+    "read_script_chunks",
     "RPTokenizer",
     "__BREAK__TOKEN__",
     "__GET__TYPE__TOKEN__",
@@ -0,0 +1,180 @@
+# Module that animates the transitions of the images of the visual novel ('with fade', 'with slideleft', ...) according
+# to the real time elapsed between the frames (see StateMachine.display_with_transition in visualnovel.py)
+
+def linear(t):
+    """Easing curve: constant speed."""
+    return t
+
+def ease_in(t):
+    """Easing curve: starts slowly, then accelerates."""
+    return t * t
+
+def ease_out(t):
+    """Easing curve: starts quickly, then decelerates."""
+    return 1 - (1 - t) ** 2
+
+def ease_in_out(t):
+    """Easing curve: accelerates during the first half, then decelerates."""
+    return 2 * t * t if t < 0.5 else 1 - 2 * (1 - t) ** 2
+
+EASINGS = {
+    'linear': linear,
+    'ease_in': ease_in,
+    'ease_out': ease_out,
+    'ease_in_out': ease_in_out
+}
+
+class TransitionType():
+    """
+    Base class of the transition types. A transition is a function of its progress (between 0 and 1, after the easing curve):
+    it gives the position and the opacity of the image, so a frame never depends on the previous frames.
+
+    Attributes:
+        duration: Default duration in seconds (used when the transition record does not give one).
+        easing: Name of the easing curve in EASINGS.
+        fades: True if the transition changes the opacity of the image.
+    """
+    duration = 1.0
+    easing = 'linear'
+    fades = False
+
+    def start_position(self, img, pos, transition, screen_size):
+        """Return the position of the image when the transition begins (None: the transition cannot be played)."""
+        return pos
+
+    def position(self, start_pos, pos, progress):
+        """Return the position of the image for a progress between 0 and 1."""
+        return pos
+
+    def alpha(self, progress):
+        """Return the opacity of the image for a progress between 0 and 1 (None: the image is drawn as it is)."""
+        return None
+
+class Fade(TransitionType):
+    """The image appears from transparent to opaque."""
+    fades = True
+
+    def alpha(self, progress):
+        return int(255 * progress)
+
+class Dissolve(Fade):
+    """Same as fade (there is no previous image to dissolve from)."""
+
+class Slide(TransitionType):
+    """The image slides horizontally from outside of the screen to its position."""
+    duration = 2.0
+    easing = 'ease_out'
+
+    def __init__(self, from_left=False):
+        self.from_left = from_left
+
+    def start_position(self, img, pos, transition, screen_size):
+        # Same x as the positions 'offscreenleft' and 'offscreenright' (see StateMachine.get_position_from_size)
+        return (-img.get_width() if self.from_left else screen_size[0], pos[1])
+
+    def position(self, start_pos, pos, progress):
+        return (start_pos[0] + (pos[0] - start_pos[0]) * progress, pos[1])
+
+class MoveIn(Slide):
+    """The image moves horizontally from the position of the previous image with the same tag."""
+    def start_position(self, img, pos, transition, screen_size):
+        last_pos = transition.get('last_pos', False)
+        if last_pos is False: # No previous image with the same tag
+            return None
+        return last_pos
+
+TRANSITIONS = {
+    'fade': Fade(),
+    'dissolve': Dissolve(),
+    'slide': Slide(),
+    'slideright': Slide(),
+    'slideleft': Slide(from_left=True),
+    'movein': MoveIn()
+}
+
+def register_transition(name, transition_type):
+    """
+    Adds a transition type (or replaces one), usable by the statements 'with <name>'.
+
+    Args:
+        name (str): The name of the transition.
+        transition_type (TransitionType): The transition.
+
+    Returns:
+        None
+    """
+    TRANSITIONS[name] = transition_type
+
+class TransitionEngine():
+    """
+    Animates the transitions according to the time elapsed since they began.
+
+    The clock of the engine is advanced once per frame with the real duration of the previous frame (see `advance`,
+    given the value of pygame.time.Clock.tick by generate_VN). The progress of a transition only depends on the time
+    elapsed since its first frame, so an animation lasts the same time at any frame rate, and dropped frames are simply
+    skipped (nothing is computed for them).
+
+    The images can be shared by several states, so their alpha is never changed: a fading image is drawn from a private
+    copy made when the transition begins, and released when it ends. The state of a transition is stored in its record
+    (the 'transition' dictionary of an image object): 'animate', 'start_time', 'start_pos', 'elapsed', 'alpha' and 'surface'.
+
+    Attributes:
+        time: Time of the clock of the engine, in seconds.
+    """
+    def __init__(self):
+        self.time = 0.0
+
+    def advance(self, seconds):
+        """Advance the clock of the engine (called once per frame with the duration of the previous frame)."""
+        self.time += seconds
+
+    def update(self, transition, img, pos, screen_size):
+        """
+        Description
+        -----------
+        Computes the current frame of a transition. A finished transition gets the type 'none', so it is not played
+        again (e.g., when going back to the state with the left key).
+
+        Arguments
+        ---------
+        transition : The transition record of the image (None: no transition).
+        img : The image.
+        pos : The final position of the image.
+        screen_size : The size (width, height) of the screen.
+
+        Returns
+        -------
+        tuple: (surface to draw, position, True if the transition is finished or if there is none).
+        """
+        transition_type = TRANSITIONS.get(transition['type']) if transition is not None else None
+        if transition_type is None: # 'none', or a transition that is not handled
+            return img, pos, True
+        if not transition['animate']: # First frame of the transition
+            start_pos = transition_type.start_position(img, pos, transition, screen_size)
+            if start_pos is None:
+                transition['type'] = 'none'
+                return img, pos, True
+            transition['animate'] = True
+            transition['start_time'] = self.time
+            transition['start_pos'] = start_pos
+            if transition_type.fades:
+                transition['surface'] = img.copy()
+
+        transition['elapsed'] = self.time - transition['start_time']
+        duration = transition.get('duration') or transition_type.duration
+        t = min(transition['elapsed'] / duration, 1.0) # normalized 0..1
+        if t >= 1.0:
+            transition['type'] = 'none' # We only do the animation once when going forward (rollback animation is not permitted)
+            transition['alpha'] = None
+            transition.pop('surface', None)
+            return img, pos, True
+
+        progress = EASINGS[transition_type.easing](t)
+        new_pos = transition_type.position(transition['start_pos'], pos, progress)
+        alpha = transition_type.alpha(progress)
+        transition['alpha'] = alpha
+        if alpha is None:
+            return img, new_pos, False
+        faded = transition['surface']
+        faded.set_alpha(alpha)
+        return faded, new_pos, False
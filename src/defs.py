@@ -2,6 +2,22 @@ FILE_EOF = 2376537
 
 FPS = 60
 
+STATE_LOOKAHEAD = 3 # Lazy state machine: number of states computed ahead of the current one
+STATE_HISTORY = 100 # Lazy state machine: number of previous states kept for rollback
+
+IMAGE_CACHE_BUDGET = 256 * 1024 * 1024 # Maximum number of bytes of decoded/scaled images kept in memory (see Assets.ImageCache)
+SOUND_CACHE_BUDGET = 128 * 1024 * 1024 # Maximum number of bytes of decoded sounds, voices and playing musics kept in memory (see Assets.SoundCache)
+PREFETCH_DEPTH = 8 # Number of upcoming images and sounds loaded in advance (see Prefetch.AssetPrefetcher)
+MUSIC_PREFETCH_DEPTH = 1 # Number of upcoming musics decoded in advance (a decoded music takes about 10 MB per minute, not counted in SOUND_CACHE_BUDGET until it plays)
+PREFETCH_WORKERS = 2 # Number of worker threads used to load the assets in advance
+TEXT_LAYOUT_CACHE_SIZE = 256 # Number of dialogues whose wrapped and rendered lines are kept by each TextBox (see TextBox.get_layout)
+SURFACE_CACHE_SIZE = 16 # Number of gradient surfaces and of textbox surfaces kept for the next resizes (see Textbox.py)
+
+COMPILER_VERSION = '1.5' # Must be changed when the tokenizer, the parser or the AST nodes change (invalidates the '.rpyc' cache files, see Cache.py)
+
+SCRIPT_CHUNK_SIZE = 1 << 20 # Number of characters read at once when a renpy script is loaded (see Tokens.read_script_chunks)
+POOL_COMPACT_RATIO = 2 # The intern pool kept by the incremental compilation is rebuilt once it holds this many times the strings of the AST (see IncrementalParser)
+
 # We can declare a user variable with the following: define, image, color
 # We must check that the variable was previously declared in the following: define (right side of assign token), scene, show, hide, with, label (name), return, jump
 TOKENS = {
@@ -44,6 +60,12 @@ TOKENS = {
             'SPACE' : [' ']
         }
 
+# Every token type the tokenizer can emit ('USER' is for identifiers that are not inside TOKENS).
+# A token type is stored as an integer id (its index in TOKEN_TYPES) inside Tokens.Token
+TOKEN_TYPES = tuple(TOKENS) + ('USER',)
+TOKEN_TYPE_IDS = {token_type: type_id for type_id, token_type in enumerate(TOKEN_TYPES)}
+COMMENT_TYPE_ID = TOKEN_TYPE_IDS['COMMENT'] # The text of the comments is not interned (see Token.intern)
+
 
 
 TOPLEVEL_TOKENS_VALUES = [ # NEWLINE is not included here but handled inside parser methods
@@ -4,32 +4,55 @@
 # MODULE that creates a visual novel game from a MasterNode AST.
 import sys
 import os
-from Parser import MasterParser
-from Tokens import RPTokenizer, __BREAK__TOKEN__
+from Parser import MasterParser, IncrementalParser
+from Tokens import RPTokenizer, read_script_chunks
+from Cache import ASTCache
+from Project import ProjectCompiler
+from FlatAST import FlatAST
+from Intern import InternPool
+from Symbols import SymbolTable, image_name
+from Labels import LabelIndex
 from defs import FILE_EOF
 from AST import *
 from Error import *
 from Textbox import *
 import copy
-from defs import FPS
+from defs import FPS, STATE_LOOKAHEAD, STATE_HISTORY
+from States import StateWindow
+from Assets import ImageCache
+from Prefetch import AssetPrefetcher
+from Renderer import DirtyRectRenderer
+from Transitions import TransitionEngine
+from Audio import AudioManager
+import time
+import zlib
 
 class StateMachine():
     """
     A class to create a visual novel video game from a dictionnary (ast tree) using the pygame library.
     """
-    def __init__(self, symbol_table:dict, label_table:dict, ast_tree, path_to_renpyf):
+    def __init__(self, symbol_table:dict, label_table:dict, ast_tree, path_to_renpyf, label_index=None, lazy=False, lookahead=STATE_LOOKAHEAD, history=STATE_HISTORY, image_cache=None, prefetch=True, instrumentation=None, asset_dirs=None):
         self.path_to_renpyfile = path_to_renpyf
+        self.asset_dirs = asset_dirs or {} # Project: folder of the script of each asset path (see Project.ProjectCompiler.asset_dirs)
         self.symbol_table = symbol_table
         self.label_table = label_table
         self.ast_tree = ast_tree
+        self.label_index = label_index if label_index is not None else LabelIndex(ast_tree) # Label lookup and jump graph (see Labels.py)
         self.clear_color = (30, 30, 30)
+        self.image_cache = image_cache if image_cache is not None else ImageCache() # Decoded and scaled images (see Assets.py)
+        self.prefetch = prefetch # If True, the assets of the next states are loaded in background threads (see Prefetch.py)
+        self.prefetcher = None # Created by create_state_machine
+        self.audio_enabled = True # False if the mixer cannot be used (see run_headless)
+        self.exit_on_error = True # If False, a missing asset raises a DetailedError instead of exiting the program (see run_headless)
+        self.instrumentation = instrumentation # Stage timers and per-frame breakdown, None if disabled (see Instrumentation.py)
         
         self.state_machine = {}
-        self.audio_tracking = {
-            'voice': '',
-            'sound': ''
-        } # Used by stop instruction in renpy (it's hard to keep track of the all the audio with only self.state_machine)
+        self.lazy = lazy # If True, states are computed on demand (see create_state_machine)
+        self.lookahead = lookahead # Lazy mode: number of states computed ahead of the current one
+        self.history = history # Lazy mode: number of previous states kept for rollback
+        self.audio = AudioManager() # Decoded sounds and channels of each type of audio (see Audio.py)
         self.transition_ongoing = False # Set to True whenever any transition animation if ongoing and used to prevent skipping to next self.idx until transition is finished
+        self.transitions = TransitionEngine() # Animates the transitions according to the elapsed time (see Transitions.py)
         
         self.idx = 0 # To navigate inside self.state_machine
         self.layer_order_statements = ['master'] # Contains list of all layers created from start to finish of the script
@@ -80,32 +103,117 @@ class StateMachine():
             nested_dict = nested_dict[tag]
         return next(iter(nested_dict.values()))
     
-    def load_image(self, img_path): # Only load image we need to save some ressources
+    def load_image(self, img_path, size=None, transform=None): # Only load image we need to save some ressources
         """
         Description
         -----------
         Load an image from the specified path and return a Pygame surface with transparency.
-        Exits the program if the image cannot be loaded.
+        The decoded image and its scaled variants are kept in self.image_cache, so an image used many times
+        is read from the disk and scaled only once. Exits the program if the image cannot be loaded.
 
         Arguments
         ---------
         img_path : The relative path to the image file.
+        size (optional) : The size of the screen, used by the transform.
+        transform (optional) : 'window' to scale the image to the screen (backgrounds), 'sprite' to scale it
+                               to a width of 500 pixels (characters), None to keep the image as it is.
 
         Returns
         -------
         pygame.Surface: A Pygame surface object containing the loaded image with transparency.
         """
-        image_surface = ""
-        path = os.path.dirname(self.path_to_renpyfile) + '/' + img_path[1:-1]
-        try:
-            image_surface = pygame.image.load(path).convert_alpha()  # convert_alpha() pour gérer la transparence
-        except:
-            print(f'Runtime execution error. Cannot load file {path}')
-            pygame.quit()
-            sys.exit()
+        path = self.resolve_asset_path(img_path)
+        image_surface = self.image_cache.get((path, size, transform))
+        if image_surface is not None:
+            return image_surface
+
+        decoded_surface = self.image_cache.get((path, None, None))
+        if decoded_surface is None:
+            try:
+                decoded_surface = self.prefetcher.take('image', path) if self.prefetcher is not None else None # Decoded by a worker thread
+                if decoded_surface is None:
+                    decoded_surface = pygame.image.load(path)
+                decoded_surface = decoded_surface.convert_alpha()  # convert_alpha() pour gérer la transparence (main thread only)
+            except:
+                if not self.exit_on_error:
+                    raise DetailedError(f'Runtime execution error. Cannot load file {path}')
+                print(f'Runtime execution error. Cannot load file {path}')
+                pygame.quit()
+                sys.exit()
+            self.image_cache.put((path, None, None), decoded_surface)
+
+        image_surface = decoded_surface
+        if transform is not None and decoded_surface.get_size() != size:
+            if transform == 'window':
+                image_surface = self.scale_image_to_wind(decoded_surface, size)
+            elif transform == 'sprite':
+                image_surface = scale_img(decoded_surface, desired_width=500)
+            self.image_cache.put((path, size, transform), image_surface)
         return image_surface
     
-    def get_scenenode_img(self, node):
+    def resolve_asset_path(self, asset_path):
+        """
+        Description
+        -----------
+        Returns the path of an asset (image or audio) written in the renpy script, relative to the folder of the script.
+
+        Arguments
+        ---------
+        asset_path : The path written in the script, with its quotes (e.g., '"images/bg.png"').
+
+        Returns
+        -------
+        str: The normalized path of the file.
+        """
+        return os.path.normpath(os.path.dirname(self.path_to_renpyfile) + '/' + asset_path[1:-1])
+
+    def get_asset_path(self, string_node):
+        """
+        Description
+        -----------
+        Returns the path of an asset written in the script, in the form expected by resolve_asset_path. In a project, the
+        path written in a script is relative to the folder of this script, so it is made relative to the project root.
+
+        Arguments
+        ---------
+        string_node : The StringNode of the path (e.g., the path of an 'image' statement).
+
+        Returns
+        -------
+        str: The path, with its quotes.
+        """
+        folder = self.asset_dirs.get(id(string_node))
+        if folder is None: # Single script (or a string that is not written in a script of the project)
+            return string_node.value
+        path = os.path.relpath(os.path.join(folder, string_node.value[1:-1]), os.path.abspath(os.path.dirname(self.path_to_renpyfile)))
+        return string_node.value[0] + path + string_node.value[-1]
+
+    def get_scenenode_img_path(self, node):
+        """
+        Description
+        -----------
+        Retrieve the path of the image associated with a scene node (without loading it).
+        Supports both direct string paths and user-defined tokens.
+
+        Arguments
+        ---------
+        node : The scene node containing an image expression.
+
+        Returns
+        -------
+        str: The path of the image, as written in the script (with its quotes).
+        """
+        img_token = self.get_nested_img(node.image_expression) # Get the image to load from the tags
+        if isinstance(img_token, StringNode):
+            return self.get_asset_path(img_token)
+        # img_token is expected to be a UserToken (refer to parse_image to see all the syntax handled)
+        # We need to fetch actual value of this variable (which could also be another variable...)
+        img_path_token = self.get_user_value(img_token)
+        if not isinstance(img_path_token, StringNode): # could be a usertoken, no ?
+            raise DetailedError(f"Runtime execution error. Expected a string but got {img_path_token} instead")
+        return self.get_asset_path(img_path_token)
+
+    def get_scenenode_img(self, node, size=None, transform=None):
         """
         Description
         -----------
@@ -115,25 +223,14 @@ class StateMachine():
         Arguments
         ---------
         node : The scene node containing an image expression.
+        size (optional) : The size of the screen (see load_image).
+        transform (optional) : 'window', 'sprite' or None (see load_image).
 
         Returns
         -------
         pygame.Surface: A Pygame surface object containing the loaded image.
         """
-        img_token = self.get_nested_img(node.image_expression) # Get the image to load from the tags
-        image_surface = ""
-        if isinstance(img_token, StringNode):
-            img_path = img_token.value
-            image_surface = self.load_image(img_path)
-        else: # img_token is expected to be a UserToken (refer to parse_image to see all the syntax handled)
-            img_path_token = self.get_user_value(img_token)
-            if not isinstance(img_path_token, StringNode): # could be a usertoken, no ?
-                raise DetailedError(f"Runtime execution error. Expected a string but got {img_path_token} instead")
-            img_path = img_path_token.value
-            # We need to fetch actual value of this variable (which could also be another variable...)
-            image_surface = self.load_image(img_path)
-            # print('img path = ', img_path)
-        return image_surface
+        return self.load_image(self.get_scenenode_img_path(node), size, transform)
     
     def get_position_from_size(self, obj_size, transform, screen_size, debug=False):
         """
@@ -268,11 +365,10 @@ class StateMachine():
             'pos': None,
             'transition': {
                 'type': None,
-                'duration': 1,
-                'animate': False, # When True, we must execute the animation for a specific duration (not necessarily 'duration' key)
-                'pos_anim': (0, 0), # Used by slide type of transition, stores 
+                'duration': None, # In seconds (None: default duration of the type of transition, see Transitions.TRANSITIONS)
+                'animate': False, # When True, the animation has begun (see Transitions.TransitionEngine)
                 'last_pos': (0, 0), # start pos for movin transition is always the final pos of previous show statement associated with same tag
-                'elapsed': 0 # For linear interpolation for smooth animation in general 
+                'elapsed': 0 # Seconds elapsed since the beginning of the animation
             }
         }
     
@@ -312,16 +408,14 @@ class StateMachine():
         """
         return {
             'music': { # play only once by default, loop attribute can make it play indefinitely.
-                'canal': False, # If False, the music is not playing currently
                 'file': '',
-                'loop': False # By default we de not loop the music
+                'loop': False, # By default we de not loop the music
+                'fadein': None # Duration of the fadein in seconds (None: no fadein)
             }, 
             'sound': { # stops automatically when next dialogue is loaded (user clicked to display the next scene). Never loops.
-                'canal': False, # If False, the sound is not playing currently
                 'file': ''
             }, 
             'voice': { # stops automatically when new dialogue is loaded
-                'canal': False, # If False, the voice is not playing currently
                 'file': ''
             } 
         }
@@ -330,7 +424,7 @@ class StateMachine():
         """
         Description
         -----------
-        Retrieve a label node and its next label from the AST by name.
+        Retrieve a label node and its next label by name (constant time, using the label index).
 
         Arguments
         ---------
@@ -340,15 +434,7 @@ class StateMachine():
         -------
         tuple: A tuple (LabelNode, next_label_name) if found, otherwise (None, None).
         """
-        for node in self.ast_tree: 
-            if isinstance(node, LabelNode):
-                if isinstance(node.label_name, KeywordNode) and node.label_name.value == label_name:
-                # print(node.get_next_label())
-                    return node, node.get_next_label()
-                elif isinstance(node.label_name, UserNode) and node.label_name.name == label_name:
-                    return node, node.get_next_label()
-
-        return None, None
+        return self.label_index.get(label_name)
 
     def get_user_value(self, user_token):
         """
@@ -384,7 +470,8 @@ class StateMachine():
 
         Starting from the 'start' label, this method follows each subsequent
         label reference (via jump instruction in renpy) to determine
-        the execution sequence of labels.
+        the execution sequence of labels. If the jumps form a cycle, the
+        sequence stops before the first label that would be executed twice.
 
         Arguments
         ---------
@@ -395,20 +482,68 @@ class StateMachine():
         list: Ordered list of label nodes representing execution flow.
         """
         # returns list of labels to execute in order
-        label_order = []
-        label_order_name = ['start']
-        jump = "" # contains next label name
-        label_node, next_label_name = self.get_label('start')
-        
-        while next_label_name != None and label_node!= None:
-            label_order.append(label_node)
-            label_order_name.append(next_label_name)
-            label_node, next_label_name = self.get_label(next_label_name)
+        return self.label_index.execution_order('start')
 
-        if label_node != None:
-            label_order.append(label_node)
-            
-        return label_order
+    def get_assets_plan(self):
+        """
+        Description
+        -----------
+        Lists the assets used by the visual novel, in the order of execution of the labels (see get_labels_order),
+        with the index of the first state using them (same numbering as iter_states: one state per dialogue).
+        Used by the prefetcher to load the assets of the next states in advance.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        list: (state index, kind, resolved path) tuples, where kind is 'image', 'sound' or 'music'.
+        """
+        plan = []
+        state_idx = 0
+        for label_body in self.get_labels_order():
+            for node in label_body:
+                try:
+                    if isinstance(node, StringNode) or isinstance(node, DialogueNode):
+                        state_idx += 1
+                    elif isinstance(node, SceneNode) or isinstance(node, ShowNode):
+                        plan.append((state_idx, 'image', self.resolve_asset_path(self.get_scenenode_img_path(node))))
+                    elif isinstance(node, PlayNode):
+                        audio_value = node.audio_file
+                        if isinstance(audio_value, UserNode):
+                            audio_value = self.get_user_value(audio_value)
+                        kind = 'music' if node.audio_type == 'music' else 'sound'
+                        plan.append((state_idx, kind, self.resolve_asset_path(self.get_asset_path(audio_value))))
+                except (DetailedError, KeyError, AttributeError, TypeError):
+                    # HANDLING: The asset is not prefetched, the error is reported when the state using it is computed
+                    continue
+        return plan
+
+    def advance_prefetcher(self, kinds, state_idx):
+        """
+        Description
+        -----------
+        Schedules the loading of the next assets used from the state `state_idx` (does nothing if prefetching is disabled).
+
+        Arguments
+        ---------
+        kinds : The kinds of assets to schedule ('image', 'sound' and/or 'music').
+        state_idx : Index of the state being computed (images) or displayed (audio).
+
+        Returns
+        -------
+        None
+        """
+        if self.prefetcher is None:
+            return
+        for kind in kinds:
+            if kind == 'image':
+                self.prefetcher.advance(kind, state_idx, lambda path: (path, None, None) in self.image_cache)
+            elif kind == 'sound':
+                self.prefetcher.advance(kind, state_idx, lambda path: path in self.audio.cache)
+            else:
+                self.prefetcher.advance(kind, state_idx)
 
     def remove_img_obj(self, tag, chainblock):
         """
@@ -491,15 +626,18 @@ class StateMachine():
         """
         Description
         -----------
-        Creates a deep, isolated copy of the given chainblock to prevent shared references.
+        Creates an immutable snapshot of the given chainblock (copy-on-write state).
 
         Explanation:
             When assigning `self.state_machine[self.idx] = chainblock`, Python only stores
-            a reference to the same list. Any later modification to `chainblock` will 
-            automatically affect previously stored states in `self.state_machine`.
+            a reference to the same list. Any later modification to `chainblock` (objects added
+            or removed) would automatically affect previously stored states in `self.state_machine`.
 
-            This method ensures each saved state is independent by manually copying 
-            each element and duplicating non-serializable objects such as Pygame Surfaces.
+            The snapshot is a tuple referencing the objects of the chainblock: objects are never modified
+            once they are added to the chainblock (they are replaced instead), so the objects that did not 
+            change between two states (and their Pygame Surfaces) are shared instead of being copied. 
+            The only data modified while a state is displayed (transition progress and alpha) is stored 
+            inside the small 'transition' record of each image object, never on the shared Surface.
 
         Arguments
         ---------
@@ -507,26 +645,9 @@ class StateMachine():
 
         Returns
         -------
-        list: A new list containing deep copies of all objects in the chainblock.
+        tuple: The objects of the chainblock (shared with the other states).
         """
-        isolated = []
-
-        for elem in chainblock:
-            # Superficial copy of the dictionary
-            new_elem = elem.copy()
-
-            # If the element contains a Pygame Surface, we create a true independent copy.
-            if 'image' in elem and isinstance(elem['image'], pygame.Surface):
-                new_elem['image'] = elem['image'].copy()  # Copie indépendante en VRAM
-
-            if 'sfx' in elem and isinstance(elem['sfx'], pygame.Surface): # For music, sound et voice
-                new_elem['sfx'] = elem['sfx'].copy()  # Independent copy to VRAM
-
-            # If there are any other non-serializable objects, we can handle them here.
-            # Ex: if 'music' in elem and hasattr(elem['music'], 'copy'): ...
-
-            isolated.append(new_elem)
-        return isolated
+        return tuple(chainblock)
     
     def search_tag_chainblock(self, tag, chainblock):
         """
@@ -557,9 +678,9 @@ class StateMachine():
         -----------
         Displays an image on the given Pygame surface with an optional transition effect.
 
-        Supports multiple transition types such as fade, slide, movein, and dissolve. 
-        Each transition gradually modifies the image’s appearance or position over time 
-        according to the specified duration and animation parameters.
+        Supports multiple transition types such as fade, slide, movein, and dissolve (see Transitions.TRANSITIONS).
+        The position and opacity of the image are computed by the transition engine from the real time elapsed
+        since the transition began, so the animation lasts the same time whatever the frame rate.
 
         Arguments
         ---------
@@ -572,168 +693,108 @@ class StateMachine():
         -------
         dict: Updated transition dictionary reflecting the current animation state.
         """
-        if transition is not None:
-            if transition['type'] == 'fade':
-                # Beginning / continuing transition
-                alpha_value = img.get_alpha()
-                if not transition['animate']: 
-                    self.transition_ongoing = True
-                    img.set_alpha(0)
-                    transition['animate'] = True # Begin animation
-                else:
-                    if alpha_value < 255:
-                        incr = 255 / (FPS * int(transition['duration']))
-                        speed_factor = 2 # to match actual duration in transition['duration']
-                        incr = incr * speed_factor
-                        img.set_alpha(alpha_value + int(incr)) 
-                    else: 
-                        self.transition_ongoing = False
-                        transition['type'] = 'none' # We only do the animation once when going forward (rollback animation is not permitted)
-
-            elif transition['type'] == 'slide' or transition['type'] == 'slideright':
-                # Slide from right to desired position
-                if not transition['animate']:
-                    self.transition_ongoing = True
-                    start_pos = self.get_position_from_size(img.get_size(), 'offscreenright', surface.get_size())
-                    transition['pos_anim'] = (start_pos[0], pos[1])
-                    transition['start_pos'] = start_pos[0]  # store fixed start x
-                    transition['animate'] = True  # Begin animation
-                    transition['elapsed'] = 0
-                else:
-                    # Increment the elapsed time
-                    transition['elapsed'] += 1 / FPS
-                    t = min(transition['elapsed'] / transition['duration'], 1.0)  # normalized 0..1
-
-                    # Smooth ease-out
-                    t_smooth = 1 - (1 - t) ** 2
-
-                    # Interpolate using fixed start position
-                    start_x = transition['start_pos']
-                    end_x = pos[0]
-                    new_x = start_x + (end_x - start_x) * t_smooth
-                    transition['pos_anim'] = (new_x, pos[1])
-
-                    # Check if animation is complete
-                    if t >= 1.0:
-                        self.transition_ongoing = False
-                        transition['type'] = 'none'
-                        transition['pos_anim'] = pos  # snap exactly to final position
-
-                surface.blit(img, transition['pos_anim'])
-                return transition
-
-            elif transition['type'] == 'slideleft':
-                # Slide from left to desired position
-                if not transition['animate']:
-                    self.transition_ongoing = True
-                    start_pos = self.get_position_from_size(img.get_size(), 'offscreenleft', surface.get_size())
-                    transition['pos_anim'] = (start_pos[0], pos[1])
-                    transition['start_pos'] = start_pos[0]  # store fixed start x
-                    transition['animate'] = True  # Begin animation
-                    transition['elapsed'] = 0
-                else:
-                    # Increment the elapsed time
-                    transition['elapsed'] += 1 / FPS
-                    t = min(transition['elapsed'] / transition['duration'], 1.0)  # normalized 0..1
-
-                    # Smooth ease-out
-                    t_smooth = 1 - (1 - t) ** 2
-
-                    # Interpolate using fixed start position
-                    start_x = transition['start_pos']
-                    end_x = pos[0]
-                    new_x = start_x + (end_x - start_x) * t_smooth
-                    transition['pos_anim'] = (new_x, pos[1])
-
-                    # Check if animation is complete
-                    if t >= 1.0:
-                        self.transition_ongoing = False
-                        transition['type'] = 'none'
-                        transition['pos_anim'] = pos  # snap exactly to final position
-
-                surface.blit(img, transition['pos_anim'])
-                return transition
-
-            elif transition['type'] == 'movein' and transition['last_pos'] != False:
-                # Slide from last known position to desired position
-                if not transition['animate']:
-                    self.transition_ongoing = True
-                    transition['pos_anim'] = transition['last_pos']  # start pos
-                    transition['start_pos'] = transition['last_pos'][0]  # store fixed start x
-                    transition['animate'] = True  # begin animation
-                    transition['elapsed'] = 0
-                else:
-                    # Increment elapsed time
-                    transition['elapsed'] += 1 / FPS
-                    t = min(transition['elapsed'] / transition['duration'], 1.0)  # normalized 0..1
-
-                    # Smooth ease-out interpolation
-                    t_smooth = 1 - (1 - t) ** 2
-
-                    # Compute new position
-                    start_x = transition['start_pos']
-                    end_x = pos[0]
-                    new_x = start_x + (end_x - start_x) * t_smooth
-                    transition['pos_anim'] = (new_x, pos[1])
-
-                    # Check if animation is complete
-                    if t >= 1.0:
-                        self.transition_ongoing = False
-                        transition['type'] = 'none'
-                        transition['pos_anim'] = pos  # snap exactly to final position
-
-                surface.blit(img, transition['pos_anim'])
-                return transition
-             
-            elif transition['type'] == 'dissolve': 
-                # Dissolve = fade between invisible and visible (similar to fade)
-                alpha_value = img.get_alpha()
-
-                if not transition['animate']:
-                    self.transition_ongoing = True
-                    img.set_alpha(0)
-                    transition['animate'] = True  # Begin animation
-                else:
-                    if alpha_value < 255:
-                        incr = 255 / (FPS * int(transition['duration']))
-                        speed_factor = 2 # to match actual duration in transition['duration']
-                        incr = incr * speed_factor
-                        img.set_alpha(alpha_value + int(incr))  # to make the animation fluid and progressive
-                    else:
-                        self.transition_ongoing = False
-                        transition['type'] = 'none'  # animation is finished
+        img, pos, finished = self.transitions.update(transition, img, pos, surface.get_size())
+        if not finished:
+            self.transition_ongoing = True
+        self.blit_with_alpha(surface, img, pos)
+        return transition
+
+    def blit_with_alpha(self, surface, img, pos, alpha=None):
+        """
+        Description
+        -----------
+        Draws an image with a given opacity. The image can be shared by several states, so its own alpha
+        is only changed during the blit and restored right after.
 
+        Arguments
+        ---------
+        surface: The surface to draw the image on.
+        img: The image to display.
+        pos: The position (x, y) of the image.
+        alpha: Opacity between 0 and 255 (None or 255: the image is drawn as it is).
+
+        Returns
+        -------
+        None
+        """
+        if alpha is None or alpha >= 255:
+            surface.blit(img, pos)
+            return
+        previous_alpha = img.get_alpha()
+        img.set_alpha(alpha)
         surface.blit(img, pos)
-        return transition
+        img.set_alpha(previous_alpha)
         
-    def load_audio(self, audio_path, use_canal = True):
+    def load_audio(self, audio_path):
         """
         Description
         -----------
-        Load an audio from the specified path and return a Pygame sound object.
+        Load a sound or a voice from the specified path and return a Pygame sound object.
+        Sounds and voices are only decoded once (see Audio.AudioManager.get_sound).
         Exits the program if the audio cannot be loaded.
 
         Arguments
         ---------
         audio_path : The relative path to the audio file.
-        use_canal: Decides whether we use pygame.mixer.sound or pygame.mixer.music to load audio
 
         Returns
         -------
         pygame.mixer.Sound: A Pygame sound object containing the loaded audio.
         """
-        canal = ""
-        path = os.path.dirname(self.path_to_renpyfile) + '/' + audio_path[1:-1]
+        path = self.resolve_asset_path(audio_path)
         try:
-            if use_canal:
-                canal = pygame.mixer.Sound(path)  
-            else:
-                pygame.mixer.music.load(path) # returns None
+            canal = self.audio.get_sound(path, self.decode_sound)
         except:
-            print(f'Runtime execution error. Cannot load audio file {path}')
-            pygame.quit()
-            sys.exit()
+            self.audio_load_error(path)
         return canal
+
+    def audio_load_error(self, path):
+        """Report an audio file that cannot be loaded: raises a DetailedError, or exits the program (see exit_on_error)."""
+        if not self.exit_on_error:
+            raise DetailedError(f'Runtime execution error. Cannot load audio file {path}')
+        print(f'Runtime execution error. Cannot load audio file {path}')
+        pygame.quit()
+        sys.exit()
+
+    def play_music(self, music:dict):
+        """
+        Description
+        -----------
+        Starts a music with its fadein, crossfading with the current music (see Audio.MusicScheduler). The music is
+        decoded by a worker thread (usually in advance, see Prefetch.py): if it is not ready yet, it is started by
+        update_music at a later frame, so the frame is never blocked.
+
+        Arguments
+        ---------
+        music : The 'music' part of an audio object ('file', 'loop' and 'fadein').
+
+        Returns
+        -------
+        None
+        """
+        path = self.resolve_asset_path(music['file'])
+        if self.prefetcher is not None:
+            track = self.prefetcher.request('music', path)
+        else: # Prefetching disabled: the music is decoded by the thread of the scheduler
+            track = self.audio.music.decode(path)
+        failed_path = self.audio.music.play(path, track, music['loop'], music['fadein'])
+        if failed_path is not None:
+            self.audio_load_error(failed_path)
+
+    def update_music(self):
+        """Start the music waiting for its decoding, if it is ready (called at each frame, never waits)."""
+        if not self.audio_enabled:
+            return
+        failed_path = self.audio.music.update()
+        if failed_path is not None:
+            self.audio_load_error(failed_path)
+
+    def decode_sound(self, path):
+        """Return a sound decoded by a worker thread (see Prefetch.py), or decode it now."""
+        sound = self.prefetcher.take('sound', path) if self.prefetcher is not None else None
+        if sound is None:
+            sound = pygame.mixer.Sound(path)
+        return sound
     
     def handle_audio(self, audio:dict):
         """
@@ -744,7 +805,7 @@ class StateMachine():
         Plays music, sound, or voice based on the given dictionary. Stops all audio or specific channels 
         (music, voice, sound) with optional fadeout. 
 
-        fadein when music|sound|voice starts is not handled.
+        fadein when sound|voice starts is not handled.
 
         Arguments
         ---------
@@ -754,53 +815,23 @@ class StateMachine():
         -------
         None
         """
-        # We are not handling the fadein for sound or voice
+        # We are not handling the fadein for sound or voice (the fadein of the music is handled by Audio.MusicScheduler)
         if 'music' in audio or 'sound' in audio or 'voice' in audio:
             if audio['music']['file'] != '':
-                if audio['music']['canal'] == False:
-                    self.load_audio(audio['music']['file'], use_canal=False)
-                    pygame.mixer.music.set_volume(0.1)  # 10% du volume maximum
-                    audio['music']['canal'] = True
-                    if audio['music']['loop']:
-                        pygame.mixer.music.play(loops=-1)  # We play it in loops
-                    else:
-                        pygame.mixer.music.play() # We play it once only
+                self.play_music(audio['music']) # We play it in loops or once only, with its fadein
 
             elif audio['voice']['file'] != '':
-                if audio['voice']['canal'] == False:
-                    # load audio
-                    audio['voice']['canal'] = self.load_audio(audio['voice']['file']) # We use Sound because we can create multiple canals, it's easier to handle compared to music
-                    self.audio_tracking['voice'] = audio['voice']['canal']
-                    audio['voice']['canal'].play()  # We play it once only
+                self.audio.play('voice', self.load_audio(audio['voice']['file'])) # We play it once only
 
             elif audio['sound']['file'] != '':
-                if audio['sound']['canal'] == False:
-                    # load audio
-                    audio['sound']['canal'] = self.load_audio(audio['sound']['file']) # We use Sound because we can create multiple canals, it's easier to handle compared to music
-                    self.audio_tracking['sound'] = audio['sound']['canal']
-                    audio['sound']['canal'].play()  # We play it once only
+                self.audio.play('sound', self.load_audio(audio['sound']['file'])) # We play it once only
 
         else: # Stop
-            if audio['stop'] == "": # scenario 1: 'stop'
-                # We must stop all channels (voice, music and sound)
-                pygame.mixer.stop()
-                pygame.mixer.music.stop()
-
+            # scenario 1: 'stop' (we must stop all channels: voice, music and sound)
             # scenario 2: 'stop music' or 'stop sound' or 'stop voice' <=> 'stop music|sound|voice' 
             # scenario 3: 'stop music|sound|voice fadeout X'
-            else: # scenario 2 or scenario 3
-                # Get specific music, sound or voice
-                if audio['fadeout'] == -1: # no fadeout:
-                    if audio['stop'] in ['voice', 'sound']:
-                        self.audio_tracking['sound'][audio['stop']].stop()
-                    else: # music
-                        pygame.mixer.music.stop()
-                else:
-                    fadeout_ms = int(float(audio['fadeout']) * 1000) # in milliseconds
-                    if audio['stop'] in ['voice', 'sound']:
-                        self.audio_tracking[audio['stop']].fadeout(fadeout_ms)
-                    else: # music
-                        pygame.mixer.music.fadeout(fadeout_ms)
+            fadeout_ms = int(float(audio['fadeout']) * 1000) if audio['fadeout'] != -1 else 0 # in milliseconds
+            self.audio.stop(audio['stop'] or None, fadeout_ms)
 
     def clear_audio(self):
         """
@@ -821,7 +852,8 @@ class StateMachine():
         None
         """
         # When getting to next dialogue sound and voice must be stop automatically but not music
-        pygame.mixer.stop()
+        if self.audio_enabled:
+            self.audio.stop_dialogue_audio()
 
     def display_state(self, surface, texbox: TextBox, pos_textbox):
         """
@@ -843,8 +875,25 @@ class StateMachine():
             None
         """
         # This function is called at each frame of the main loop (which helps us a lot for transitions as they also must be updated at each frame)
-        # First we display all the images with pygame:
+        self.draw_images(surface)
+        self.draw_text(surface, texbox, pos_textbox)
+
+    def draw_images(self, surface):
+        """
+        Description
+        -----------
+        Draws the images of the current state, in the order of the layers, and updates their transitions (one frame).
+
+        Arguments
+        ---------
+        surface: The surface to render the images on (the screen or a Renderer.RecordingSurface).
+
+        Returns
+        -------
+        None
+        """
         chainblock = self.state_machine[self.idx]
+        self.transition_ongoing = False # Set again by display_with_transition while a transition is not finished
         for z_index in self.layer_order_statements: # order of layers
             for obj in chainblock: # obj = key 
                 # print('obj', obj)
@@ -855,20 +904,75 @@ class StateMachine():
                         # update self.state_machine with new transition status:
                         obj['transition'] = transition_dict
 
-        # raise DetailedError('debug')
-        # Then we display the dialogue:
-        for obj in chainblock:
-            if 'text' in obj:
-                speaker, text, color = self.break_txt_object(obj)
-                # print('text = ', text)
-                texbox.complex_draw(surface, pos_textbox, text=text, speaker=speaker, color=color)
-                
-        # raise DetailedError('debug2 error raised right over there')
-        # Then we handle the audio:
-        for obj in chainblock:
-            if 'music' in obj or 'sound' in obj or 'voice' in obj or 'stop' in obj:
+    def get_text_objects(self):
+        """Return the (speaker, text, color) of each dialogue of the current state."""
+        return tuple(self.break_txt_object(obj) for obj in self.state_machine[self.idx] if 'text' in obj)
+
+    def draw_text(self, surface, texbox: TextBox, pos_textbox):
+        """
+        Description
+        -----------
+        Draws the dialogue of the current state inside the textbox.
+
+        Arguments
+        ---------
+        surface: The surface to render the dialogue on (the screen or a Renderer.RecordingSurface).
+        texbox: The text box object used to render dialogue text.
+        pos_textbox: The position (x, y) to draw the text box.
+
+        Returns
+        -------
+        None
+        """
+        for speaker, text, color in self.get_text_objects():
+            texbox.complex_draw(surface, pos_textbox, text=text, speaker=speaker, color=color)
+
+    def handle_state_audio(self, previous_state=()):
+        """
+        Description
+        -----------
+        Plays or stops the audio of the current state (see handle_audio). Called once, when the state is displayed:
+        only the audio objects added since the previous state are executed (the objects of the previous states stay
+        in the chainblock, they must not be played or stopped again).
+
+        Arguments
+        ---------
+        previous_state (optional) : The chainblock of the state displayed before (empty for the first state).
+
+        Returns
+        -------
+        None
+        """
+        if not self.audio_enabled:
+            return
+        previous_objects = {id(obj) for obj in previous_state}
+        for obj in self.state_machine[self.idx]:
+            if id(obj) not in previous_objects and ('music' in obj or 'sound' in obj or 'voice' in obj or 'stop' in obj):
                 self.handle_audio(obj)
 
+    def render_state(self, renderer: DirtyRectRenderer, texbox: TextBox, pos_textbox):
+        """
+        Description
+        -----------
+        Renders the current state with a retained-mode renderer: the images and the textbox are recorded (the textbox is
+        only laid out again when the dialogue changes), then only the rectangles that changed since the previous frame
+        are drawn (see Renderer.py). Same result as display_state, without drawing a static frame again.
+
+        Arguments
+        ---------
+        renderer: The renderer drawing on the screen.
+        texbox: The text box object used to render dialogue text.
+        pos_textbox: The position (x, y) to draw the text box.
+
+        Returns
+        -------
+        list: The rectangles of the screen that changed (to give to pygame.display.update), empty if nothing changed.
+        """
+        recorder = renderer.recorder()
+        self.draw_images(recorder)
+        text_blits = renderer.record_text((id(texbox), pos_textbox, self.get_text_objects()), lambda surface: self.draw_text(surface, texbox, pos_textbox))
+        return renderer.render(recorder.blits + text_blits)
+
     def get_dialogue_speaker(self, node):
         """
         Retrieves the speaker's name from the dialogue node.
@@ -900,19 +1004,19 @@ class StateMachine():
         
         return speaker, color # Here, speaker is not a UserNode
         
-    def create_state_machine(self, screen_size):
+    def iter_states(self, screen_size):
         """
         Description
         -----------
-        Creates a state machine that processes labels, dialogue, and scene nodes, 
-        then organizes and prepares data for rendering in the game.
+        Generator computing the states of the visual novel one by one, in the order they are displayed.
 
         This function iterates through the labels, processes different node types (such as dialogue, scene, and show),
         and constructs a list of actions (`chainblock`) that will be executed sequentially. Each action (such as 
         displaying text or images) is associated with transitions, transformations, and layers to control how they 
-        are rendered during gameplay.
+        are rendered during gameplay. A state (isolated copy of the chainblock) is yielded for each dialogue.
 
         It also handles scaling of images and checks if a tag (for images) already exists to avoid duplicates.
+        Images are only loaded when the state using them is computed.
 
         Arguments
         ---------
@@ -920,12 +1024,12 @@ class StateMachine():
 
         Returns
         -------
-        None
-            The state machine is constructed in place and does not return any value.
+        generator: Yields the state (list of scene objects) of each dialogue.
         """
         labels_order = self.get_labels_order()
         chainblock = [] # list of pygame commands to show between two user actions 
-        self.idx = 0
+        state_idx = 0 # Index of the next state yielded
+        self.advance_prefetcher(('image',), state_idx)
         for label_body in labels_order:
             for node in label_body:
                 # print('node = ', node)
@@ -945,8 +1049,9 @@ class StateMachine():
                     self.remove_text_chainblock(chainblock) # We keep the images (scene and show but we remove the text)
 
                     chainblock.append(txt_display)
-                    self.state_machine[self.idx] = self.isolate_chainblock_state(chainblock)
-                    self.idx += 1
+                    yield self.isolate_chainblock_state(chainblock)
+                    state_idx += 1
+                    self.advance_prefetcher(('image',), state_idx)
 
                 elif isinstance(node, PlayNode):
                     # We should play either a background music, character's voice or a sound (SFX)
@@ -955,13 +1060,14 @@ class StateMachine():
                     if isinstance(audio_value, UserNode):
                         audio_value = self.get_user_value(audio_value)
                     # At this point audio_value is a StringNode necessarily
-                    audio_value = audio_value.value
+                    audio_value = self.get_asset_path(audio_value)
 
                     # print('audio_value = ', audio_value)
 
                     if node.audio_type == 'music':
                         audio_obj['music']['file'] = audio_value
                         audio_obj['music']['loop'] = node.loop
+                        audio_obj['music']['fadein'] = node.fadein
                     else:
                         audio_obj[node.audio_type]['file'] = audio_value
 
@@ -986,10 +1092,7 @@ class StateMachine():
 
                 elif isinstance(node, SceneNode):
                     img_display = self.init_img_dict()
-                    image_surface = self.get_scenenode_img(node)
-                    if image_surface.get_size() != screen_size: # we do this only because it's a background ---->>> NEED TO BE AN OPTION IN GUI WIND LATER
-                        testing_scale = screen_size 
-                        image_surface = self.scale_image_to_wind(image_surface, testing_scale)
+                    image_surface = self.get_scenenode_img(node, screen_size, 'window') # scaled to the window only because it's a background ---->>> NEED TO BE AN OPTION IN GUI WIND LATER
 
                     transform = node.transform.transform_name if node.transform is not None else 'topleft'
                     transition = node.transition.transition if node.transition is not None else 'none'
@@ -1004,9 +1107,9 @@ class StateMachine():
                     img_display['layer'] = layer
                     img_display['transition'] = {
                         'type': transition,
-                        'duration': 2, # default duration in second (we don't handle custom transition so it's always 1 sec)
+                        'duration': None, # default duration of the transition (we don't handle custom transition)
                         'animate': False,
-                        'pos_anim': (0, 0)
+                        'elapsed': 0
                     }
                     
                     # Before updating chainblock we check if layer already exist or not:
@@ -1021,9 +1124,7 @@ class StateMachine():
 
                 elif isinstance(node, ShowNode):
                     img_display = self.init_img_dict()
-                    image_surface = self.get_scenenode_img(node)
-                    if image_surface.get_size() != screen_size: # we do this only because it's a background ---->>> NEED TO BE AN OPTION IN GUI WIND LATER
-                        image_surface = scale_img(image_surface, desired_width=500)
+                    image_surface = self.get_scenenode_img(node, screen_size, 'sprite') # scaled only if its size is not the size of the window ---->>> NEED TO BE AN OPTION IN GUI WIND LATER
 
                     transform = node.transform.transform_name if node.transform is not None else 'center'
                     transition = node.transition.transition if node.transition is not None else 'none'
@@ -1039,9 +1140,8 @@ class StateMachine():
                     img_display['layer'] = layer
                     img_display['transition'] = {
                         'type': transition,
-                        'duration': 2, # default duration in second (we don't handle custom transition so it's always 1 sec)
+                        'duration': None, # default duration of the transition (we don't handle custom transition)
                         'animate': False,
-                        'pos_anim': (0, 0), # Cannot be None to prevent error in display_with_transition
                         'last_pos': False, # This is to prevent from wrong usage of movein (ex: if we use a movein transition on the first show statement of the game)
                         'elapsed': 0 # for linear interpolation
                     }
@@ -1061,6 +1161,187 @@ class StateMachine():
 
                     chainblock.append(img_display)
        
+    def create_state_machine(self, screen_size):
+        """
+        Description
+        -----------
+        Creates the state machine of the visual novel (`self.state_machine`) from the states computed by `iter_states`.
+
+        By default, every state is computed before the first frame is displayed. In lazy mode, `self.state_machine`
+        is a `StateWindow`: states are computed on demand as the player advances, a few states ahead of the
+        current one, and only the last states are kept for rollback (see States.py).
+
+        If prefetching is enabled, a new `AssetPrefetcher` loads the assets of the next states in background threads
+        (see Prefetch.py): images are scheduled as the states are computed, audio as the states are displayed.
+
+        Arguments
+        ---------
+        screen_size : The size of the screen (width, height) to adjust image sizes and positions accordingly.
+
+        Returns
+        -------
+        None
+            The state machine is constructed in place and does not return any value.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        self.prefetcher = AssetPrefetcher(self.get_assets_plan()) if self.prefetch else None
+        if self.lazy:
+            self.state_machine = StateWindow(self.iter_states(screen_size), lookahead=self.lookahead, history=self.history)
+            self.idx = 0
+            return
+        self.state_machine = {}
+        self.idx = 0
+        for state in self.iter_states(screen_size):
+            self.state_machine[self.idx] = state
+            self.idx += 1
+
+    def instrument_runtime(self, texbox, renderer=None):
+        """
+        Description
+        -----------
+        Measures the creation of the state machine (stage) and the sections of each frame (image blit, transition update,
+        textbox draw and audio handling) if an Instrumentation was given. Otherwise nothing is changed.
+
+        Arguments
+        ---------
+        texbox : The textbox drawn at each frame.
+        renderer (optional) : The Renderer.DirtyRectRenderer drawing the frames (its drawing is counted as 'image_blit').
+
+        Returns
+        -------
+        None
+        """
+        if self.instrumentation is None:
+            return
+        if renderer is not None:
+            self.instrumentation.time_section(renderer, 'render', 'image_blit')
+        self.instrumentation.time_stage(self, 'create_state_machine')
+        self.instrumentation.time_section(self, 'blit_with_alpha', 'image_blit')
+        self.instrumentation.time_section(self, 'display_with_transition', 'transition_update')
+        self.instrumentation.time_section(texbox, 'complex_draw', 'textbox_draw')
+        self.instrumentation.time_section(self, 'handle_audio', 'audio')
+        self.instrumentation.time_section(self, 'clear_audio', 'audio')
+        self.instrumentation.time_section(self, 'update_music', 'audio')
+
+    def close_instrumentation(self):
+        """Send the counters of the runtime (states, image cache) and close the instrumentation, if any."""
+        if self.instrumentation is None:
+            return
+        self.instrumentation.counters['states'] = len(self.state_machine)
+        for name, value in self.image_cache.stats().items():
+            self.instrumentation.counters['image_cache_' + name] = value
+        for name, value in self.audio.cache.stats().items():
+            self.instrumentation.counters['sound_cache_' + name] = value
+        self.instrumentation.close()
+
+    def init_textbox(self, width):
+        """
+        Description
+        -----------
+        Creates the gradient textbox displayed at the bottom of the screen.
+
+        Arguments
+        ---------
+        width : The width of the screen.
+
+        Returns
+        -------
+        TextBox: The textbox (200 pixels high).
+        """
+        c1 = (173, 216, 230, 240)  # Light blue
+        c2 = (135, 206, 250, 200)  # Sky blue
+        gradient =  Gradient(c1, c2)  
+        return TextBox(width, 200, offset_x=30, offset_y=10, gr=gradient, flip_gradient=False) # Built once (not built then resized)
+
+    def run_headless(self, screen_size=(1200, 800), max_frames_per_state=FPS * 10, checksums=True, max_states=None):
+        """
+        Description
+        -----------
+        Runs the visual novel without a window, a keyboard or a sound card (e.g., automated tests on a build machine).
+
+        The dummy SDL video and audio drivers are used (unless SDL_VIDEODRIVER / SDL_AUDIODRIVER are already set), the
+        states are rendered on an off-screen Surface and the player is simulated: each state is displayed until its
+        transitions are finished (or `max_frames_per_state` frames were rendered), then the next state is displayed.
+        Unlike generate_VN, this function never exits the program: errors are returned in the results.
+
+        Arguments
+        ---------
+        screen_size (optional) : The size (width, height) of the off-screen Surface.
+        max_frames_per_state (optional) : Maximum number of frames rendered for one state.
+        checksums (optional) : If True, the CRC-32 of the last frame of each state is returned (regression tests).
+        max_states (optional) : Maximum number of states displayed (None: every state).
+
+        Returns
+        -------
+        dict: 'states' (number of states displayed), 'frames' (number of frames rendered), 'build_s' (time to create
+        the state machine, in seconds), 'run_s' (time to render every state), 'frames_per_s', 'checksums'
+        (list, or None) and 'error' (message of the error that stopped the run, or None).
+        """
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        pygame.init()
+        try:
+            pygame.mixer.init()
+            self.audio.open()
+        except pygame.error:
+            # HANDLING: No audio device at all: the audio statements are ignored
+            self.audio_enabled = False
+        if pygame.display.get_surface() is None:
+            pygame.display.set_mode((1, 1)) # convert_alpha needs a display mode, even with the dummy driver
+        self.exit_on_error = False
+        surface = pygame.Surface(screen_size)
+        renderer = DirtyRectRenderer(surface, self.clear_color)
+        container_surface = self.init_textbox(screen_size[0])
+        pos_textbox = (0, screen_size[1] - 200)
+        self.instrument_runtime(container_surface, renderer)
+
+        results = {'states': 0, 'frames': 0, 'build_s': 0.0, 'run_s': 0.0, 'frames_per_s': 0.0,
+                   'checksums': [] if checksums else None, 'error': None}
+        start = time.perf_counter()
+        try:
+            self.create_state_machine(screen_size)
+            results['build_s'] = time.perf_counter() - start
+            start = time.perf_counter()
+            self.idx = 0
+            previous_state = ()
+            while self.idx in self.state_machine and (max_states is None or self.idx < max_states):
+                self.clear_audio()
+                self.advance_prefetcher(('sound', 'music'), self.idx)
+                self.handle_state_audio(previous_state)
+                previous_state = self.state_machine[self.idx]
+                for _ in range(max_frames_per_state):
+                    if self.instrumentation is not None:
+                        self.instrumentation.begin_frame(self.idx)
+                    self.render_state(renderer, container_surface, pos_textbox)
+                    self.update_music()
+                    if self.instrumentation is not None:
+                        self.instrumentation.end_frame(surface)
+                        if self.instrumentation.draws_on_frames(): # The next frame must erase what was drawn
+                            renderer.invalidate()
+                    results['frames'] += 1
+                    self.transitions.advance(1 / FPS) # Simulated clock: the checksums do not depend on the speed of the machine
+                    if not self.transition_ongoing:
+                        break
+                self.transition_ongoing = False
+                if checksums:
+                    results['checksums'].append(zlib.crc32(pygame.image.tobytes(surface, 'RGB')))
+                results['states'] += 1
+                self.idx += 1
+        except DetailedError as error:
+            # HANDLING: The error of the script is returned, the program goes on
+            results['error'] = str(error)
+        finally:
+            results['run_s'] = time.perf_counter() - start
+            if self.prefetcher is not None:
+                self.prefetcher.shutdown()
+            self.audio.close()
+            self.exit_on_error = True
+            self.close_instrumentation()
+        if results['run_s'] > 0:
+            results['frames_per_s'] = results['frames'] / results['run_s']
+        return results
+
     def generate_VN(self, debug=False):
         """
         Description
@@ -1072,7 +1353,9 @@ class StateMachine():
         events for left and right arrow keys to navigate through the visual novel, updates the screen based
         on the current state, and handles transitions between game elements (such as text and images).
 
-        It also displays a gradient textbox at the bottom of the screen and updates the display each frame.
+        It also displays a gradient textbox at the bottom of the screen. Frames are drawn by a retained-mode renderer
+        (see render_state): only the rectangles that changed are drawn and sent to the display, and the loop sleeps
+        until the next event while the screen is static (no transition ongoing).
 
         Arguments
         ---------
@@ -1085,6 +1368,7 @@ class StateMachine():
         """
         pygame.init()
         pygame.mixer.init() # for music
+        self.audio.open()
         WIDTH = 1200
         HEIGHT = 800
         screen_size = (WIDTH, HEIGHT) # sw, sh (WINDOW size)
@@ -1096,33 +1380,44 @@ class StateMachine():
         # pygame.mixer.music.play()
 
         # Textbox and gradient:
-        c1 = (173, 216, 230, 240)  # Light blue
-        c2 = (135, 206, 250, 200)  # Sky blue
-        gradient =  Gradient(c1, c2)  
-        container_surface = TextBox(WIDTH, 200, gr=gradient)
-        container_surface.resize(WIDTH, 200, offset_x=30, offset_y=10, gr=gradient, flip_gradient=False)        
+        container_surface = self.init_textbox(WIDTH)
+        renderer = DirtyRectRenderer(screen, self.clear_color)
+        self.instrument_runtime(container_surface, renderer)
 
         self.create_state_machine(screen_size)
         
         self.idx = 0 
+        self.advance_prefetcher(('sound', 'music'), self.idx)
+        self.handle_state_audio()
         if debug:
             print('\n\n########### DEBUGGING VISUAL NOVEL BEGIN ##################\n')
             print("current chainblock: ", end ="")
         self.pretty_list(self.state_machine[self.idx])
         running = True  
         pos_textbox = (0, HEIGHT - 200)
+        idle = False # True when the last frame did not change anything
         while running:
+            if idle: # Static screen: sleep until the next event (the music is played by the mixer thread)
+                pygame.event.post(pygame.event.wait())
+                clock.tick() # The time slept is not part of the next frame (a transition may begin at this frame)
+            if self.instrumentation is not None:
+                self.instrumentation.begin_frame(self.idx)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.VIDEOEXPOSE or event.type == pygame.WINDOWEXPOSED:
+                    renderer.invalidate() # The content of the window may have been lost
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RIGHT:
-                        if self.idx < len(self.state_machine) - 1:
+                        if self.idx + 1 in self.state_machine: # Computes the next state in lazy mode
                             if debug:
                                 print('pressed key right')
                             if not self.transition_ongoing: # We wait for transition to finish
                                 self.clear_audio()
+                                previous_state = self.state_machine[self.idx]
                                 self.idx += 1
+                                self.advance_prefetcher(('sound', 'music'), self.idx)
+                                self.handle_state_audio(previous_state) # The audio is played or stopped once per state
                                 if debug:
                                     print("current chainblock: ", end ="")
                                 self.pretty_list(self.state_machine[self.idx])
@@ -1130,47 +1425,82 @@ class StateMachine():
                                 if debug:
                                     print('transition ongoing - cannot pass to next state')
                     elif event.key == pygame.K_LEFT:
-                        if self.idx > 0:                                
+                        if self.idx - 1 in self.state_machine: # In lazy mode, only the last states are kept for rollback
                             self.idx -= 1
                             if debug:
                                 print('pressed key left')
                                 print("current chainblock: ", end ="")
                             self.pretty_list(self.state_machine[self.idx])
 
-            screen.fill(self.clear_color)
-            self.display_state(screen, container_surface, pos_textbox)
-            pygame.display.flip()
-            clock.tick(FPS)  
+            dirty_rects = self.render_state(renderer, container_surface, pos_textbox)
+            self.update_music()
+            if self.instrumentation is not None:
+                self.instrumentation.end_frame(screen) # Subscribers can draw on the frame (e.g., Instrumentation.FrameOverlay)
+                if self.instrumentation.draws_on_frames(): # The whole screen is sent, and the next frame erases what was drawn
+                    dirty_rects = [screen.get_rect()]
+                    renderer.invalidate()
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
+            idle = not dirty_rects and not self.transition_ongoing and self.audio.music.pending is None # A music may start at the next frame
+            self.transitions.advance(clock.tick(FPS) / 1000) # Real duration of the frame, in seconds
             # break
 
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        self.audio.close()
+        self.close_instrumentation()
         pygame.quit()
         sys.exit()   
     
 class VisualNovelGenerator():
-    def __init__(self, renpy_file, debug=False, debug_PATH=''):
+    def __init__(self, renpy_file, debug=False, debug_PATH='', use_cache=True, incremental=False, lazy=False, workers=None, headless=False, run=True, instrumentation=None, flat=False):
         # Init the game:
+        project = isinstance(renpy_file, (list, tuple)) or os.path.isdir(renpy_file) # Several scripts (see compile_project)
         self.path_to_renpyfile = renpy_file # Used much later (during runtime execution)
         self.debug = debug
+        self.lazy = lazy # If True, the states of the game are computed on demand (see StateMachine.create_state_machine)
+        self.headless = headless # If True, the game is run without window nor keyboard (see StateMachine.run_headless)
+        self.headless_results = None # Results of StateMachine.run_headless
+        self.instrumentation = instrumentation # Stage timers and per-frame breakdown, None if disabled (see Instrumentation.py)
+        self.flat = flat # If True, the AST of a single script is stored in arrays (see FlatAST.py and step3_parser)
         self.file = None
         self.list_tokens = []
         self.tk = None # Tokenizer
         self.parser = None # Parser
         self.ast_tree = None 
-        self.symbols_table = {} # Dictionnary initialise during Initialisation Phase (contains all top level ASTnode)
+        self.pool = InternPool() # Intern pool of the compilation (see Intern.py): filled by the tokenizer, read by the symbols table
+        self.symbols_table = SymbolTable(self.pool) # Dictionnary initialise during Initialisation Phase (contains all top level ASTnode), see Symbols.py
         self.labels_table = {} # Dictionnary initialise during Initialisation Phase (contains all label nodes), key = label name
+        self.label_index = None # Label index and jump graph (see Labels.py), built during Initialisation Phase
         self.state_machine = {} # State machine for runtime game
         self.idx_state = 0 # To navigate inside state_machine
+        self.cache = ASTCache(renpy_file, flat) if (use_cache and not debug and not project) else None # In debug mode the front-end always runs (to print the tokens)
+        self.project_compiler = None # Created by compile_project
+        self.incremental_parser = None # Created by recompile (keeps the top-level blocks of the last compilation)
+        self.labels_table_valid = False # True if the last call of recompile verified the whole script without error
         
-        # Load all ressources:
-        self.step1_loadfile(renpy_file)
-        self.step2_tokenizer()
-        self.step3_parser()
-        self.step4_initialize_master_node()
+        if instrumentation is not None: # Tokens are streamed to the parser: the tokenizer runs during 'step3_parser'
+            for step in ('step0_load_cache', 'step1_loadfile', 'step2_tokenizer', 'step3_parser', 'step4_initialize_master_node', 'compile_project', 'recompile'):
+                instrumentation.time_stage(self, step)
+
+        # Load all ressources (the front-end is skipped if the compiled script is found in the cache):
+        if project: # The scripts are parsed in parallel then merged
+            self.compile_project(renpy_file, workers)
+        elif incremental: # The script is parsed block by block, so the next calls of recompile only parse the edited blocks
+            self.recompile()
+        elif not self.step0_load_cache():
+            self.step1_loadfile(renpy_file)
+            self.step2_tokenizer()
+            self.step3_parser()
+            self.step4_initialize_master_node()
+            if self.cache is not None:
+                self.cache.save(self.ast_tree, self.symbols_table, self.labels_table)
 
         if debug: 
             self.output_result(debug_PATH)
 
-        self.step5_runtime()
+        if run: # run=False only compiles the script (e.g., Benchmark.py)
+            self.step5_runtime()
         
     def output_result(self, debug_PATH):
         """
@@ -1258,7 +1588,7 @@ class VisualNovelGenerator():
         printed_line_num = False
 
         for e in self.list_tokens:
-            if 'NEWLINE' in e:
+            if e.type == 'NEWLINE':
                 if not printed_line_num:
                     print(f"#{ligne_idx} || NEWLINE")
                 else:
@@ -1267,7 +1597,7 @@ class VisualNovelGenerator():
                 printed_line_num = False
                 continue
 
-            e_type, e_val = __BREAK__TOKEN__(e)
+            e_type, e_val = e.type, e.value
 
             if not printed_line_num:
                 print(f"#{ligne_idx} || ", end="")
@@ -1278,14 +1608,43 @@ class VisualNovelGenerator():
             else:
                 print(f"{e_type} -> ", end="")
 
+    def step0_load_cache(self):
+        """
+        Description
+        -----------
+        Loads the AST, the symbols table and the labels table from the '.rpyc' cache file of the script (see `Cache.ASTCache`).
+
+        The cache is only used if it was written by the same version of the compiler (`COMPILER_VERSION`)
+        for the same content of the script. In this case, steps 1 to 4 are skipped.
+
+        Arguments
+        ---------
+        None
+
+        Returns
+        -------
+        bool: True if the compiled script was loaded from the cache, False otherwise.
+        """
+        if self.cache is None:
+            return False
+        compiled_script = self.cache.load()
+        if compiled_script is None:
+            return False
+        self.ast_tree, self.symbols_table, self.labels_table = compiled_script
+        self.pool = self.symbols_table.pool # The ids of the cached nodes are the ids of the pool pickled with the table
+        self.label_index = LabelIndex(self.ast_tree)
+        return True
+
     def step1_loadfile(self, renpy_file):
         """
         Description
         -----------
-        Loads the contents of a Ren'Py script file into memory.
+        Prepares the loading of a Ren'Py script file.
 
-        This function opens the specified Ren'Py script file, reads its contents, 
-        and stores the content in the `self.file` attribute.
+        The script is not read at once: `self.file` stores a generator reading the file
+        by chunks of `SCRIPT_CHUNK_SIZE` characters (see `Tokens.read_script_chunks`), which is
+        consumed by the tokenizer. This way, the memory used to load the script depends on
+        the size of a chunk and not on the size of the file.
 
         Arguments
         ---------
@@ -1295,20 +1654,17 @@ class VisualNovelGenerator():
         -------
         None
         """
-        with open(renpy_file, 'r', encoding="utf-8") as file:
-            self.file = file.read()
+        self.file = read_script_chunks(renpy_file)
 
     def step2_tokenizer(self):
         """
         Description
         -----------
-        Tokenizes the loaded Ren'Py script and stores the tokens found in a list.
-
-        This function uses the `RPTokenizer` to tokenize the contents of the loaded 
-        Ren'Py script file, storing the tokens in `self.list_tokens`. The tokenization 
-        process continues until the end of the file is reached.
+        Creates the tokenizer of the loaded Ren'Py script.
 
-        If debugging is enabled, it prints all the tokens found.
+        Tokens are streamed to the parser (see `step3_parser`) so the whole list of tokens
+        is never kept in memory. If debugging is enabled, all the tokens are stored in 
+        `self.list_tokens` and printed.
 
         Arguments
         ---------
@@ -1318,13 +1674,9 @@ class VisualNovelGenerator():
         -------
         None
         """
-        self.tk = RPTokenizer(self.file)
-        token = self.tk.tokenizer_from_file()
-        while token != FILE_EOF:
-            self.list_tokens.append(token)
-            token = self.tk.tokenizer_from_file()
-
+        self.tk = RPTokenizer(self.file, pool=self.pool)
         if self.debug:
+            self.list_tokens = list(self.tk.iter_tokens())
             print('\n\n########### PRINTING ALL THE TOKENS FOUND ##################\n')
             self.print_list_token()
             print('\n########### END OF TOKENS FOUND ##################\n')
@@ -1337,9 +1689,11 @@ class VisualNovelGenerator():
         -----------
         Parses the tokenized Ren'Py script into an Abstract Syntax Tree (AST).
 
-        This function uses the `MasterParser` to parse the list of tokens and 
-        generates an AST representing the structure of the Ren'Py script. The resulting 
-        AST is stored in `self.ast_tree`.
+        This function uses the `MasterParser` to parse the tokens (the list of tokens in debug mode,
+        otherwise the tokens streamed by the tokenizer) and generates an AST representing the 
+        structure of the Ren'Py script. The resulting AST is stored in `self.ast_tree`.
+        With `flat=True`, the tree is then stored in arrays and `self.ast_tree` is the view of its MasterNode
+        (see FlatAST.py): the next steps read it like the tree.
 
         Arguments
         ---------
@@ -1349,8 +1703,10 @@ class VisualNovelGenerator():
         -------
         None
         """
-        self.parser = MasterParser(self.list_tokens)
+        self.parser = MasterParser(self.list_tokens if self.debug else self.tk.iter_tokens())
         self.ast_tree = self.parser.parse_renpy_file()
+        if self.flat:
+            self.ast_tree = FlatAST.from_tree(self.ast_tree).root
 
     def update_nested_table_image_node(self, table:dict, ast_node: ImageNode, img_path):
         """
@@ -1457,25 +1813,17 @@ class VisualNovelGenerator():
         # Used by define node, scene node, hide node and show node and more to verify if tags used by these statement were declared or not.
         if isinstance(ast_node, DefineNode):
             if isinstance(ast_node.value, UserNode):
-                if str(ast_node.value) not in [str(key) for key in self.symbols_table['define']]:
+                if not self.symbols_table.is_declared(ast_node.value):
                     raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {ast_node.value}')
             elif isinstance(ast_node.value, FunctionCallNode):
                 user_node_list = ast_node.value.get_user_tokens()
                 for user_token in user_node_list:
-                    if str(user_token) not in [str(key) for key in self.symbols_table['define']]:
+                    if not self.symbols_table.is_declared(user_token):
                         raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {user_token}')
 
         elif isinstance(ast_node, SceneNode) or isinstance(ast_node, ShowNode) or isinstance(ast_node, HideNode):
             # First of all, we check for image_expression:
-            if self.symbols_table['image'] is None:
-                raise DetailedError(f'Runtime Error with the statement {ast_node}. Cannot use tags {ast_node.get_full_name()} that are not declared.')
-            key = self.symbols_table['image'] # key is what we already studied
-            try:
-                for tag in ast_node.image_expression: # ast_node is what we are studying 
-                    key = key[tag] 
-                if 'image_path' not in key:
-                    raise DetailedError(f'Runtime error with the statement {ast_node}. Tried to use a non-existent image tag: {ast_node.get_full_name()}')
-            except:
+            if not self.symbols_table.is_declared(image_name(ast_node.image_expression), 'image'):
                 raise DetailedError(f'Runtime Error with the statement {ast_node}. Tried to use a non-existent image tag: {ast_node.get_full_name()}')
 
             # Then, we check for transition:
@@ -1488,33 +1836,29 @@ class VisualNovelGenerator():
     
         elif isinstance(ast_node, TransitionNode):
             if isinstance(ast_node.transition, UserNode):
-                if str(ast_node.transition.name) not in [str(key) for key in self.symbols_table['define']]:
+                if not self.symbols_table.is_declared(ast_node.transition):
                     raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {ast_node.transition.name}')
             
         elif isinstance(ast_node, ReturnNode):
             if isinstance(ast_node.value, UserNode): 
-                if str(ast_node.value) not in [str(key) for key in self.symbols_table['define']]:
+                if not self.symbols_table.is_declared(ast_node.value):
                     raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {ast_node.value}')
 
         elif isinstance(ast_node, JumpNode):
             # Getting all the label name that exist (not just the ones that have been stored in self.labels_table)
             if not isinstance(ast_node.label_name, UserNode): # We don't verify when label_name = 'start' keyword
                 return
-            all_label_names = []
-            for node in self.ast_tree:
-                if isinstance(node, LabelNode) and isinstance(node.label_name, UserNode): # ast_node is necessarily a UserNode
-                    all_label_names.append(str(node.label_name.name))
-            if str(ast_node.label_name.name) not in all_label_names:
+            if ast_node.label_name not in self.label_index: # Every label of the script (not just the ones already stored in self.labels_table)
                 raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {ast_node.label_name}')
     
         elif isinstance(ast_node, DialogueNode):
             if isinstance(ast_node.speaker, UserNode):
-                if str(ast_node.speaker) not in [str(key) for key in self.symbols_table['define']]:
+                if not self.symbols_table.is_declared(ast_node.speaker):
                     raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {ast_node.speaker}')
             elif isinstance(ast_node.speaker, FunctionCallNode):
                 user_node_list = ast_node.speaker.get_user_tokens()
                 for user_token in user_node_list:
-                    if str(user_token) not in [str(key) for key in self.symbols_table['define']]:
+                    if not self.symbols_table.is_declared(user_token):
                         raise DetailedError(f'Runtime error with the statement {ast_node}. Cannot use a variable that had not been declared. Variable: {user_token}')
 
     def step4_label_body_initialize(self, ast_label_body: LabelNode):
@@ -1665,7 +2009,7 @@ class VisualNovelGenerator():
 
             last_node_added = ast_node
           
-    def step4_initialize_master_node(self):
+    def step4_initialize_master_node(self, unchanged_nodes=None, previous_labels_table=None, label_names_changed=True):
         """
         Description
         -----------
@@ -1683,10 +2027,15 @@ class VisualNovelGenerator():
         - `SceneNode`, `ShowNode`, `HideNode`: Stores scene-related data, including transformation, layer, and transition attributes.
         - `PlayNode`, `StopNode`: Stores play and stop instructions.
         - `LabelNode`: Processes labels and delegates further initialization to the `step4_label_body_initialize` method for label body processing.
+
+        During an incremental compilation (see `recompile`), the nodes that did not change since the previous compilation
+        are not verified again and the labels table entries of the unchanged labels are reused.
         
         Arguments:
         ----------
-        None
+        unchanged_nodes: ids of the top-level nodes already verified by the previous compilation (None: every node is verified).
+        previous_labels_table: Labels table of the previous compilation (entries reused for the unchanged labels).
+        label_names_changed: If True, the 'jump' statements of the unchanged labels are verified again.
 
         Returns
         -------
@@ -1694,17 +2043,23 @@ class VisualNovelGenerator():
         """
 
         # Goal: Store all statements in a symbol node and check if a statement (whether inside a label or outside) is used before being initialised
-        for ast_node in self.ast_tree:
+        self.label_index = LabelIndex(self.ast_tree) # Every label must be known to verify 'jump' statements
+        if unchanged_nodes is None:
+            unchanged_nodes = set()
+        for position, ast_node in enumerate(self.ast_tree):
+            verify = id(ast_node) not in unchanged_nodes
             if isinstance(ast_node, DefineNode): # We are declaring a variable, no need to check if it's used before initialised 
                 if 'define' not in self.symbols_table:
                     self.symbols_table['define'] = {} # Cannot be None by default or we will have an error
 
                 # Before adding to symbols_table we check if the USER tokens used on right side of ASSIGN ('=') are declared or not. 
                 # ast_node can be either a FunctionNode, User token or a string (we don't check if it's a string)
-                self.verify_prior_declaration(ast_node)
+                if verify:
+                    self.verify_prior_declaration(ast_node)
 
                 # We add it to symbols_table
                 self.symbols_table['define'][ast_node.id] = ast_node.value # Define statement is now considered 'initialised'
+                self.symbols_table.declare('define', ast_node.id, ast_node, position)
 
             elif isinstance(ast_node, ImageNode): # Ex: ast_node.image_expression = ['eileen', 'happy', 'blushing']
                 if 'image' not in self.symbols_table:
@@ -1712,13 +2067,15 @@ class VisualNovelGenerator():
 
                 img_path = ast_node.get_value() 
                 self.update_nested_table_image_node(self.symbols_table['image'], ast_node, img_path) # image statement is now considered 'initialised'
+                self.symbols_table.declare('image', image_name(ast_node.image_expression), ast_node, position)
 
             elif isinstance(ast_node, SceneNode): #Ex: scene eileen happy blushing at center with transition 
                 if 'scene' not in self.symbols_table:
                     self.symbols_table['scene'] = {} # Cannot be None by default or we will have an error
 
                 # Before adding to symbols_table we check if the tags used used are declared or not. 
-                self.verify_prior_declaration(ast_node)
+                if verify:
+                    self.verify_prior_declaration(ast_node)
 
                 # We add it to symbols_table
                 args = { 
@@ -1735,7 +2092,8 @@ class VisualNovelGenerator():
                     self.symbols_table['show'] = {} # Cannot be None by default or we will have an error
                 
                 # Before adding to symbols_table we check if the tags used used are declared or not. 
-                self.verify_prior_declaration(ast_node)
+                if verify:
+                    self.verify_prior_declaration(ast_node)
 
                 # We add it to symbols_table
                 args = { 
@@ -1750,7 +2108,8 @@ class VisualNovelGenerator():
                     self.symbols_table['hide'] = {} # Cannot be None by default or we will have an error
 
                 # Before adding to symbols_table we check if the tags used used are declared or not. 
-                self.verify_prior_declaration(ast_node)
+                if verify:
+                    self.verify_prior_declaration(ast_node)
 
                 # We add it to symbols_table
                 args = { 
@@ -1773,7 +2132,96 @@ class VisualNovelGenerator():
 
             elif isinstance(ast_node, LabelNode): #Ex: scene eileen happy blushing at center with transition 
                 # We need to go through label body to see if anything requires initialisation
-                self.step4_label_body_initialize(ast_node)
+                if verify or previous_labels_table is None:
+                    self.step4_label_body_initialize(ast_node)
+                else: # Unchanged label: its body was already initialised by the previous compilation
+                    if ast_node.label_name in self.labels_table:
+                        raise DetailedError(f'Runtime error. Cannot use a label name twice: {ast_node.label_name}')
+                    self.labels_table[ast_node.label_name] = previous_labels_table[ast_node.label_name]
+                    if label_names_changed: # The label used by a 'jump' statement may have been removed
+                        for body_node in ast_node:
+                            if isinstance(body_node, JumpNode):
+                                self.verify_prior_declaration(body_node)
+
+    def recompile(self, renpy_file=None):
+        """
+        Description
+        -----------
+        Compiles the Ren'Py script again after it was edited, using an `IncrementalParser`.
+
+        Only the top-level blocks (define, image, label, ...) that changed since the previous call are tokenized and parsed
+        again, and their nodes are spliced inside the existing MasterNode. Then the initialisation phase only verifies:
+        - the modified nodes,
+        - the nodes written after a modified top-level statement that is not a label (the symbols declared before them changed),
+        - the 'jump' statements of the other labels if a label was added, removed or renamed.
+        The first call parses every block.
+
+        Arguments
+        ---------
+        renpy_file : Path to the Ren'Py script (by default, the script given to the constructor).
+
+        Returns
+        -------
+        int: Number of top-level blocks that were tokenized and parsed.
+        """
+        if renpy_file is not None:
+            self.path_to_renpyfile = renpy_file
+        with open(self.path_to_renpyfile, 'r', encoding="utf-8") as file:
+            text = file.read()
+
+        first_compilation = self.incremental_parser is None or not self.labels_table_valid
+        if self.incremental_parser is None:
+            self.incremental_parser = IncrementalParser(self.pool)
+        parser = self.incremental_parser
+        self.ast_tree = parser.parse_renpy_file(text)
+        self.pool = parser.pool # Kept from one compilation to the next (replaced when the parser compacts it)
+
+        previous_labels_table = None if first_compilation else self.labels_table
+        self.symbols_table = SymbolTable(self.pool)
+        self.labels_table = {}
+        try:
+            self.step4_initialize_master_node(
+                unchanged_nodes=None if first_compilation else parser.unchanged_nodes,
+                previous_labels_table=previous_labels_table,
+                label_names_changed=parser.label_names_changed
+            )
+        except DetailedError:
+            # HANDLING: The nodes kept by the parser were not all verified: the next call verifies every node again
+            self.labels_table_valid = False
+            raise
+        self.labels_table_valid = True
+
+        if self.cache is not None:
+            self.cache.source_hash = None # The script was edited since the hash was computed
+            self.cache.save(self.ast_tree, self.symbols_table, self.labels_table)
+        return parser.reparsed_blocks
+
+    def compile_project(self, project, workers=None):
+        """
+        Description
+        -----------
+        Compiles a Ren'Py project split into several scripts, using a `ProjectCompiler` (see Project.py).
+
+        Every script is tokenized and parsed in its own worker process, then the MasterNodes are merged into `self.ast_tree`
+        (the top-level 'define' and 'image' statements of every file first). The initialisation phase then fills one
+        symbols table and one labels table for the whole project, so a script can use the characters, images and labels
+        declared in another one.
+
+        Arguments
+        ---------
+        project : A directory (every '.rpy' file inside it, recursively) or a list of Ren'Py scripts.
+        workers (optional) : Number of worker processes (by default, the number of processors).
+
+        Returns
+        -------
+        None
+        """
+        self.project_compiler = ProjectCompiler(project, workers, self.pool)
+        self.path_to_renpyfile = os.path.join(self.project_compiler.root, '') # The paths of the assets are resolved against the folder of their script (see StateMachine.get_asset_path)
+        self.ast_tree = self.project_compiler.compile()
+        self.symbols_table = SymbolTable(self.pool)
+        self.labels_table = {}
+        self.step4_initialize_master_node()
 
     def step5_runtime(self):
         """
@@ -1785,6 +2233,7 @@ class VisualNovelGenerator():
         - Initializes a `StateMachine` using the current `symbols_table`, `labels_table`, `ast_tree`, and the path to the Ren'Py file.
         - Calls the `generate_VN` method of the `StateMachine` to start the execution of the visual novel.
         - The `generate_VN` method is responsible for processing and rendering the visual novel, including the handling of debug mode if enabled.
+        - In headless mode, `run_headless` is called instead and its results are stored in `self.headless_results`.
 
         Arguments:
         ----------
@@ -1794,5 +2243,9 @@ class VisualNovelGenerator():
         -------
         None
         """
-        sM = StateMachine(self.symbols_table, self.labels_table, self.ast_tree, self.path_to_renpyfile)
+        asset_dirs = self.project_compiler.asset_dirs if self.project_compiler is not None else None
+        sM = StateMachine(self.symbols_table, self.labels_table, self.ast_tree, self.path_to_renpyfile, self.label_index, lazy=self.lazy, instrumentation=self.instrumentation, asset_dirs=asset_dirs)
+        if self.headless:
+            self.headless_results = sM.run_headless()
+            return
         sM.generate_VN(debug=self.debug)
\ No newline at end of file